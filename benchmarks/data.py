@@ -0,0 +1,133 @@
+"""
+Synthetic data for the contribution pipeline benchmarks
+
+make_dataset() builds one submitted Receive Payment Entry with the requested
+number of reference rows, invoices, deductions, Sales Team members and
+existing payment rows per invoice, plus the rows the pipeline reads.
+"""
+
+import copy
+import datetime
+import random
+
+from benchmarks.fake_frappe import FakeDocument, _dict
+
+PAYMENT_ENTRY_NAME = "ACC-PAY-BENCH-00001"
+COMPANY = "Bench Company"
+CUSTOMER = "CUST-BENCH-0001"
+SALES_ORDER = "SO-BENCH-0001"
+POSTING_DATE = datetime.date(2026, 1, 15)
+
+
+class Dataset:
+    """Rows answered by the fake frappe.db"""
+
+    def __init__(self, payment_entry, invoices, invoice_sales_team, parent_sales_team):
+        self.template = payment_entry
+        self.invoices = invoices
+        self.invoice_sales_team = invoice_sales_team
+        self.parent_sales_team = parent_sales_team
+        self.payment_entries = {}
+        self.reset()
+
+    def reset(self):
+        """Restore the Payment Entry so every iteration starts from the same document"""
+        self.payment_entries = {self.template.name: copy.deepcopy(self.template)}
+        return self.payment_entries[self.template.name]
+
+
+def make_sales_team(team_size, rng):
+    """Sales Team members with realistic commission rates"""
+    return [
+        {
+            "sales_person": f"Sales Person {index:03d}",
+            "commission_rate": rng.choice([1, 2.5, 5, 7.5, 10]),
+            "allocated_percentage": round(100 / team_size, 2),
+        }
+        for index in range(team_size)
+    ]
+
+
+def make_dataset(references=1, invoices=1, deductions=0, team_size=1, existing_rows=0,
+                 team_source="invoice", calculated=False, seed=0):
+    """
+    Build a dataset
+
+    Args:
+        references: Payment Entry Reference rows (spread over the invoices)
+        invoices: Distinct Sales Invoices referenced
+        deductions: Payment Entry Deduction rows
+        team_size: Sales Team members per invoice
+        existing_rows: Sales Team rows written by other Payment Entries per invoice
+        team_source: "invoice", "sales_order" or "customer" (where the team is found)
+        calculated: Invoice Sales Team rows already carry this Payment Entry (cancel)
+        seed: Random seed
+
+    Returns:
+        Dataset
+    """
+    rng = random.Random(seed)
+    sales_team = make_sales_team(team_size, rng)
+
+    invoice_rows = {}
+    invoice_sales_team = {}
+    for index in range(invoices):
+        name = f"ACC-SINV-BENCH-{index:05d}"
+        grand_total = round(rng.uniform(1000, 50000), 2)
+        invoice_rows[name] = _dict(
+            name=name, customer=CUSTOMER, customer_name=CUSTOMER, company=COMPANY,
+            currency="SAR", posting_date=POSTING_DATE - datetime.timedelta(days=index),
+            grand_total=grand_total, total_taxes_and_charges=round(grand_total * 0.15 / 1.15, 2),
+            docstatus=1, modified=datetime.datetime(2026, 1, 1),
+            sales_order=SALES_ORDER if team_source == "sales_order" else None,
+        )
+
+        rows = []
+        if team_source == "invoice":
+            rows.extend(
+                _dict(member, name=f"{name}-st-{idx}", parent=name, idx=idx, incentives=0,
+                      custom_payment_entry=PAYMENT_ENTRY_NAME if calculated else None,
+                      custom_date=POSTING_DATE if calculated else None)
+                for idx, member in enumerate(sales_team, 1)
+            )
+        for offset in range(existing_rows):
+            member = sales_team[offset % team_size]
+            idx = len(rows) + 1
+            rows.append(_dict(
+                member, name=f"{name}-old-{offset}", parent=name, idx=idx,
+                incentives=round(rng.uniform(1, 500), 2),
+                custom_payment_entry=f"ACC-PAY-OLD-{offset // team_size:05d}",
+                custom_date=POSTING_DATE - datetime.timedelta(days=30),
+            ))
+        invoice_sales_team[name] = rows
+
+    parent_sales_team = {}
+    if team_source == "sales_order":
+        parent_sales_team[("Sales Order", SALES_ORDER)] = [_dict(member) for member in sales_team]
+    elif team_source == "customer":
+        parent_sales_team[("Customer", CUSTOMER)] = [_dict(member) for member in sales_team]
+
+    invoice_names = list(invoice_rows)
+    reference_rows = []
+    for index in range(references):
+        invoice_name = invoice_names[index % invoices]
+        reference_rows.append(_dict(
+            name=f"ref-{index:05d}", idx=index + 1, reference_doctype="Sales Invoice",
+            reference_name=invoice_name,
+            allocated_amount=round(invoice_rows[invoice_name].grand_total / max(references // invoices, 1), 2),
+        ))
+
+    total_allocated = round(sum(row.allocated_amount for row in reference_rows), 2)
+    payment_entry = FakeDocument(
+        doctype="Payment Entry", name=PAYMENT_ENTRY_NAME, docstatus=1, payment_type="Receive",
+        party_type="Customer", party=CUSTOMER, company=COMPANY, posting_date=POSTING_DATE,
+        paid_amount=total_allocated, total_allocated_amount=total_allocated, amended_from=None,
+        custom_net_contribution_fingerprint=None,
+        references=reference_rows,
+        deductions=[
+            _dict(name=f"ded-{index:05d}", account="Bank Charges", amount=round(rng.uniform(1, 50), 2))
+            for index in range(deductions)
+        ],
+    )
+
+    return Dataset(payment_entry, invoice_rows, invoice_sales_team, parent_sales_team)
@@ -0,0 +1,398 @@
+"""
+In-memory stand-in for the frappe APIs used by the contribution pipeline
+
+Only what payment_entry.py, contribution_ledger.py, report_cache.py and
+sales_team_cache.py call is provided. Reads are answered from a synthetic
+dataset (see data.py); writes are counted but not applied, so every
+iteration of a scenario starts from the same state.
+
+install() registers the modules in sys.modules; it must run before the app
+modules are imported.
+"""
+
+import datetime
+import logging
+import sys
+import traceback
+import types
+import uuid
+
+
+class _dict(dict):
+    """frappe._dict: dict with attribute access"""
+
+    def __getattr__(self, key):
+        return self.get(key)
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+    def copy(self):
+        return _dict(self)
+
+
+class ValidationError(Exception):
+    pass
+
+
+class PermissionError(Exception):
+    pass
+
+
+class Counters:
+    """Calls counted per scenario run"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.sql = 0
+        self.sql_writes = 0
+        self.get_doc = 0
+        self.cache = 0
+
+
+counters = Counters()
+
+
+class FakeDocument(_dict):
+    """Minimal Document: attribute access, child tables as lists of _dict"""
+
+    def is_new(self):
+        return not self.get("name")
+
+    def set(self, fieldname, value):
+        self[fieldname] = value
+
+    def db_set(self, fieldname, value, update_modified=True):
+        counters.sql += 1
+        counters.sql_writes += 1
+        self[fieldname] = value
+
+
+class CallbackManager(list):
+    """frappe.db.after_commit / after_rollback: callbacks run on commit / rollback"""
+
+    def add(self, callback):
+        self.append(callback)
+
+    def reset(self):
+        self.clear()
+
+    def run(self):
+        while self:
+            self.pop(0)()
+
+
+# ============================================================================
+# DATABASE
+# ============================================================================
+
+class FakeDatabase:
+    """
+    frappe.db stand-in answering the pipeline's SELECTs from a dataset
+
+    SELECTs are routed by the table they read; any other statement is a
+    counted no-op.
+    """
+
+    def __init__(self):
+        self.dataset = None
+        self.after_commit = CallbackManager()
+        self.after_rollback = CallbackManager()
+
+    def sql(self, query, values=(), as_dict=False, **kwargs):
+        counters.sql += 1
+        statement = " ".join(query.split())
+
+        if not statement.upper().startswith("SELECT"):
+            counters.sql_writes += 1
+            return ()
+
+        if "FROM `tabSales Invoice` si" in statement:
+            return self.select_invoices(values["invoices"])
+        if "FROM `tabSales Team`" in statement and "parent IN" in statement:
+            return self.select_invoice_sales_team(values["invoices"])
+        if "FROM `tabSales Team`" in statement and "custom_payment_entry =" in statement:
+            return self.count_payment_sales_team(values["payment_entry"])
+        if "FROM `tabSales Team`" in statement:
+            return [_dict(row) for row in self.dataset.parent_sales_team.get(
+                (values["parenttype"], values["parent"]), [])]
+
+        # Contribution ledger and anything else: no stored rows
+        return []
+
+    def select_invoices(self, invoice_names):
+        return [
+            _dict(self.dataset.invoices[name])
+            for name in invoice_names if name in self.dataset.invoices
+        ]
+
+    def select_invoice_sales_team(self, invoice_names):
+        return [
+            _dict(row)
+            for name in invoice_names
+            for row in self.dataset.invoice_sales_team.get(name, [])
+        ]
+
+    def count_payment_sales_team(self, payment_entry_name):
+        counts = {}
+        for name, rows in self.dataset.invoice_sales_team.items():
+            for row in rows:
+                if row.custom_payment_entry == payment_entry_name:
+                    counts[name] = counts.get(name, 0) + 1
+        return tuple(counts.items())
+
+    def bulk_insert(self, doctype, fields, values, **kwargs):
+        counters.sql += 1
+        counters.sql_writes += 1
+
+    def exists(self, doctype, name=None):
+        counters.sql += 1
+        return name if doctype == "Payment Entry" and name in self.dataset.payment_entries else None
+
+    def get_value(self, doctype, filters=None, fieldname="name", **kwargs):
+        counters.sql += 1
+        return None
+
+    def delete(self, doctype, filters=None):
+        counters.sql += 1
+        counters.sql_writes += 1
+
+    def savepoint(self, save_point):
+        counters.sql += 1
+
+    def release_savepoint(self, save_point):
+        counters.sql += 1
+
+    def rollback(self, save_point=None):
+        counters.sql += 1
+        if not save_point:
+            # Like frappe: pending after-commit callbacks are dropped
+            self.after_commit.reset()
+            self.after_rollback.run()
+
+    def commit(self):
+        counters.sql += 1
+        self.after_rollback.reset()
+        self.after_commit.run()
+
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+class FakeRedis:
+    """frappe.cache stand-in (one process, no expiry)"""
+
+    def __init__(self):
+        self.data = {}
+
+    def make_key(self, key, user=None, shared=False):
+        return f"bench|{key}"
+
+    def get(self, key):
+        counters.cache += 1
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        counters.cache += 1
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def eval(self, script, numkeys, key, value):
+        """Only the compare-and-delete script is supported"""
+        counters.cache += 1
+        if self.data.get(key) != value:
+            return 0
+        del self.data[key]
+        return 1
+
+    def incr(self, key):
+        return self.incrby(key, 1)
+
+    def incrby(self, key, amount):
+        counters.cache += 1
+        self.data[key] = int(self.data.get(key) or 0) + amount
+        return self.data[key]
+
+    def delete(self, key):
+        counters.cache += 1
+        self.data.pop(key, None)
+
+    def get_value(self, key, *args, **kwargs):
+        return self.get(self.make_key(key))
+
+    def set_value(self, key, value, *args, **kwargs):
+        self.set(self.make_key(key), value)
+
+    def delete_value(self, keys, *args, **kwargs):
+        for key in keys if isinstance(keys, (list, tuple)) else [keys]:
+            self.delete(self.make_key(key))
+
+    def delete_keys(self, prefix):
+        counters.cache += 1
+        prefix = self.make_key(prefix)
+        for key in [key for key in self.data if key.startswith(prefix)]:
+            del self.data[key]
+
+    def hget(self, name, key, *args, **kwargs):
+        counters.cache += 1
+        return self.data.get(self.make_key(name), {}).get(key)
+
+    def hset(self, name, key, value, *args, **kwargs):
+        counters.cache += 1
+        self.data.setdefault(self.make_key(name), {})[key] = value
+
+    def hdel(self, name, key, *args, **kwargs):
+        counters.cache += 1
+        self.data.get(self.make_key(name), {}).pop(key, None)
+
+    def hgetall(self, name):
+        counters.cache += 1
+        return {key.encode(): value for key, value in self.data.get(self.make_key(name), {}).items()}
+
+
+# ============================================================================
+# FRAPPE.UTILS
+# ============================================================================
+
+def flt(value, precision=None):
+    try:
+        number = float(value or 0)
+    except (TypeError, ValueError):
+        number = 0.0
+    return round(number, precision) if precision is not None else number
+
+
+def cint(value):
+    try:
+        return int(float(value or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def getdate(value=None):
+    if not value:
+        return datetime.date.today()
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+def add_days(date, days):
+    return getdate(date) + datetime.timedelta(days=days)
+
+
+def get_first_day(date):
+    return getdate(date).replace(day=1)
+
+
+def now_datetime():
+    return datetime.datetime.now()
+
+
+def today():
+    return str(datetime.date.today())
+
+
+# ============================================================================
+# INSTALL
+# ============================================================================
+
+def get_doc(doctype, name=None):
+    counters.get_doc += 1
+    counters.sql += 1
+    if doctype == "Payment Entry" and name in frappe.db.dataset.payment_entries:
+        return frappe.db.dataset.payment_entries[name]
+    raise ValidationError(f"{doctype} {name} not found")
+
+
+def throw(message, exc=ValidationError, *args, **kwargs):
+    raise exc(message)
+
+
+def log_error(*args, **kwargs):
+    frappe.local.error_log.append(args)
+
+
+def whitelist(*args, **kwargs):
+    if args and callable(args[0]):
+        return args[0]
+    return lambda function: function
+
+
+frappe = types.ModuleType("frappe")
+
+
+def install():
+    """
+    Register the stand-in as the frappe package (idempotent)
+
+    Returns:
+        module: The fake frappe module
+    """
+    if sys.modules.get("frappe") is frappe:
+        return frappe
+
+    frappe.__path__ = []
+    frappe._dict = _dict
+    frappe._ = lambda message, *args, **kwargs: message
+    frappe.ValidationError = ValidationError
+    frappe.PermissionError = PermissionError
+    frappe.DoesNotExistError = ValidationError
+    frappe.whitelist = whitelist
+    frappe.throw = throw
+    frappe.log_error = log_error
+    frappe.get_traceback = lambda *args, **kwargs: traceback.format_exc()
+    frappe.msgprint = lambda *args, **kwargs: None
+    frappe.clear_messages = lambda: None
+    frappe.clear_document_cache = lambda *args, **kwargs: None
+    frappe.render_template = lambda template, context=None, **kwargs: ""
+    frappe.format_value = lambda value, df=None, doc=None, *args, **kwargs: f"{flt(value):,.2f}"
+    frappe.publish_progress = lambda *args, **kwargs: None
+    frappe.publish_realtime = lambda *args, **kwargs: None
+    frappe.enqueue = lambda *args, **kwargs: None
+    frappe.only_for = lambda *args, **kwargs: None
+    frappe.has_permission = lambda *args, **kwargs: True
+    frappe.get_roles = lambda *args, **kwargs: ["System Manager"]
+    frappe.logger = lambda *args, **kwargs: logging.getLogger("benchmarks")
+    frappe.safe_decode = lambda value, *args, **kwargs: (
+        value.decode() if isinstance(value, bytes) else value)
+    frappe.generate_hash = lambda *args, length=10, **kwargs: uuid.uuid4().hex[:length]
+    frappe.get_doc = get_doc
+    frappe.db = FakeDatabase()
+    frappe.cache = FakeRedis()
+    frappe.conf = _dict()
+    frappe.session = _dict(user="Administrator")
+    frappe.local = _dict(site="bench.local", error_log=[])
+    frappe.flags = _dict()
+
+    utils = types.ModuleType("frappe.utils")
+    utils.__path__ = []
+    for function in (flt, cint, getdate, add_days, get_first_day, now_datetime, today):
+        setattr(utils, function.__name__, function)
+    frappe.utils = utils
+
+    background_jobs = types.ModuleType("frappe.utils.background_jobs")
+    background_jobs.get_queues_timeout = lambda: {"short": 300, "default": 300, "long": 1500}
+    background_jobs.get_job = lambda job_id: None
+    utils.background_jobs = background_jobs
+
+    sys.modules["frappe"] = frappe
+    sys.modules["frappe.utils"] = utils
+    sys.modules["frappe.utils.background_jobs"] = background_jobs
+
+    return frappe
+
+
+def reset_request():
+    """Start a new "request": clear flags, pending callbacks and the error log"""
+    frappe.flags = _dict()
+    frappe.local.error_log = []
+    frappe.db.after_commit.clear()
+    frappe.db.after_rollback.clear()
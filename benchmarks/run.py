@@ -0,0 +1,288 @@
+"""
+Contribution pipeline benchmarks
+
+Runs calculate_net_contribution (and the submit hooks) against synthetic
+data with an in-memory frappe stand-in, so scaling with reference rows,
+deductions, Sales Team size and existing payment rows can be measured
+without MariaDB or Redis.
+
+Usage (from the repository root):
+    python -m benchmarks.run                   # print results
+    python -m benchmarks.run --save            # store benchmarks/baselines.json
+    python -m benchmarks.run --compare         # exit 1 on regression
+    python -m benchmarks.run --compare --latency   # also compare latency
+    python -m benchmarks.run --filter team     # scenarios containing "team"
+
+A scenario regresses when it issues more queries, writes or get_doc calls
+than the baseline. Latency depends on the machine, so it is only compared
+with --latency: the median may then exceed the baseline by --tolerance.
+
+Structure:
+1. Scenarios
+2. Measurement Functions
+3. Baseline Functions
+4. Command Line
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from benchmarks import fake_frappe
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_PATH not in sys.path:
+    sys.path.insert(0, REPO_PATH)
+
+frappe = fake_frappe.install()
+
+from benchmarks.data import make_dataset  # noqa: E402
+from sales_person_net_contribution.sales_person_net_contribution import (  # noqa: E402
+    payment_entry,
+    pipeline_profiler,
+    sales_team_cache,
+)
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+
+# Fields compared against the baseline as upper bounds
+COUNT_FIELDS = ("queries", "writes", "get_doc")
+
+
+# ============================================================================
+# SECTION 1: SCENARIOS
+# ============================================================================
+
+def run_calculate(dataset):
+    """Whitelisted API path: load by name, calculate, write, render the message"""
+    dataset.reset()
+    payment_entry.calculate_net_contribution(dataset.template.name)
+
+
+def run_submit_hooks(dataset):
+    """Submit path: validate then on_submit on the live document"""
+    doc = dataset.reset()
+    payment_entry.on_validate(doc)
+    payment_entry.on_submit(doc)
+
+
+def run_cancel_hook(dataset):
+    """Cancel path: on_cancel on the live document"""
+    doc = dataset.reset()
+    doc.docstatus = 2
+    payment_entry.on_cancel(doc)
+
+
+def run_calculate_profiled(dataset):
+    """Whitelisted API path with the per-stage profiler switched on"""
+    frappe.conf[pipeline_profiler.PROFILE_CONFIG_KEY] = 1
+    try:
+        run_calculate(dataset)
+    finally:
+        frappe.conf.pop(pipeline_profiler.PROFILE_CONFIG_KEY)
+
+
+# name: (dataset options, runner)
+SCENARIOS = {
+    "baseline": ({}, run_calculate),
+    "baseline_profiled": ({}, run_calculate_profiled),
+    "deductions_10": ({"deductions": 10}, run_calculate),
+    "deductions_50": ({"deductions": 50}, run_calculate),
+    "team_5": ({"team_size": 5}, run_calculate),
+    "team_20": ({"team_size": 20}, run_calculate),
+    "existing_rows_50": ({"team_size": 5, "existing_rows": 50}, run_calculate),
+    "existing_rows_500": ({"team_size": 5, "existing_rows": 500}, run_calculate),
+    "references_10": ({"references": 10}, run_calculate),
+    "references_50": ({"references": 50}, run_calculate),
+    "invoices_5": ({"references": 5, "invoices": 5, "team_size": 3}, run_calculate),
+    "invoices_20": ({"references": 20, "invoices": 20, "team_size": 3}, run_calculate),
+    "sales_order_team": ({"team_size": 5, "team_source": "sales_order"}, run_calculate),
+    "submit_hooks": ({"team_size": 5, "deductions": 5}, run_submit_hooks),
+    "cancel_invoices_20": ({"references": 20, "invoices": 20, "team_size": 3, "calculated": True},
+                           run_cancel_hook),
+}
+
+
+# ============================================================================
+# SECTION 2: MEASUREMENT FUNCTIONS
+# ============================================================================
+
+def reset_state(dataset):
+    """Give a scenario empty caches and the dataset to answer from"""
+    frappe.db.dataset = dataset
+    frappe.cache.data.clear()
+    sales_team_cache._site_caches.clear()
+
+
+def run_once(runner, dataset):
+    """
+    Run a scenario once in a fresh "request"
+
+    Returns:
+        str | None: Error message (raised or logged), None on success
+    """
+    fake_frappe.reset_request()
+    try:
+        runner(dataset)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+    frappe.db.commit()
+    if frappe.local.error_log:
+        return str(frappe.local.error_log[0][-1])
+    return None
+
+
+def measure(name, iterations):
+    """
+    Measure one scenario
+
+    The first run counts calls and allocations (under tracemalloc); the
+    timed runs follow without tracing.
+
+    Args:
+        name: Scenario name
+        iterations: Timed runs
+
+    Returns:
+        dict: {"median_ms", "p95_ms", "queries", "writes", "get_doc",
+               "cache_calls", "peak_kb", "error"}
+    """
+    options, runner = SCENARIOS[name]
+    dataset = make_dataset(**options)
+    reset_state(dataset)
+
+    fake_frappe.counters.reset()
+    tracemalloc.start()
+    error = run_once(runner, dataset)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    counts = vars(fake_frappe.counters).copy()
+
+    timings = []
+    for _ in range(iterations):
+        reset_state(dataset)
+        start = time.perf_counter()
+        run_once(runner, dataset)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        "queries": counts["sql"],
+        "writes": counts["sql_writes"],
+        "get_doc": counts["get_doc"],
+        "cache_calls": counts["cache"],
+        "peak_kb": round(peak / 1024, 1),
+        "error": error,
+    }
+
+
+# ============================================================================
+# SECTION 3: BASELINE FUNCTIONS
+# ============================================================================
+
+def load_baselines():
+    if not os.path.exists(BASELINES_PATH):
+        return {}
+    with open(BASELINES_PATH) as f:
+        return json.load(f)
+
+
+def save_baselines(results):
+    baselines = load_baselines()
+    baselines.update(results)
+    with open(BASELINES_PATH, "w") as f:
+        json.dump(dict(sorted(baselines.items())), f, indent=1, sort_keys=True)
+        f.write("\n")
+
+
+def find_regressions(name, result, baseline, tolerance=None):
+    """
+    Compare a result with its baseline
+
+    Args:
+        name: Scenario name
+        result: See measure
+        baseline: Stored result of the scenario
+        tolerance: Allowed median latency increase; None skips the latency check
+
+    Returns:
+        list: Regression descriptions (empty when within the baseline)
+    """
+    regressions = []
+    if result["error"] and not baseline.get("error"):
+        regressions.append(f"fails: {result['error']}")
+
+    for field in COUNT_FIELDS:
+        if result[field] > baseline.get(field, result[field]):
+            regressions.append(f"{field} {baseline[field]} -> {result[field]}")
+
+    limit = baseline.get("median_ms", 0) * (1 + tolerance) if tolerance is not None else 0
+    if limit and result["median_ms"] > limit:
+        regressions.append(f"median {baseline['median_ms']}ms -> {result['median_ms']}ms")
+
+    return [f"{name}: {regression}" for regression in regressions]
+
+
+# ============================================================================
+# SECTION 4: COMMAND LINE
+# ============================================================================
+
+def print_results(results):
+    header = f"{'scenario':<20}{'median ms':>11}{'p95 ms':>9}{'queries':>9}{'writes':>8}" \
+             f"{'get_doc':>9}{'cache':>7}{'peak KB':>9}  error"
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        print(f"{name:<20}{result['median_ms']:>11.3f}{result['p95_ms']:>9.3f}"
+              f"{result['queries']:>9}{result['writes']:>8}{result['get_doc']:>9}"
+              f"{result['cache_calls']:>7}{result['peak_kb']:>9.1f}  {result['error'] or ''}")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=50, help="timed runs per scenario")
+    parser.add_argument("--filter", default="", help="only scenarios containing this text")
+    parser.add_argument("--save", action="store_true", help="store results as baselines")
+    parser.add_argument("--compare", action="store_true", help="exit 1 on regression")
+    parser.add_argument("--latency", action="store_true",
+                        help="with --compare, also fail on median latency")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed median latency increase with --latency (0.5 = +50%%)")
+    args = parser.parse_args(args)
+
+    results = {
+        name: measure(name, args.iterations)
+        for name in SCENARIOS if args.filter in name
+    }
+    print_results(results)
+
+    if args.save:
+        save_baselines(results)
+        print(f"\nSaved {len(results)} baseline(s) to {BASELINES_PATH}")
+
+    if args.compare:
+        baselines = load_baselines()
+        regressions = [
+            regression
+            for name, result in results.items() if name in baselines
+            for regression in find_regressions(
+                name, result, baselines[name], args.tolerance if args.latency else None)
+        ]
+        if regressions:
+            print("\nRegressions:")
+            print("\n".join(f"  {regression}" for regression in regressions))
+            return 1
+        print("\nNo regressions")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
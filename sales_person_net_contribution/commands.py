@@ -0,0 +1,288 @@
+"""
+Bench Commands
+Parallel recalculation of historical Payment Entries from the command line
+
+    bench --site <site> recalculate-net-contribution \
+        --company "My Company" --from-date 2023-01-01 --to-date 2025-12-31 --workers 4
+
+Payment Entries are split into shards that never share a Sales Invoice or
+Sales Order (batch_calculation.get_invoice_shards) and handed to a pool of worker
+processes, each with its own database connection. Every finished shard is
+committed by its worker and recorded in a checkpoint file in the site
+folder; running the same command again resumes with the remaining shards
+(--restart ignores the checkpoint). Document caches are cleared between
+shards so memory stays bounded over long runs. A complete --ledger-only run
+(no company or date filter) also ends a pending ledger backfill.
+
+Structure:
+1. Checkpoint Functions
+2. Worker Functions
+3. Commands
+"""
+
+import gc
+import hashlib
+import json
+import multiprocessing
+import os
+from functools import partial
+
+import click
+import frappe
+from frappe.commands import get_site, pass_context
+
+# Checkpoint file in the site folder
+CHECKPOINT_FILE = "sales_person_net_contribution_recalculation.json"
+
+# Payment Entries per shard (one commit per shard)
+DEFAULT_SHARD_SIZE = 1000
+
+# Totals of recalculate_incentives_batch that are not summed across shards
+NON_SUMMED_TOTALS = ("dry_run", "vectorized")
+
+
+# ============================================================================
+# SECTION 1: CHECKPOINT FUNCTIONS
+# ============================================================================
+
+def get_checkpoint_key(company, from_date, to_date, ledger_only):
+    """
+    Identify a run by its options, so a checkpoint is only resumed by the same run
+
+    Returns:
+        str: SHA1 hex digest
+    """
+    options = {"company": company, "from_date": from_date, "to_date": to_date,
+               "ledger_only": bool(ledger_only)}
+    return hashlib.sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()
+
+
+def load_checkpoint(path, key):
+    """
+    Load the Payment Entries finished by an interrupted run
+
+    Args:
+        path: Checkpoint file path
+        key: See get_checkpoint_key
+
+    Returns:
+        set: Finished Payment Entry names (empty for another run or no file)
+    """
+    if not os.path.exists(path):
+        return set()
+
+    with open(path) as f:
+        checkpoint = json.load(f)
+
+    if checkpoint.get("key") != key:
+        return set()
+    return set(checkpoint.get("done") or [])
+
+
+def save_checkpoint(path, key, done):
+    """
+    Write the checkpoint atomically (a crash never leaves a half-written file)
+
+    Args:
+        path: Checkpoint file path
+        key: See get_checkpoint_key
+        done: Finished Payment Entry names
+    """
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump({"key": key, "done": sorted(done)}, f)
+    os.replace(temp_path, path)
+
+
+# ============================================================================
+# SECTION 2: WORKER FUNCTIONS
+# ============================================================================
+
+def init_worker(site, sites_path):
+    """
+    Pool initializer: connect the worker process to the site
+
+    Args:
+        site: Site name
+        sites_path: Bench sites path
+    """
+    frappe.init(site=site, sites_path=sites_path)
+    frappe.connect()
+
+
+def clear_worker_caches():
+    """
+    Drop per-process document caches between shards
+    """
+    document_cache = getattr(frappe.local, "document_cache", None)
+    if document_cache:
+        document_cache.clear()
+    gc.collect()
+
+
+def recalculate_shard(shard, dry_run=False, ledger_only=False):
+    """
+    Recalculate one shard in the current process (one commit)
+
+    Args:
+        shard: List of Payment Entry names
+        dry_run: Calculate only, do not write
+        ledger_only: Only (back)fill the contribution ledger
+
+    Returns:
+        tuple: (shard, totals or None, error or None)
+    """
+    from sales_person_net_contribution.sales_person_net_contribution.batch_calculation import (
+        recalculate_incentives_batch,
+    )
+
+    try:
+        totals = recalculate_incentives_batch(
+            payment_entry_names=shard, dry_run=dry_run, ledger_only=ledger_only,
+            chunk_size=max(len(shard), 1)
+        )
+        return shard, totals, None
+    except Exception:
+        frappe.db.rollback()
+        return shard, None, frappe.get_traceback()
+    finally:
+        clear_worker_caches()
+
+
+def add_totals(totals, shard_totals):
+    """
+    Sum the totals of a finished shard into the run totals
+    """
+    for key, value in shard_totals.items():
+        if key in NON_SUMMED_TOTALS:
+            totals[key] = value
+        else:
+            totals[key] = totals.get(key, 0) + value
+
+
+def mark_backfill_done(site, sites_path):
+    """
+    Clear the pending ledger backfill notice of the sales_commission report
+
+    Args:
+        site: Site name
+        sites_path: Bench sites path
+    """
+    from sales_person_net_contribution.sales_person_net_contribution.contribution_ledger import (
+        set_backfill_pending,
+    )
+
+    init_worker(site, sites_path)
+    try:
+        set_backfill_pending(False)
+        frappe.db.commit()
+    finally:
+        frappe.destroy()
+
+
+# ============================================================================
+# SECTION 3: COMMANDS
+# ============================================================================
+
+@click.command("recalculate-net-contribution")
+@click.option("--company", help="Only Payment Entries of this company")
+@click.option("--from-date", help="Start posting date (YYYY-MM-DD)")
+@click.option("--to-date", help="End posting date (YYYY-MM-DD)")
+@click.option("--dry-run", is_flag=True, default=False, help="Calculate without writing")
+@click.option("--ledger-only", is_flag=True, default=False,
+              help="Only (back)fill the contribution ledger")
+@click.option("--workers", type=int, default=min(4, os.cpu_count() or 1), show_default=True,
+              help="Worker processes")
+@click.option("--shard-size", type=int, default=DEFAULT_SHARD_SIZE, show_default=True,
+              help="Payment Entries per shard (one commit each)")
+@click.option("--restart", is_flag=True, default=False, help="Ignore the checkpoint of an earlier run")
+@pass_context
+def recalculate_net_contribution(context, company=None, from_date=None, to_date=None,
+                                 dry_run=False, ledger_only=False, workers=1,
+                                 shard_size=DEFAULT_SHARD_SIZE, restart=False):
+    "Recalculate net contribution of submitted Payment Entries in parallel"
+    from sales_person_net_contribution.sales_person_net_contribution.batch_calculation import (
+        get_invoice_shards,
+        get_payment_entries_for_batch,
+    )
+
+    site = get_site(context)
+    frappe.init(site=site)
+    frappe.connect()
+    try:
+        sites_path = os.path.abspath(frappe.local.sites_path)
+        checkpoint_path = os.path.abspath(frappe.get_site_path(CHECKPOINT_FILE))
+        checkpoint_key = get_checkpoint_key(company, from_date, to_date, ledger_only)
+
+        done = set() if restart or dry_run else load_checkpoint(checkpoint_path, checkpoint_key)
+        payment_entry_names = [
+            name for name in get_payment_entries_for_batch(company, from_date, to_date)
+            if name not in done
+        ]
+        shards = get_invoice_shards(payment_entry_names, shard_size)
+    finally:
+        frappe.destroy()
+
+    if done:
+        click.echo(f"Resuming: {len(done)} Payment Entries already done")
+    click.echo(f"{len(payment_entry_names)} Payment Entries in {len(shards)} shard(s), "
+               f"{workers} worker(s){' (dry run)' if dry_run else ''}")
+
+    if not shards:
+        return
+
+    run_shard = partial(recalculate_shard, dry_run=dry_run, ledger_only=ledger_only)
+    totals = {}
+    failed = 0
+
+    if workers > 1:
+        # spawn: workers must not inherit the parent's database / Redis sockets
+        pool = multiprocessing.get_context("spawn").Pool(
+            processes=min(workers, len(shards)),
+            initializer=init_worker, initargs=(site, sites_path))
+        results = pool.imap_unordered(run_shard, shards)
+    else:
+        pool = None
+        init_worker(site, sites_path)
+        results = map(run_shard, shards)
+
+    try:
+        for finished, (shard, shard_totals, error) in enumerate(results, 1):
+            if error:
+                failed += 1
+                click.secho(f"Shard starting at {shard[0]} failed:\n{error}", fg="red")
+                continue
+
+            add_totals(totals, shard_totals)
+            if not dry_run:
+                done.update(shard)
+                save_checkpoint(checkpoint_path, checkpoint_key, done)
+            click.echo(f"[{finished}/{len(shards)}] {len(shard)} Payment Entries, "
+                       f"{shard_totals['invoices_written']} invoice(s) written")
+    except BaseException:
+        # Interrupted: finished shards are checkpointed, stop the others now
+        if pool:
+            pool.terminate()
+        raise
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        else:
+            frappe.destroy()
+
+    click.echo(json.dumps(totals, indent=1, sort_keys=True))
+
+    if failed:
+        click.secho(f"{failed} shard(s) failed; run the command again to resume", fg="red")
+        raise SystemExit(1)
+
+    if not dry_run and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    if ledger_only and not dry_run and not (company or from_date or to_date):
+        # A complete ledger run also finishes a failed or pending backfill job
+        mark_backfill_done(site, sites_path)
+
+
+commands = [recalculate_net_contribution]
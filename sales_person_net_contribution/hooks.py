@@ -151,9 +151,33 @@ doc_events = {
         "validate": "sales_person_net_contribution.sales_person_net_contribution.payment_entry.on_validate",
         "on_submit": "sales_person_net_contribution.sales_person_net_contribution.payment_entry.on_submit",
         "on_cancel": "sales_person_net_contribution.sales_person_net_contribution.payment_entry.on_cancel",
-    }
+        "on_trash": [
+            "sales_person_net_contribution.sales_person_net_contribution.contribution_ledger.on_payment_entry_trash",
+            "sales_person_net_contribution.sales_person_net_contribution.advance_contribution.on_payment_entry_trash",
+        ],
+    },
+    "Sales Order": {
+        "on_update": "sales_person_net_contribution.sales_person_net_contribution.sales_team_cache.on_sales_team_parent_update",
+        "on_update_after_submit": "sales_person_net_contribution.sales_person_net_contribution.sales_team_cache.on_sales_team_parent_update",
+        "on_trash": "sales_person_net_contribution.sales_person_net_contribution.sales_team_cache.on_sales_team_parent_update",
+    },
+    "Sales Invoice": {
+        "on_submit": "sales_person_net_contribution.sales_person_net_contribution.payment_entry.on_sales_invoice_submit",
+        "on_cancel": "sales_person_net_contribution.sales_person_net_contribution.payment_entry.on_sales_invoice_cancel",
+        "on_update_after_submit": "sales_person_net_contribution.sales_person_net_contribution.report_cache.on_sales_invoice_update_after_submit",
+    },
+    "Customer": {
+        "on_update": "sales_person_net_contribution.sales_person_net_contribution.sales_team_cache.on_sales_team_parent_update",
+        "on_trash": "sales_person_net_contribution.sales_person_net_contribution.sales_team_cache.on_sales_team_parent_update",
+    },
 }
 
+# Clear the Sales Team resolution cache and cached report results on bench clear-cache
+clear_cache = [
+    "sales_person_net_contribution.sales_person_net_contribution.sales_team_cache.clear_sales_team_cache",
+    "sales_person_net_contribution.sales_person_net_contribution.report_cache.clear_report_cache",
+]
+
 # Scheduled Tasks
 # ---------------
 
@@ -202,6 +226,7 @@ doc_events = {
 # -----------------------------------------------------------
 
 # ignore_links_on_delete = ["Communication", "ToDo"]
+ignore_links_on_delete = ["Sales Person Contribution Ledger", "Sales Order Advance Contribution"]
 
 # Request Events
 # ----------------
@@ -0,0 +1,8 @@
+from sales_person_net_contribution.sales_person_net_contribution.contribution_indexes import (
+    add_contribution_indexes,
+)
+
+
+def execute():
+    """Composite indexes on Sales Team, Payment Entry Reference and Sales Invoice"""
+    add_contribution_indexes()
@@ -0,0 +1,18 @@
+import frappe
+
+from sales_person_net_contribution.sales_person_net_contribution.contribution_ledger import (
+    set_backfill_pending,
+)
+
+
+def execute():
+    """Fill the Sales Person Contribution Ledger from already submitted Payment Entries"""
+    # Cleared by the job; the sales_commission report shows a notice until then
+    set_backfill_pending(True)
+
+    frappe.enqueue(
+        "sales_person_net_contribution.sales_person_net_contribution.batch_calculation.backfill_contribution_ledger",
+        queue="long",
+        timeout=6 * 60 * 60,
+        enqueue_after_commit=True
+    )
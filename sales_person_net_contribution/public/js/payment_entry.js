@@ -248,7 +248,7 @@ function calculate_net_contribution(frm) {
 				} else {
 					frappe.msgprint({
 						title: __('Error'),
-						message: r.message.message || __('An error occurred'),
+						message: r.message.message || r.message.error || __('An error occurred'),
 						indicator: 'red',
 					});
 				}
@@ -0,0 +1,399 @@
+"""
+Sales Order Advance Contribution
+Pending contributions of Payment Entries allocated to Sales Orders (advances)
+
+An advance has no Sales Invoice yet, so no incentive can be calculated when
+the Payment Entry is submitted. Each Sales Order reference is recorded as a
+pending row (allocated amount and deduction share). When Sales Invoices of
+the order are submitted, payment_entry.attribute_advance_contributions moves
+the pending amount to them: Sales Team rows and ledger rows are written as
+for a Sales Invoice reference, and the row becomes Attributed to the
+invoice. A partly used row is split: the used part becomes an Attributed
+row and the rest stays Pending for later invoices, so each Attributed row
+records exactly what one invoice took. When that invoice is cancelled its
+Attributed rows go back to Pending.
+
+Structure:
+1. Recording Functions
+2. Attribution Lookup Functions
+3. Hook Functions
+"""
+
+import frappe
+from frappe.utils import flt, getdate, now_datetime
+
+ADVANCE_DOCTYPE = "Sales Order Advance Contribution"
+
+# Data fields of a pending row (in insert order)
+ADVANCE_FIELDS = (
+    "payment_entry", "sales_order", "posting_date", "company", "customer",
+    "allocated_amount", "deduction",
+)
+
+
+# ============================================================================
+# SECTION 1: RECORDING FUNCTIONS
+# ============================================================================
+
+def get_advance_entries(payment_entry_names):
+    """
+    Load the not cancelled advance rows of Payment Entries in one query
+
+    Args:
+        payment_entry_names: Iterable of Payment Entry names
+
+    Returns:
+        dict: {payment_entry_name: [rows with name, status, attributed_amount
+               and ADVANCE_FIELDS]}
+    """
+    payment_entry_names = tuple(dict.fromkeys(payment_entry_names))
+    if not payment_entry_names:
+        return {}
+
+    rows = frappe.db.sql("""
+        SELECT name, status, attributed_amount, {fields}
+        FROM `tab{doctype}`
+        WHERE payment_entry IN %(payment_entries)s AND status != 'Cancelled'
+    """.format(fields=", ".join(ADVANCE_FIELDS), doctype=ADVANCE_DOCTYPE),
+        {"payment_entries": payment_entry_names}, as_dict=True)
+
+    advance_entries = {name: [] for name in payment_entry_names}
+    for row in rows:
+        advance_entries[row.payment_entry].append(row)
+
+    return advance_entries
+
+
+def sync_advance_entries(payment_entry, sales_order_references, order_deductions):
+    """
+    Make the pending advance rows of a submitted Payment Entry match its Sales Order references
+
+    Args:
+        payment_entry: Payment Entry document (submitted)
+        sales_order_references: dict {sales_order: allocated_amount}
+        order_deductions: dict {sales_order: deduction_amount}
+
+    Returns:
+        bool: True if rows were written
+    """
+    return bool(sync_advance_entries_bulk(
+        [(payment_entry, sales_order_references, order_deductions)]))
+
+
+def sync_advance_entries_bulk(entries):
+    """
+    Make the pending advance rows of many submitted Payment Entries match their Sales Order references
+
+    Orders with an Attributed row are kept as they are; the pending rows of
+    other orders are replaced when their amounts changed. One SELECT, one
+    DELETE and one bulk INSERT for all entries.
+
+    Args:
+        entries: List of (payment_entry, sales_order_references, order_deductions):
+            payment_entry with name, posting_date, company, party_type and party;
+            sales_order_references {sales_order: allocated_amount};
+            order_deductions {sales_order: deduction_amount}
+
+    Returns:
+        int: Number of Payment Entries whose rows were written
+    """
+    advance_entries = get_advance_entries(payment_entry.name for payment_entry, _, _ in entries)
+
+    rows_to_delete = []
+    rows_to_insert = []
+    written = set()
+    for payment_entry, sales_order_references, order_deductions in entries:
+        existing_rows = {}
+        for row in advance_entries.get(payment_entry.name, []):
+            existing_rows.setdefault(row.sales_order, []).append(row)
+
+        kept_orders = set()
+        for sales_order, rows in existing_rows.items():
+            if any(row.status == "Attributed" for row in rows) or (
+                    sales_order in sales_order_references
+                    and (flt(sum(flt(row.allocated_amount) for row in rows), 2),
+                         flt(sum(flt(row.deduction) for row in rows), 2)) == (
+                        flt(sales_order_references[sales_order], 2),
+                        flt(order_deductions.get(sales_order), 2))):
+                kept_orders.add(sales_order)
+            else:
+                rows_to_delete.extend(row.name for row in rows)
+                written.add(payment_entry.name)
+
+        for sales_order, allocated_amount in sales_order_references.items():
+            if sales_order in kept_orders:
+                continue
+            rows_to_insert.append(frappe._dict(
+                payment_entry=payment_entry.name,
+                sales_order=sales_order,
+                posting_date=getdate(payment_entry.posting_date),
+                company=payment_entry.company,
+                customer=payment_entry.party if payment_entry.party_type == "Customer" else None,
+                allocated_amount=flt(allocated_amount),
+                deduction=flt(order_deductions.get(sales_order)),
+            ))
+            written.add(payment_entry.name)
+
+    if rows_to_delete:
+        frappe.db.sql("""
+            DELETE FROM `tab{doctype}` WHERE name IN %(names)s
+        """.format(doctype=ADVANCE_DOCTYPE), {"names": tuple(rows_to_delete)})
+
+    insert_advance_entries(rows_to_insert)
+
+    return len(written)
+
+
+def insert_advance_entries(rows):
+    """
+    Insert advance rows with one bulk INSERT
+
+    Args:
+        rows: List of rows with ADVANCE_FIELDS (and optionally "status",
+            "attributed_amount" and "sales_invoice"; Pending by default)
+    """
+    if not rows:
+        return
+
+    timestamp = now_datetime()
+    user = frappe.session.user
+    fields = ["name", "creation", "modified", "modified_by", "owner", "docstatus",
+              "idx", "status", "attributed_amount", "sales_invoice", *ADVANCE_FIELDS]
+
+    values = [
+        (frappe.generate_hash(length=10), timestamp, timestamp, user, user, 0, 0,
+         row.get("status") or "Pending", flt(row.get("attributed_amount")), row.get("sales_invoice"),
+         *(row.get(fieldname) for fieldname in ADVANCE_FIELDS))
+        for row in rows
+    ]
+
+    frappe.db.bulk_insert(ADVANCE_DOCTYPE, fields, values)
+
+
+def cancel_advance_entries(payment_entry_name):
+    """
+    Mark the advance rows of a cancelled Payment Entry as Cancelled
+
+    Attributed Sales Team and ledger rows are removed / reversed by the
+    Payment Entry cancel itself.
+
+    Args:
+        payment_entry_name: Name of Payment Entry
+    """
+    frappe.db.sql("""
+        UPDATE `tab{doctype}`
+        SET status = 'Cancelled', modified = %(modified)s, modified_by = %(user)s
+        WHERE payment_entry = %(payment_entry)s AND status != 'Cancelled'
+    """.format(doctype=ADVANCE_DOCTYPE), {
+        "modified": now_datetime(),
+        "user": frappe.session.user,
+        "payment_entry": payment_entry_name,
+    })
+
+
+# ============================================================================
+# SECTION 2: ATTRIBUTION LOOKUP FUNCTIONS
+# ============================================================================
+
+def get_invoice_sales_orders(invoice_names):
+    """
+    Map submitted Sales Invoices to their Sales Orders in one query
+
+    Args:
+        invoice_names: Iterable of Sales Invoice names
+
+    Returns:
+        dict: {invoice_name: [sales_order, ...]} (orders in item order)
+    """
+    invoice_names = tuple(dict.fromkeys(invoice_names))
+    if not invoice_names:
+        return {}
+
+    rows = frappe.db.sql("""
+        SELECT sii.parent, sii.sales_order
+        FROM `tabSales Invoice Item` sii
+        WHERE sii.parent IN %(invoices)s AND sii.parenttype = 'Sales Invoice'
+            AND IFNULL(sii.sales_order, '') != ''
+        ORDER BY sii.parent, sii.idx
+    """, {"invoices": invoice_names}, as_dict=True)
+
+    invoice_orders = {}
+    for row in rows:
+        sales_orders = invoice_orders.setdefault(row.parent, [])
+        if row.sales_order not in sales_orders:
+            sales_orders.append(row.sales_order)
+
+    return invoice_orders
+
+
+def get_pending_advances(sales_orders):
+    """
+    Load and lock the pending advances of Sales Orders in one query (oldest first)
+
+    The rows are read FOR UPDATE inside the Sales Invoice submit transaction,
+    so invoices of the same order submitted concurrently attribute one after
+    the other and never take the same pending amount twice.
+
+    Args:
+        sales_orders: Iterable of Sales Order names
+
+    Returns:
+        dict: {sales_order: [rows]}
+    """
+    sales_orders = tuple(dict.fromkeys(sales_orders))
+    if not sales_orders:
+        return {}
+
+    rows = frappe.db.sql("""
+        SELECT name, attributed_amount, sales_invoice, {fields}
+        FROM `tab{doctype}`
+        WHERE sales_order IN %(sales_orders)s AND status = 'Pending'
+        ORDER BY posting_date, creation
+        FOR UPDATE
+    """.format(fields=", ".join(ADVANCE_FIELDS), doctype=ADVANCE_DOCTYPE),
+        {"sales_orders": sales_orders}, as_dict=True)
+
+    advances = {}
+    for row in rows:
+        advances.setdefault(row.sales_order, []).append(row)
+
+    return advances
+
+
+def get_attributed_amounts(invoice_names):
+    """
+    Sum the advances already attributed to Sales Invoices in one query
+
+    Args:
+        invoice_names: Iterable of Sales Invoice names
+
+    Returns:
+        dict: {invoice_name: attributed amount}
+    """
+    invoice_names = tuple(dict.fromkeys(invoice_names))
+    if not invoice_names:
+        return {}
+
+    return {
+        invoice_name: flt(amount)
+        for invoice_name, amount in frappe.db.sql("""
+            SELECT sales_invoice, SUM(attributed_amount)
+            FROM `tab{doctype}`
+            WHERE sales_invoice IN %(invoices)s AND status = 'Attributed'
+            GROUP BY sales_invoice
+        """.format(doctype=ADVANCE_DOCTYPE), {"invoices": invoice_names})
+    }
+
+
+def get_submitted_order_invoices(sales_orders):
+    """
+    Get the submitted Sales Invoices of Sales Orders in one query (oldest first)
+
+    Args:
+        sales_orders: Iterable of Sales Order names
+
+    Returns:
+        list: Sales Invoice names
+    """
+    sales_orders = tuple(dict.fromkeys(sales_orders))
+    if not sales_orders:
+        return []
+
+    return frappe.db.sql_list("""
+        SELECT si.name
+        FROM `tabSales Invoice` si
+        WHERE si.docstatus = 1 AND EXISTS (
+            SELECT 1 FROM `tabSales Invoice Item` sii
+            WHERE sii.parent = si.name AND sii.parenttype = 'Sales Invoice'
+                AND sii.sales_order IN %(sales_orders)s)
+        ORDER BY si.posting_date, si.name
+    """, {"sales_orders": sales_orders})
+
+
+def update_attributed_advances(advances):
+    """
+    Store attribution results with one UPDATE; fully used advances become Attributed
+
+    Args:
+        advances: Rows from get_pending_advances with updated "allocated_amount",
+            "deduction", "attributed_amount" and "sales_invoice"
+    """
+    if not advances:
+        return
+
+    cases = {"allocated_amount": [], "deduction": [], "attributed_amount": [],
+             "status": [], "sales_invoice": []}
+    params = {"modified": now_datetime(), "user": frappe.session.user,
+              "names": tuple(row.name for row in advances)}
+
+    for idx, row in enumerate(advances):
+        status = "Attributed" if flt(row.attributed_amount, 2) >= flt(row.allocated_amount, 2) \
+            else "Pending"
+        for fieldname, value in (("allocated_amount", flt(row.allocated_amount)),
+                                 ("deduction", flt(row.deduction)),
+                                 ("attributed_amount", flt(row.attributed_amount)),
+                                 ("status", status), ("sales_invoice", row.sales_invoice)):
+            cases[fieldname].append(f"WHEN %(name_{idx})s THEN %({fieldname}_{idx})s")
+            params[f"{fieldname}_{idx}"] = value
+        params[f"name_{idx}"] = row.name
+
+    set_clauses = ", ".join(
+        f"`{fieldname}` = CASE name {' '.join(clauses)} END"
+        for fieldname, clauses in cases.items())
+
+    frappe.db.sql(f"""
+        UPDATE `tab{ADVANCE_DOCTYPE}`
+        SET {set_clauses}, modified = %(modified)s, modified_by = %(user)s
+        WHERE name IN %(names)s
+    """, params)
+
+
+def get_invoice_attributed_advances(invoice_name):
+    """
+    Load and lock the advance rows attributed to a Sales Invoice
+
+    Args:
+        invoice_name: Name of Sales Invoice
+
+    Returns:
+        list: Rows with name, payment_entry, sales_order and attributed_amount
+    """
+    return frappe.db.sql("""
+        SELECT name, payment_entry, sales_order, attributed_amount
+        FROM `tab{doctype}`
+        WHERE sales_invoice = %(invoice)s AND status = 'Attributed'
+        FOR UPDATE
+    """.format(doctype=ADVANCE_DOCTYPE), {"invoice": invoice_name}, as_dict=True)
+
+
+def reset_attributed_advances(names):
+    """
+    Put attributed advance rows back to Pending with one UPDATE
+
+    Args:
+        names: Advance row names
+    """
+    if not names:
+        return
+
+    frappe.db.sql("""
+        UPDATE `tab{doctype}`
+        SET status = 'Pending', attributed_amount = 0, sales_invoice = NULL,
+            modified = %(modified)s, modified_by = %(user)s
+        WHERE name IN %(names)s
+    """.format(doctype=ADVANCE_DOCTYPE), {
+        "modified": now_datetime(),
+        "user": frappe.session.user,
+        "names": tuple(names),
+    })
+
+
+# ============================================================================
+# SECTION 3: HOOK FUNCTIONS
+# ============================================================================
+
+def on_payment_entry_trash(doc, method=None):
+    """
+    Hook: delete the advance rows of a deleted (cancelled or draft) Payment Entry
+    """
+    frappe.db.delete(ADVANCE_DOCTYPE, {"payment_entry": doc.name})
@@ -0,0 +1,788 @@
+"""
+Batch Incentive Recalculation
+Recompute incentives over historical Payment Entries with column arrays
+
+Used when commission rates change and years of receipts must be recomputed.
+Each chunk of Payment Entries is loaded into column arrays with a handful of
+queries, calculated with vectorized NumPy operations (same formulas and
+rounding as contribution_engine) and handed to the bulk writers.
+NumPy is optional: without it the scalar contribution_engine is used.
+With ledger_only only the Sales Person Contribution Ledger is (back)filled.
+Sales Order references are recorded as advances and attributed to the
+submitted invoices of their orders (also with ledger_only).
+
+Structure:
+1. Data Structures
+2. Loading Functions
+3. Vectorized Calculation Functions
+4. Writer Functions
+5. Batch Job and Whitelisted API
+"""
+
+from dataclasses import dataclass, field
+
+import frappe
+from frappe import _
+from frappe.utils import flt, getdate
+
+from sales_person_net_contribution.sales_person_net_contribution import (
+    advance_contribution,
+    contribution_engine,
+    contribution_ledger,
+)
+from sales_person_net_contribution.sales_person_net_contribution.bulk_calculation import (
+    prefetch_sales_team_cache,
+)
+from sales_person_net_contribution.sales_person_net_contribution.payment_entry import (
+    attribute_advance_contributions,
+    build_sales_team_members,
+    diff_sales_team_rows,
+    get_original_sales_team,
+    prefetch_invoice_context,
+    update_payment_entry_references,
+    write_sales_team_changes_bulk,
+)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Number of Payment Entries loaded, calculated and committed together
+BATCH_CHUNK_SIZE = 5000
+
+
+# ============================================================================
+# SECTION 1: DATA STRUCTURES
+# ============================================================================
+
+@dataclass(slots=True)
+class BatchColumns:
+    """Column data of one chunk (indexes point into payment_entries / invoices)"""
+    payment_entries: list = field(default_factory=list)
+    pe_posting_date: list = field(default_factory=list)
+    pe_total_paid: list = field(default_factory=list)
+    pe_total_deductions: list = field(default_factory=list)
+    invoices: list = field(default_factory=list)
+    invoice_context: dict = field(default_factory=dict)
+    invoice_grand_total: list = field(default_factory=list)
+    invoice_taxes: list = field(default_factory=list)
+    invoice_members: list = field(default_factory=list)
+    ref_name: list = field(default_factory=list)
+    ref_pe: list = field(default_factory=list)
+    ref_invoice: list = field(default_factory=list)
+    ref_allocated: list = field(default_factory=list)
+    # (header, {sales_order: allocated_amount}, {sales_order: deduction})
+    advances: list = field(default_factory=list)
+    skipped: dict = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class BatchResults:
+    """Calculated values of one chunk"""
+    # (pe_idx, invoice_idx, allocated_amount, net_paid_after_all_deductions,
+    #  [incentives per member])
+    pairs: list = field(default_factory=list)
+    # (ref_idx, tax_amount, net_without_tax, net_without_tax_without_deductions)
+    references: list = field(default_factory=list)
+
+
+# ============================================================================
+# SECTION 2: LOADING FUNCTIONS
+# ============================================================================
+
+def get_payment_entries_for_batch(company=None, from_date=None, to_date=None):
+    """
+    Get submitted Receive Payment Entries to recalculate
+
+    Args:
+        company: Optional company
+        from_date: Optional start posting date
+        to_date: Optional end posting date
+
+    Returns:
+        list: Payment Entry names ordered by posting date
+    """
+    filters = {"docstatus": 1, "payment_type": "Receive"}
+
+    if company:
+        filters["company"] = company
+
+    if from_date and to_date:
+        filters["posting_date"] = ["between", [getdate(from_date), getdate(to_date)]]
+    elif from_date:
+        filters["posting_date"] = [">=", getdate(from_date)]
+    elif to_date:
+        filters["posting_date"] = ["<=", getdate(to_date)]
+
+    return frappe.get_all(
+        "Payment Entry",
+        filters=filters,
+        pluck="name",
+        order_by="posting_date asc, name asc"
+    )
+
+
+def get_invoice_shards(payment_entry_names, shard_size=BATCH_CHUNK_SIZE):
+    """
+    Split Payment Entries into shards that never share a Sales Invoice or Sales Order
+
+    Payment Entries referencing a common invoice, a common Sales Order, or an
+    invoice of a referenced Sales Order are joined (union-find), so shards
+    can be written by parallel workers without two of them diffing the Sales
+    Team of the same invoice or attributing the advances of the same order.
+    Groups are packed in input order into shards of about shard_size entries
+    (a larger group stays whole).
+
+    Args:
+        payment_entry_names: Ordered list of Payment Entry names
+        shard_size: Target number of Payment Entries per shard
+
+    Returns:
+        list: Shards (lists of Payment Entry names)
+    """
+    parents = {name: name for name in payment_entry_names}
+
+    def find(name):
+        while parents[name] != name:
+            parents[name] = parents[parents[name]]
+            name = parents[name]
+        return name
+
+    first_payment_entry = {}
+    for start in range(0, len(payment_entry_names), BATCH_CHUNK_SIZE):
+        references = frappe.db.sql("""
+            SELECT DISTINCT parent, reference_doctype, reference_name
+            FROM `tabPayment Entry Reference`
+            WHERE parent IN %(names)s AND parenttype = 'Payment Entry'
+                AND reference_doctype IN ('Sales Invoice', 'Sales Order')
+                AND IFNULL(reference_name, '') != ''
+        """, {"names": tuple(payment_entry_names[start:start + BATCH_CHUNK_SIZE])}, as_dict=True)
+
+        invoice_orders = advance_contribution.get_invoice_sales_orders(
+            reference.reference_name for reference in references
+            if reference.reference_doctype == "Sales Invoice")
+
+        for reference in references:
+            keys = [(reference.reference_doctype, reference.reference_name)]
+            keys.extend(("Sales Order", sales_order)
+                        for sales_order in invoice_orders.get(reference.reference_name, []))
+            for key in keys:
+                other = first_payment_entry.setdefault(key, reference.parent)
+                parents[find(reference.parent)] = find(other)
+
+    groups = {}
+    for name in payment_entry_names:
+        groups.setdefault(find(name), []).append(name)
+
+    shards = []
+    shard = []
+    for group in groups.values():
+        if shard and len(shard) + len(group) > shard_size:
+            shards.append(shard)
+            shard = []
+        shard.extend(group)
+    if shard:
+        shards.append(shard)
+
+    return shards
+
+
+def get_batch_advance(header, order_rows):
+    """
+    Build the advance entry of a Payment Entry from its Sales Order reference rows
+
+    Deductions are shared like in sync_advance_contributions (by allocated
+    amount over the total allocated amount).
+
+    Args:
+        header: Payment Entry header row (see load_batch_columns)
+        order_rows: Sales Order reference rows
+
+    Returns:
+        tuple: (header, {sales_order: allocated_amount}, {sales_order: deduction})
+    """
+    sales_order_references = {}
+    for row in order_rows:
+        sales_order_references[row.reference_name] = \
+            sales_order_references.get(row.reference_name, 0) + flt(row.allocated_amount or 0)
+
+    order_deductions = contribution_engine.distribute_deductions(
+        sales_order_references, flt(header.total_deductions or 0),
+        flt(header.total_allocated_amount or 0))
+
+    return header, sales_order_references, order_deductions
+
+
+def load_batch_columns(payment_entry_names, sales_team_cache):
+    """
+    Load a chunk of Payment Entries into column arrays
+
+    Queries: Payment Entry headers with summed deductions, reference rows,
+    invoice context (two queries) and fallback Sales Teams (shared cache).
+    Entries not found or without Sales Invoice references are listed in "skipped".
+
+    Args:
+        payment_entry_names: List of Payment Entry names
+        sales_team_cache: dict {(doctype, name): sales_team} shared across chunks
+
+    Returns:
+        BatchColumns: Column data of the chunk
+    """
+    columns = BatchColumns()
+    if not payment_entry_names:
+        return columns
+
+    names = tuple(payment_entry_names)
+
+    headers = frappe.db.sql("""
+        SELECT
+            pe.name, pe.posting_date, pe.total_allocated_amount, pe.company,
+            pe.party_type, pe.party,
+            (SELECT COALESCE(SUM(ded.amount), 0) FROM `tabPayment Entry Deduction` ded
+             WHERE ded.parent = pe.name AND ded.parenttype = 'Payment Entry') AS total_deductions
+        FROM `tabPayment Entry` pe
+        WHERE pe.name IN %(names)s
+    """, {"names": names}, as_dict=True)
+    headers = {header.name: header for header in headers}
+
+    references = frappe.db.sql("""
+        SELECT parent, name, reference_doctype, reference_name, allocated_amount
+        FROM `tabPayment Entry Reference`
+        WHERE parent IN %(names)s AND parenttype = 'Payment Entry'
+            AND reference_doctype IN ('Sales Invoice', 'Sales Order')
+            AND IFNULL(reference_name, '') != ''
+        ORDER BY parent, idx
+    """, {"names": names}, as_dict=True)
+
+    references_by_pe = {}
+    for reference in references:
+        references_by_pe.setdefault(reference.parent, []).append(reference)
+
+    # Sales Invoice references are calculated, Sales Order references recorded as advances
+    supported = {}
+    for name in payment_entry_names:
+        rows = references_by_pe.get(name, [])
+        invoice_rows = [row for row in rows if row.reference_doctype == "Sales Invoice"]
+        order_rows = [row for row in rows if row.reference_doctype == "Sales Order"]
+
+        if name not in headers:
+            columns.skipped[name] = _("Payment Entry {0} not found").format(name)
+            continue
+
+        if order_rows:
+            columns.advances.append(get_batch_advance(headers[name], order_rows))
+        if invoice_rows:
+            supported[name] = invoice_rows
+        elif not order_rows:
+            columns.skipped[name] = _("No Sales Invoice found in references")
+
+    invoice_names = list(dict.fromkeys(
+        row.reference_name for rows in supported.values() for row in rows))
+    columns.invoice_context = prefetch_invoice_context(invoice_names)
+
+    invoice_index = {}
+    for invoice_name in invoice_names:
+        invoice = columns.invoice_context.get(invoice_name)
+        if not invoice:
+            continue
+
+        invoice_index[invoice_name] = len(columns.invoices)
+        columns.invoices.append(invoice_name)
+        columns.invoice_grand_total.append(flt(invoice.grand_total or 0))
+        columns.invoice_taxes.append(flt(invoice.total_taxes_and_charges or 0))
+        columns.invoice_members.append(build_sales_team_members(
+            get_original_sales_team(invoice, sales_team_cache)))
+
+    for name, rows in supported.items():
+        pe_idx = len(columns.payment_entries)
+        header = headers[name]
+
+        columns.payment_entries.append(name)
+        columns.pe_posting_date.append(header.posting_date)
+        columns.pe_total_paid.append(flt(header.total_allocated_amount or 0))
+        columns.pe_total_deductions.append(flt(header.total_deductions or 0))
+
+        for row in rows:
+            if row.reference_name not in invoice_index:
+                continue
+            columns.ref_name.append(row.name)
+            columns.ref_pe.append(pe_idx)
+            columns.ref_invoice.append(invoice_index[row.reference_name])
+            columns.ref_allocated.append(flt(row.allocated_amount or 0))
+
+    return columns
+
+
+# ============================================================================
+# SECTION 3: VECTORIZED CALCULATION FUNCTIONS
+# ============================================================================
+
+def round_amounts(values, precision=2):
+    """
+    Vectorized contribution_engine.round_amount (same result for every element)
+
+    Away from an exact half, legacy rounding equals rounding to the nearest
+    integer (np.rint). Elements within float noise of a half are rounded with
+    the scalar function so ties are resolved exactly like flt(value, precision).
+
+    Args:
+        values: NumPy array
+        precision: Number of decimals
+
+    Returns:
+        numpy.ndarray: Rounded values
+    """
+    multiplier = 10 ** precision
+    scaled = values * multiplier
+    rounded = np.rint(scaled) / multiplier
+
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for index in np.flatnonzero(near_half):
+        rounded[index] = contribution_engine.round_amount(float(values[index]), precision)
+
+    return rounded
+
+
+def compute_batch_incentives(columns):
+    """
+    Calculate deduction shares, tax amounts, net values and incentives for a chunk
+
+    Formulas are those of contribution_engine:
+    - invoice_deduction = total_deductions * (invoice_allocated / total_paid)
+      (equal split when total_paid is 0)
+    - net_paid_after_all_deductions = allocated - deduction - total_taxes_and_charges
+    - incentives = commission_rate_decimal * net_paid_after_all_deductions
+    - reference rows: tax_amount, net_without_tax, net_without_tax_without_deductions
+
+    Args:
+        columns: BatchColumns
+
+    Returns:
+        BatchResults: Calculated values (pairs without Sales Team have no incentives)
+    """
+    if np is None:
+        return compute_batch_incentives_scalar(columns)
+
+    results = BatchResults()
+    if not columns.ref_name:
+        return results
+
+    ref_pe = np.asarray(columns.ref_pe, dtype=np.int64)
+    ref_invoice = np.asarray(columns.ref_invoice, dtype=np.int64)
+    ref_allocated = np.asarray(columns.ref_allocated, dtype=np.float64)
+    pe_total_paid = np.asarray(columns.pe_total_paid, dtype=np.float64)
+    pe_total_deductions = np.asarray(columns.pe_total_deductions, dtype=np.float64)
+    invoice_grand_total = np.asarray(columns.invoice_grand_total, dtype=np.float64)
+    invoice_taxes = np.asarray(columns.invoice_taxes, dtype=np.float64)
+
+    # Aggregate reference rows into (Payment Entry, invoice) pairs
+    invoice_count = len(columns.invoices)
+    pair_keys, ref_pair = np.unique(
+        ref_pe * invoice_count + ref_invoice, return_inverse=True)
+    ref_pair = ref_pair.reshape(-1)
+    pair_pe = pair_keys // invoice_count
+    pair_invoice = pair_keys % invoice_count
+    pair_allocated = np.bincount(ref_pair, weights=ref_allocated, minlength=len(pair_keys))
+    pair_rows = np.bincount(ref_pair, minlength=len(pair_keys))
+
+    # Distribute deductions
+    total_paid = pe_total_paid[pair_pe]
+    total_deductions = pe_total_deductions[pair_pe]
+    pe_invoice_count = np.bincount(pair_pe, minlength=len(columns.payment_entries))[pair_pe]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pair_deduction = np.where(
+            total_paid > 0,
+            total_deductions * (pair_allocated / total_paid),
+            total_deductions / pe_invoice_count
+        )
+
+    # Net values
+    pair_net_paid = pair_allocated - pair_deduction
+    pair_net_after = pair_net_paid - invoice_taxes[pair_invoice]
+
+    # Expand pairs by Sales Team members
+    member_count = np.asarray([len(members) for members in columns.invoice_members], dtype=np.int64)
+    member_start = np.concatenate(([0], np.cumsum(member_count)[:-1]))
+    member_rate = np.asarray([
+        contribution_engine.to_amount(member.commission_rate)
+        for members in columns.invoice_members for member in members
+    ], dtype=np.float64)
+
+    pair_member_count = member_count[pair_invoice]
+    pair_member_offset = np.concatenate(([0], np.cumsum(pair_member_count)[:-1]))
+    member_pair = np.repeat(np.arange(len(pair_keys)), pair_member_count)
+    member_index = (
+        np.repeat(member_start[pair_invoice], pair_member_count)
+        + np.arange(pair_member_count.sum())
+        - np.repeat(pair_member_offset, pair_member_count)
+    )
+
+    rate = member_rate[member_index] if len(member_index) else np.zeros(0)
+    rate_decimal = np.where(rate > 1, rate / 100, rate)
+    incentives = round_amounts(rate_decimal * pair_net_after[member_pair])
+
+    # Reference rows
+    ref_pair_allocated = pair_allocated[ref_pair]
+    ref_pair_rows = pair_rows[ref_pair]
+    ref_pair_deduction = pair_deduction[ref_pair]
+    positive = ref_pair_allocated > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(positive, ref_allocated / ref_pair_allocated, 0.0)
+        row_allocated = np.where(positive, ref_pair_allocated * ratio,
+                                 ref_pair_allocated / ref_pair_rows)
+        row_deduction = np.where(positive, ref_pair_deduction * ratio,
+                                 ref_pair_deduction / ref_pair_rows)
+        grand_total = invoice_grand_total[ref_invoice]
+        tax_ratio = np.where(grand_total > 0, invoice_taxes[ref_invoice] / grand_total, 0.0)
+
+    row_tax = np.where(grand_total > 0, round_amounts(row_allocated * tax_ratio), 0.0)
+    row_net_without_tax = round_amounts(row_allocated - row_tax)
+    row_net_without_tax_without_deductions = round_amounts(
+        row_allocated - row_tax - row_deduction)
+
+    # Hand back plain Python values
+    incentives = incentives.tolist()
+    pair_member_offset = pair_member_offset.tolist()
+    pair_member_count = pair_member_count.tolist()
+    for pair, (pe_idx, invoice_idx, allocated, net_after) in enumerate(
+            zip(pair_pe.tolist(), pair_invoice.tolist(), pair_allocated.tolist(),
+                pair_net_after.tolist())):
+        start = pair_member_offset[pair]
+        results.pairs.append((
+            pe_idx, invoice_idx, allocated, net_after,
+            incentives[start:start + pair_member_count[pair]]
+        ))
+
+    # Rows of invoices without Sales Team or without allocation are not updated
+    valid = (member_count[ref_invoice] > 0) & (ref_pair_allocated != 0)
+    for ref_idx in np.flatnonzero(valid).tolist():
+        results.references.append((
+            ref_idx, float(row_tax[ref_idx]), float(row_net_without_tax[ref_idx]),
+            float(row_net_without_tax_without_deductions[ref_idx])
+        ))
+
+    return results
+
+
+def compute_batch_incentives_scalar(columns):
+    """
+    Calculate a chunk with the scalar contribution_engine (fallback without NumPy)
+
+    Args:
+        columns: BatchColumns
+
+    Returns:
+        BatchResults: Same structure as compute_batch_incentives
+    """
+    results = BatchResults()
+    refs_by_pe = {}
+    for ref_idx, pe_idx in enumerate(columns.ref_pe):
+        refs_by_pe.setdefault(pe_idx, []).append(ref_idx)
+
+    ref_index = {name: ref_idx for ref_idx, name in enumerate(columns.ref_name)}
+
+    for pe_idx, ref_indexes in sorted(refs_by_pe.items()):
+        invoice_indexes = {}
+        for ref_idx in ref_indexes:
+            invoice_indexes.setdefault(
+                columns.invoices[columns.ref_invoice[ref_idx]], columns.ref_invoice[ref_idx])
+
+        payment = contribution_engine.PaymentInput(
+            name=columns.payment_entries[pe_idx],
+            total_allocated_amount=columns.pe_total_paid[pe_idx],
+            deductions=[columns.pe_total_deductions[pe_idx]],
+            references=[
+                contribution_engine.ReferenceInput(
+                    name=columns.ref_name[ref_idx],
+                    invoice_name=columns.invoices[columns.ref_invoice[ref_idx]],
+                    allocated_amount=columns.ref_allocated[ref_idx]
+                )
+                for ref_idx in ref_indexes
+            ]
+        )
+        invoices = {
+            invoice_name: contribution_engine.InvoiceInput(
+                name=invoice_name,
+                grand_total=columns.invoice_grand_total[invoice_idx],
+                total_taxes_and_charges=columns.invoice_taxes[invoice_idx],
+                sales_team=columns.invoice_members[invoice_idx]
+            )
+            for invoice_name, invoice_idx in invoice_indexes.items()
+        }
+
+        contribution = contribution_engine.calculate_contribution(payment, invoices)
+
+        for invoice_name in sorted(contribution.invoices, key=invoice_indexes.get):
+            invoice_result = contribution.invoices[invoice_name]
+            results.pairs.append((
+                pe_idx, invoice_indexes[invoice_name],
+                invoice_result.allocated_amount,
+                invoice_result.net_paid_after_all_deductions,
+                [incentive.incentives for incentive in invoice_result.incentives]
+            ))
+
+        for reference in contribution.references:
+            if not invoices[reference.invoice_name].sales_team:
+                continue
+            results.references.append((
+                ref_index[reference.name], reference.tax_amount,
+                reference.net_without_tax, reference.net_without_tax_without_deductions
+            ))
+
+    return results
+
+
+# ============================================================================
+# SECTION 4: WRITER FUNCTIONS
+# ============================================================================
+
+def write_batch_results(columns, results, ledger_only=False):
+    """
+    Write a calculated chunk with the bulk writers
+
+    Sales Team rows are diffed per invoice and written together with
+    write_sales_team_changes_bulk; Payment Entry References custom fields get
+    one UPDATE per Payment Entry.
+    The contribution ledger of every Payment Entry with a Sales Team is
+    brought in line (active ledger rows are loaded in one query).
+
+    Args:
+        columns: BatchColumns
+        results: BatchResults
+        ledger_only: Only write the contribution ledger
+
+    Returns:
+        dict: {"invoices_written": int, "missing_sales_team": int, "ledgers_written": int}
+    """
+    missing_sales_team = 0
+    ledger_rows_by_pe = {}
+    invoice_changes = []
+
+    for pe_idx, invoice_idx, allocated, net_after, incentives in results.pairs:
+        members = columns.invoice_members[invoice_idx]
+        if not members:
+            missing_sales_team += 1
+            continue
+
+        payment_entry_name = columns.payment_entries[pe_idx]
+        payment_entry_date = getdate(columns.pe_posting_date[pe_idx])
+        invoice = columns.invoice_context[columns.invoices[invoice_idx]]
+
+        ledger_rows_by_pe.setdefault(payment_entry_name, []).extend(
+            contribution_ledger.make_ledger_row(
+                payment_entry_name, payment_entry_date, invoice, member.sales_person,
+                contribution_engine.to_amount(member.commission_rate),
+                allocated, net_after, incentive
+            )
+            for member, incentive in zip(members, incentives)
+        )
+
+        if ledger_only:
+            continue
+
+        computed_rows = [
+            {
+                'sales_person': member.sales_person,
+                'commission_rate': contribution_engine.to_amount(member.commission_rate),
+                'allocated_percentage': contribution_engine.to_amount(member.allocated_percentage),
+                'incentives': incentive,
+                'custom_payment_entry': payment_entry_name,
+                'custom_date': payment_entry_date,
+            }
+            for member, incentive in zip(members, incentives)
+        ]
+
+        invoice_changes.append(
+            (invoice, diff_sales_team_rows(invoice, payment_entry_name, computed_rows)))
+
+    invoices_written = write_sales_team_changes_bulk(invoice_changes)
+
+    reference_values_by_pe = {}
+    for ref_idx, tax_amount, net_without_tax, net_without_tax_without_deductions in results.references:
+        payment_entry_name = columns.payment_entries[columns.ref_pe[ref_idx]]
+        reference_values_by_pe.setdefault(payment_entry_name, {})[columns.ref_name[ref_idx]] = {
+            "custom_tax_amount_from_allocated": tax_amount,
+            "custom_net_without_tax": net_without_tax,
+            "custom_net_without_tax_without_deductions": net_without_tax_without_deductions,
+        }
+
+    if not ledger_only:
+        for payment_entry_name, reference_values in reference_values_by_pe.items():
+            update_payment_entry_references(payment_entry_name, reference_values)
+
+    # Ledger rows of invoices reached through Sales Order advances are kept
+    referenced_invoices = {}
+    for pe_idx, invoice_idx in zip(columns.ref_pe, columns.ref_invoice):
+        referenced_invoices.setdefault(
+            columns.payment_entries[pe_idx], set()).add(columns.invoices[invoice_idx])
+
+    ledgers_written = 0
+    active_ledger_entries = contribution_ledger.get_active_ledger_entries(ledger_rows_by_pe)
+    for payment_entry_name, ledger_rows in ledger_rows_by_pe.items():
+        invoice_names = referenced_invoices.get(payment_entry_name, set())
+        active_rows = [row for row in active_ledger_entries[payment_entry_name]
+                       if row.sales_invoice in invoice_names]
+        if contribution_ledger.replace_ledger_entries(
+                payment_entry_name, ledger_rows, active_rows):
+            ledgers_written += 1
+
+    return {
+        "invoices_written": invoices_written,
+        "missing_sales_team": missing_sales_team,
+        "ledgers_written": ledgers_written,
+    }
+
+
+def write_batch_advances(columns, sales_team_cache=None):
+    """
+    Record the Sales Order advances of a chunk and attribute them
+
+    Advance rows of all entries are synced with one SELECT, one DELETE and one
+    INSERT; pending advances are then attributed to the submitted invoices of
+    their orders (attribute_advance_contributions).
+
+    Args:
+        columns: BatchColumns
+        sales_team_cache: Optional dict shared across chunks
+
+    Returns:
+        dict: {"advances_recorded": int, "advances_attributed": int}
+    """
+    if not columns.advances:
+        return {"advances_recorded": 0, "advances_attributed": 0}
+
+    advances_recorded = advance_contribution.sync_advance_entries_bulk(columns.advances)
+    advances_attributed = attribute_advance_contributions(
+        advance_contribution.get_submitted_order_invoices(
+            sales_order
+            for _, sales_order_references, _ in columns.advances
+            for sales_order in sales_order_references),
+        sales_team_cache
+    )
+
+    return {"advances_recorded": advances_recorded, "advances_attributed": advances_attributed}
+
+
+# ============================================================================
+# SECTION 5: BATCH JOB AND WHITELISTED API
+# ============================================================================
+
+def recalculate_incentives_batch(company=None, from_date=None, to_date=None,
+                                 dry_run=False, chunk_size=BATCH_CHUNK_SIZE,
+                                 payment_entry_names=None, ledger_only=False):
+    """
+    Recalculate incentives for historical Payment Entries in vectorized chunks
+
+    Each chunk is committed once. With dry_run nothing is written.
+
+    Args:
+        company: Optional company
+        from_date: Optional start posting date
+        to_date: Optional end posting date
+        dry_run: Calculate only, do not write
+        chunk_size: Number of Payment Entries per chunk
+        payment_entry_names: Optional explicit list (overrides the filters)
+        ledger_only: Only (back)fill the contribution ledger, keep Sales Team
+            rows and References custom fields as they are (Sales Order
+            advances are still recorded and attributed)
+
+    Returns:
+        dict: Totals for the run
+    """
+    if payment_entry_names is None:
+        payment_entry_names = get_payment_entries_for_batch(company, from_date, to_date)
+
+    totals = {
+        "payment_entries": len(payment_entry_names),
+        "skipped": 0,
+        "invoice_pairs": 0,
+        "invoices_written": 0,
+        "missing_sales_team": 0,
+        "ledgers_written": 0,
+        "advance_entries": 0,
+        "advances_recorded": 0,
+        "advances_attributed": 0,
+        "dry_run": bool(dry_run),
+        "vectorized": np is not None,
+    }
+    sales_team_cache = {}
+
+    for start in range(0, len(payment_entry_names), chunk_size):
+        chunk = payment_entry_names[start:start + chunk_size]
+
+        prefetch_sales_team_cache(chunk, sales_team_cache)
+        columns = load_batch_columns(chunk, sales_team_cache)
+        results = compute_batch_incentives(columns)
+
+        totals["skipped"] += len(columns.skipped)
+        totals["invoice_pairs"] += len(results.pairs)
+        totals["advance_entries"] += len(columns.advances)
+
+        if dry_run:
+            totals["missing_sales_team"] += sum(
+                1 for pair in results.pairs if not columns.invoice_members[pair[1]])
+            continue
+
+        written = write_batch_results(columns, results, ledger_only=ledger_only)
+        totals["invoices_written"] += written["invoices_written"]
+        totals["missing_sales_team"] += written["missing_sales_team"]
+        totals["ledgers_written"] += written["ledgers_written"]
+
+        written = write_batch_advances(columns, sales_team_cache)
+        totals["advances_recorded"] += written["advances_recorded"]
+        totals["advances_attributed"] += written["advances_attributed"]
+
+        frappe.db.commit()
+
+    return totals
+
+
+def backfill_contribution_ledger():
+    """
+    Job: fill the contribution ledger from all submitted Payment Entries
+
+    Queued by the v1_0.backfill_contribution_ledger patch; the sales_commission
+    report shows a notice until the run finished.
+
+    Returns:
+        dict: Totals for the run
+    """
+    totals = recalculate_incentives_batch(ledger_only=True)
+
+    contribution_ledger.set_backfill_pending(False)
+    frappe.db.commit()
+
+    return totals
+
+
+@frappe.whitelist()
+def enqueue_incentive_recalculation(company=None, from_date=None, to_date=None, dry_run=0):
+    """
+    Enqueue a batch incentive recalculation on the long queue
+
+    Args:
+        company: Optional company
+        from_date: Optional start posting date
+        to_date: Optional end posting date
+        dry_run: 1 to calculate without writing
+
+    Returns:
+        dict: {"status": "queued", "job_id": str}
+    """
+    frappe.only_for(("System Manager", "Accounts Manager"))
+
+    job = frappe.enqueue(
+        recalculate_incentives_batch,
+        queue="long",
+        timeout=6 * 60 * 60,
+        company=company,
+        from_date=from_date,
+        to_date=to_date,
+        dry_run=bool(int(dry_run or 0))
+    )
+
+    return {
+        "status": "queued",
+        "job_id": getattr(job, "id", None),
+    }
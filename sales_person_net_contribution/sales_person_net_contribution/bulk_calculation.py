@@ -0,0 +1,295 @@
+"""
+Bulk Net Contribution Calculation
+Recalculate net contribution for many Payment Entries in one background job
+
+Structure:
+1. Selection Functions
+2. Prefetch Functions
+3. Background Job Functions
+4. Whitelisted API
+"""
+
+import frappe
+from frappe import _
+
+from sales_person_net_contribution.sales_person_net_contribution.payment_entry import (
+    collect_sales_team_members,
+    run_net_contribution,
+)
+
+# Number of Payment Entries prefetched and reported together
+BULK_CHUNK_SIZE = 50
+
+# Realtime event used to stream progress to the list view
+BULK_PROGRESS_EVENT = "net_contribution_bulk_progress"
+
+
+# ============================================================================
+# SECTION 1: SELECTION FUNCTIONS
+# ============================================================================
+
+def get_payment_entries_for_bulk(names=None, filters=None):
+    """
+    Resolve Payment Entry names to process from explicit names or list filters
+
+    Only Payment Entries with payment_type = "Receive" that the current user
+    can read are returned.
+
+    Args:
+        names: List of Payment Entry names (or JSON string)
+        filters: List view filters (dict, list or JSON string)
+
+    Returns:
+        list: Payment Entry names ordered by posting date
+    """
+    if isinstance(names, str):
+        names = frappe.parse_json(names)
+    if isinstance(filters, str):
+        filters = frappe.parse_json(filters)
+
+    if not names and not filters:
+        frappe.throw(_("Please select at least one Payment Entry."))
+
+    query_filters = [["Payment Entry", "payment_type", "=", "Receive"]]
+
+    if names:
+        names = [str(name).strip() for name in names if name]
+        query_filters.append(["Payment Entry", "name", "in", names])
+
+    if isinstance(filters, dict):
+        for fieldname, value in filters.items():
+            query_filters.append(["Payment Entry", fieldname, "=", value])
+    elif filters:
+        query_filters.extend(filters)
+
+    return frappe.get_list(
+        "Payment Entry",
+        filters=query_filters,
+        pluck="name",
+        order_by="posting_date asc, name asc"
+    )
+
+
+# ============================================================================
+# SECTION 2: PREFETCH FUNCTIONS
+# ============================================================================
+
+def prefetch_sales_team_cache(payment_entry_names, sales_team_cache):
+    """
+    Load fallback Sales Teams (Sales Order / Customer) for a chunk in a few queries
+
+    The cache is shared across the whole bulk job, so customers and orders seen
+    in earlier chunks are not loaded again.
+
+    Args:
+        payment_entry_names: List of Payment Entry names in the chunk
+        sales_team_cache: dict {(doctype, name): sales_team} to fill
+    """
+    if not payment_entry_names:
+        return
+
+    invoice_names = frappe.db.sql_list("""
+        SELECT DISTINCT reference_name
+        FROM `tabPayment Entry Reference`
+        WHERE parent IN %(payment_entries)s
+            AND parenttype = 'Payment Entry'
+            AND reference_doctype = 'Sales Invoice'
+    """, {"payment_entries": tuple(payment_entry_names)})
+
+    if not invoice_names:
+        return
+
+    customers = frappe.db.sql_list("""
+        SELECT DISTINCT customer
+        FROM `tabSales Invoice`
+        WHERE name IN %(invoices)s AND IFNULL(customer, '') != ''
+    """, {"invoices": tuple(invoice_names)})
+
+    sales_orders = frappe.db.sql_list("""
+        SELECT DISTINCT sales_order
+        FROM `tabSales Invoice Item`
+        WHERE parent IN %(invoices)s AND IFNULL(sales_order, '') != ''
+    """, {"invoices": tuple(invoice_names)})
+
+    parents = {
+        "Customer": [c for c in customers if ("Customer", c) not in sales_team_cache],
+        "Sales Order": [so for so in sales_orders if ("Sales Order", so) not in sales_team_cache],
+    }
+
+    for parenttype, parent_names in parents.items():
+        if not parent_names:
+            continue
+
+        rows = frappe.db.sql("""
+            SELECT parent, sales_person, commission_rate, allocated_percentage
+            FROM `tabSales Team`
+            WHERE parenttype = %(parenttype)s AND parent IN %(parents)s
+            ORDER BY parent, idx
+        """, {"parenttype": parenttype, "parents": tuple(parent_names)}, as_dict=True)
+
+        rows_by_parent = {}
+        for row in rows:
+            rows_by_parent.setdefault(row.parent, []).append(row)
+
+        # Parents without rows are cached as empty so they are not reloaded
+        for parent in parent_names:
+            sales_team_cache[(parenttype, parent)] = collect_sales_team_members(
+                rows_by_parent.get(parent, []))
+
+
+# ============================================================================
+# SECTION 3: BACKGROUND JOB FUNCTIONS
+# ============================================================================
+
+def publish_bulk_progress(user, task_id, processed, total, success_count, error_count,
+                          errors=None, done=False):
+    """
+    Publish bulk calculation progress to the user who started the job
+
+    The payload carries the task id, so a listener only follows its own job
+    when the same user runs several at once.
+
+    Args:
+        user: User to notify
+        task_id: Id of the bulk run (see calculate_net_contribution_bulk)
+        processed: Number of Payment Entries processed so far
+        total: Total number of Payment Entries
+        success_count: Number processed successfully
+        error_count: Number of failures
+        errors: List of {"payment_entry", "error"} for the current chunk
+        done: True when the job has finished
+    """
+    frappe.publish_realtime(
+        BULK_PROGRESS_EVENT,
+        {
+            "task_id": task_id,
+            "processed": processed,
+            "total": total,
+            "success_count": success_count,
+            "error_count": error_count,
+            "errors": errors or [],
+            "done": done,
+        },
+        user=user,
+        after_commit=False
+    )
+
+
+def process_net_contribution_bulk(payment_entry_names, user=None, task_id=None,
+                                  chunk_size=BULK_CHUNK_SIZE):
+    """
+    Background job: recalculate net contribution for a list of Payment Entries
+
+    Entries are processed in chunks. Fallback Sales Teams are prefetched once
+    per chunk and shared across all entries of the job. Each entry is one unit
+    of work: committed once when it succeeds, rolled back when it fails.
+    Progress is published after every chunk.
+
+    Args:
+        payment_entry_names: List of Payment Entry names
+        user: User to notify with realtime progress
+        task_id: Id of the bulk run sent with every progress event
+        chunk_size: Number of entries per chunk
+
+    Returns:
+        dict: {"total", "success_count", "error_count"}
+    """
+    user = user or frappe.session.user
+    total = len(payment_entry_names)
+    success_count = 0
+    error_count = 0
+    sales_team_cache = {}
+
+    for start in range(0, total, chunk_size):
+        chunk = payment_entry_names[start:start + chunk_size]
+        chunk_errors = []
+
+        try:
+            prefetch_sales_team_cache(chunk, sales_team_cache)
+        except Exception:
+            # Prefetch is an optimization only; entries fall back to loading documents
+            frappe.log_error(frappe.get_traceback(),
+                             _("Error prefetching Sales Team for bulk net contribution"))
+
+        for payment_entry_name in chunk:
+            try:
+                result = run_net_contribution(
+                    payment_entry_name, sales_team_cache)
+
+                if result.get("status") == "error":
+                    frappe.db.rollback()
+                    error_count += 1
+                    chunk_errors.append({
+                        "payment_entry": payment_entry_name,
+                        "error": result.get("error") or _("Calculation error"),
+                    })
+                else:
+                    frappe.db.commit()
+                    success_count += 1
+            except Exception as e:
+                frappe.db.rollback()
+                error_count += 1
+                chunk_errors.append({
+                    "payment_entry": payment_entry_name,
+                    "error": str(e),
+                })
+            finally:
+                frappe.clear_messages()
+
+        publish_bulk_progress(
+            user, task_id, min(start + chunk_size, total), total,
+            success_count, error_count, chunk_errors
+        )
+
+    publish_bulk_progress(user, task_id, total, total, success_count,
+                          error_count, done=True)
+
+    return {
+        "total": total,
+        "success_count": success_count,
+        "error_count": error_count,
+    }
+
+
+# ============================================================================
+# SECTION 4: WHITELISTED API
+# ============================================================================
+
+@frappe.whitelist()
+def calculate_net_contribution_bulk(names=None, filters=None, task_id=None):
+    """
+    Enqueue one background job to recalculate net contribution for many Payment Entries
+
+    Args:
+        names: List of Payment Entry names (or JSON string)
+        filters: List view filters used when names are not given
+        task_id: Optional caller-supplied id of the run (generated when not given)
+
+    Returns:
+        dict: {"status": "queued", "total": int, "job_id": str, "task_id": str, "event": str}
+    """
+    frappe.has_permission("Payment Entry", "write", throw=True)
+
+    payment_entry_names = get_payment_entries_for_bulk(names, filters)
+    if not payment_entry_names:
+        frappe.throw(
+            _('No Payment Entries with payment_type = "Receive" found in selection.'))
+
+    task_id = task_id or frappe.generate_hash(length=10)
+
+    job = frappe.enqueue(
+        process_net_contribution_bulk,
+        queue="long",
+        timeout=max(1500, len(payment_entry_names) * 10),
+        payment_entry_names=payment_entry_names,
+        user=frappe.session.user,
+        task_id=task_id
+    )
+
+    return {
+        "status": "queued",
+        "total": len(payment_entry_names),
+        "job_id": getattr(job, "id", None),
+        "task_id": task_id,
+        "event": BULK_PROGRESS_EVENT,
+    }
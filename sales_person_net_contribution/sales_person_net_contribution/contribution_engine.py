@@ -0,0 +1,430 @@
+"""
+Contribution Engine
+Pure calculation of net contribution and sales person incentives (no frappe, no I/O)
+
+The same functions run per request (payment_entry.py), in batch backfills and
+in benchmarks. Inputs and outputs are compact __slots__ dataclasses.
+
+Structure:
+1. Data Structures
+2. Numeric Helpers
+3. Deduction Distribution
+4. Tax and Net Calculation
+5. Incentive Calculation
+6. Payment Entry Calculation
+"""
+
+import math
+from dataclasses import dataclass, field
+
+
+# ============================================================================
+# SECTION 1: DATA STRUCTURES
+# ============================================================================
+
+@dataclass(slots=True)
+class SalesTeamMember:
+    """Sales person with commission rate (percent, or decimal when <= 1)"""
+    sales_person: str
+    commission_rate: float = 0.0
+    allocated_percentage: float = 0.0
+
+
+@dataclass(slots=True)
+class ReferenceInput:
+    """One Payment Entry Reference row pointing to a Sales Invoice"""
+    name: str
+    invoice_name: str
+    allocated_amount: float = 0.0
+
+
+@dataclass(slots=True)
+class InvoiceInput:
+    """Sales Invoice totals and the Sales Team resolved for it"""
+    name: str
+    grand_total: float = 0.0
+    total_taxes_and_charges: float = 0.0
+    sales_team: list = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class PaymentInput:
+    """Payment Entry amounts needed for the calculation"""
+    name: str
+    total_allocated_amount: float = 0.0
+    deductions: list = field(default_factory=list)
+    references: list = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class IncentiveResult:
+    """Incentive of one sales person for one invoice"""
+    sales_person: str
+    commission_rate: float
+    commission_rate_decimal: float
+    allocated_percentage: float
+    incentives: float
+
+
+@dataclass(slots=True)
+class ReferenceResult:
+    """Calculated custom fields of one Payment Entry Reference row"""
+    name: str
+    invoice_name: str
+    tax_amount: float
+    net_without_tax: float
+    net_without_tax_without_deductions: float
+
+
+@dataclass(slots=True)
+class InvoiceResult:
+    """Net contribution of one invoice in the Payment Entry"""
+    invoice_name: str
+    allocated_amount: float
+    invoice_deduction: float
+    invoice_net_paid: float
+    total_taxes_and_charges: float
+    net_paid_after_all_deductions: float
+    tax_amount: float
+    incentives: list = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class ContributionResult:
+    """Result of the whole Payment Entry calculation"""
+    payment_entry: str
+    total_deductions: float
+    invoices: dict = field(default_factory=dict)
+    references: list = field(default_factory=list)
+
+
+# ============================================================================
+# SECTION 2: NUMERIC HELPERS
+# ============================================================================
+
+def to_amount(value):
+    """
+    Convert a value to float the way frappe.utils.flt does (without precision)
+
+    Args:
+        value: Number, numeric string (commas allowed) or None
+
+    Returns:
+        float: Converted value, 0.0 when it cannot be converted
+    """
+    if value is None or value == "":
+        return 0.0
+
+    if isinstance(value, str):
+        value = value.replace(",", "")
+
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def round_amount(value, precision=2):
+    """
+    Round like frappe.utils.flt(value, precision) with legacy banker's rounding
+
+    Values are first rounded to 8 decimals to avoid float noise, then an exact
+    half is rounded up.
+
+    Args:
+        value: Number to round
+        precision: Number of decimals
+
+    Returns:
+        float: Rounded value
+    """
+    multiplier = 10 ** precision
+    number = round(to_amount(value) * multiplier, 8)
+
+    floor_number = math.floor(number)
+    if number - floor_number == 0.5:
+        number = floor_number + 1
+    else:
+        number = round(number)
+
+    return number / multiplier
+
+
+# ============================================================================
+# SECTION 3: DEDUCTION DISTRIBUTION
+# ============================================================================
+
+def aggregate_references(references):
+    """
+    Sum allocated amounts per invoice, keeping first-seen invoice order
+
+    Args:
+        references: List of ReferenceInput
+
+    Returns:
+        dict: {invoice_name: total_allocated_amount}
+    """
+    invoice_allocations = {}
+    for reference in references:
+        if not reference.invoice_name:
+            continue
+        invoice_allocations[reference.invoice_name] = (
+            invoice_allocations.get(reference.invoice_name, 0)
+            + to_amount(reference.allocated_amount)
+        )
+    return invoice_allocations
+
+
+def calculate_total_deductions(deduction_amounts):
+    """
+    Sum deduction amounts
+
+    Args:
+        deduction_amounts: Iterable of deduction amounts
+
+    Returns:
+        float: Total deductions amount
+    """
+    return sum(to_amount(amount) for amount in deduction_amounts if amount)
+
+
+def distribute_deductions(invoice_allocations, total_deductions, total_paid):
+    """
+    Distribute deductions proportionally to each invoice based on allocated amount
+
+    Formula:
+    - deduction_ratio = invoice_allocated_amount / total_paid
+    - invoice_deduction = total_deductions * deduction_ratio
+
+    If total_paid is 0, distribute equally
+
+    Args:
+        invoice_allocations: dict {invoice_name: allocated_amount}
+        total_deductions: Total deductions amount
+        total_paid: Total paid amount
+
+    Returns:
+        dict: {invoice_name: deduction_amount}
+    """
+    if total_paid > 0:
+        return {
+            invoice_name: total_deductions * (allocated_amount / total_paid)
+            for invoice_name, allocated_amount in invoice_allocations.items()
+        }
+
+    if not invoice_allocations:
+        return {}
+
+    equal_deduction = total_deductions / len(invoice_allocations)
+    return {invoice_name: equal_deduction for invoice_name in invoice_allocations}
+
+
+# ============================================================================
+# SECTION 4: TAX AND NET CALCULATION
+# ============================================================================
+
+def calculate_tax_amount(grand_total, total_taxes_and_charges, allocated_amount):
+    """
+    Calculate tax amount from allocated amount based on invoice tax ratio
+
+    Formula:
+    - If grand_total > 0: tax_ratio = total_taxes_and_charges / grand_total
+    - tax_amount = allocated_amount * tax_ratio
+
+    Args:
+        grand_total: Invoice grand total
+        total_taxes_and_charges: Invoice total taxes
+        allocated_amount: Allocated amount
+
+    Returns:
+        float: Tax amount rounded to 2 decimals
+    """
+    grand_total = to_amount(grand_total)
+    if grand_total <= 0:
+        return 0.0
+
+    tax_ratio = to_amount(total_taxes_and_charges) / grand_total
+    return round_amount(allocated_amount * tax_ratio, 2)
+
+
+def calculate_reference_results(references, invoice, invoice_allocated, invoice_deduction):
+    """
+    Calculate custom fields for the reference rows of one invoice
+
+    Formula (per row, values split by the row's share of the invoice allocation):
+    - tax_amount = (total_taxes_and_charges / grand_total) * allocated_amount
+    - net_without_tax = allocated_amount - tax_amount
+    - net_without_tax_without_deductions = allocated_amount - tax_amount - deducted
+
+    Args:
+        references: List of ReferenceInput for this invoice
+        invoice: InvoiceInput
+        invoice_allocated: Total allocated amount for the invoice
+        invoice_deduction: Deduction amount for the invoice
+
+    Returns:
+        list: List of ReferenceResult (empty if nothing is allocated)
+    """
+    total_row_allocated = sum(to_amount(row.allocated_amount) for row in references)
+    if not references or total_row_allocated == 0:
+        return []
+
+    results = []
+    for row in references:
+        if total_row_allocated > 0:
+            ratio = to_amount(row.allocated_amount) / total_row_allocated
+            row_allocated = invoice_allocated * ratio
+            row_deduction = invoice_deduction * ratio
+        else:
+            # Negative totals (e.g. returns) are split equally
+            row_allocated = invoice_allocated / len(references)
+            row_deduction = invoice_deduction / len(references)
+
+        row_tax_amount = calculate_tax_amount(
+            invoice.grand_total, invoice.total_taxes_and_charges, row_allocated)
+
+        results.append(ReferenceResult(
+            name=row.name,
+            invoice_name=invoice.name,
+            tax_amount=round_amount(row_tax_amount, 2),
+            net_without_tax=round_amount(row_allocated - row_tax_amount, 2),
+            net_without_tax_without_deductions=round_amount(
+                row_allocated - row_tax_amount - row_deduction, 2),
+        ))
+
+    return results
+
+
+# ============================================================================
+# SECTION 5: INCENTIVE CALCULATION
+# ============================================================================
+
+def get_commission_rate_decimal(commission_rate):
+    """
+    Convert commission rate to decimal (rates greater than 1 are percentages)
+
+    Args:
+        commission_rate: Commission rate
+
+    Returns:
+        float: Commission rate as decimal
+    """
+    commission_rate = to_amount(commission_rate)
+    return commission_rate / 100 if commission_rate > 1 else commission_rate
+
+
+def calculate_incentives(sales_team, net_paid_after_all_deductions):
+    """
+    Calculate incentives for each sales person
+
+    Formula:
+    - incentives = commission_rate_decimal * net_paid_after_all_deductions
+
+    Args:
+        sales_team: List of SalesTeamMember
+        net_paid_after_all_deductions: Net amount the commission applies to
+
+    Returns:
+        list: List of IncentiveResult (members without sales_person are skipped)
+    """
+    results = []
+    for member in sales_team:
+        if not member.sales_person:
+            continue
+
+        commission_rate = to_amount(member.commission_rate)
+        commission_rate_decimal = get_commission_rate_decimal(commission_rate)
+
+        results.append(IncentiveResult(
+            sales_person=member.sales_person,
+            commission_rate=commission_rate,
+            commission_rate_decimal=commission_rate_decimal,
+            allocated_percentage=to_amount(member.allocated_percentage),
+            incentives=round_amount(
+                commission_rate_decimal * net_paid_after_all_deductions, 2),
+        ))
+
+    return results
+
+
+def calculate_invoice_contribution(invoice, allocated_amount, invoice_deduction):
+    """
+    Calculate net contribution and incentives for one invoice
+
+    Formula:
+    - invoice_net_paid = allocated_amount - invoice_deduction
+    - net_paid_after_all_deductions = invoice_net_paid - total_taxes_and_charges
+
+    Args:
+        invoice: InvoiceInput (with resolved sales_team)
+        allocated_amount: Allocated amount for this invoice
+        invoice_deduction: Deduction amount for this invoice
+
+    Returns:
+        InvoiceResult: Calculated values and incentives
+    """
+    total_taxes_and_charges = to_amount(invoice.total_taxes_and_charges)
+    invoice_net_paid = allocated_amount - invoice_deduction
+    net_paid_after_all_deductions = invoice_net_paid - total_taxes_and_charges
+
+    return InvoiceResult(
+        invoice_name=invoice.name,
+        allocated_amount=allocated_amount,
+        invoice_deduction=invoice_deduction,
+        invoice_net_paid=invoice_net_paid,
+        total_taxes_and_charges=total_taxes_and_charges,
+        net_paid_after_all_deductions=net_paid_after_all_deductions,
+        tax_amount=calculate_tax_amount(
+            invoice.grand_total, total_taxes_and_charges, allocated_amount),
+        incentives=calculate_incentives(
+            invoice.sales_team, net_paid_after_all_deductions),
+    )
+
+
+# ============================================================================
+# SECTION 6: PAYMENT ENTRY CALCULATION
+# ============================================================================
+
+def calculate_contribution(payment, invoices):
+    """
+    Calculate the full net contribution of a Payment Entry
+
+    Flow:
+    1. Aggregate allocated amounts per invoice
+    2. Sum and distribute deductions
+    3. Calculate net values and incentives per invoice
+    4. Calculate reference row custom fields
+
+    Args:
+        payment: PaymentInput
+        invoices: dict {invoice_name: InvoiceInput}; invoices missing here are skipped
+
+    Returns:
+        ContributionResult: Plain result structure
+    """
+    invoice_allocations = aggregate_references(payment.references)
+    total_deductions = calculate_total_deductions(payment.deductions)
+    invoice_deductions = distribute_deductions(
+        invoice_allocations, total_deductions, to_amount(payment.total_allocated_amount))
+
+    result = ContributionResult(
+        payment_entry=payment.name, total_deductions=total_deductions)
+
+    references_by_invoice = {}
+    for row in payment.references:
+        references_by_invoice.setdefault(row.invoice_name, []).append(row)
+
+    for invoice_name, allocated_amount in invoice_allocations.items():
+        invoice = invoices.get(invoice_name)
+        if invoice is None:
+            continue
+
+        invoice_deduction = invoice_deductions.get(invoice_name, 0)
+        result.invoices[invoice_name] = calculate_invoice_contribution(
+            invoice, allocated_amount, invoice_deduction)
+        result.references.extend(calculate_reference_results(
+            references_by_invoice[invoice_name],
+            invoice, allocated_amount, invoice_deduction
+        ))
+
+    return result
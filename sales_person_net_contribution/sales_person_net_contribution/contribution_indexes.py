@@ -0,0 +1,207 @@
+"""
+Contribution Indexes
+Composite indexes for the app's hot lookups and an EXPLAIN check that they are used
+
+The custom fields in custom/sales_team.json and custom/payment_entry_reference.json
+declare no indexes, so lookups by Payment Entry scan `tabSales Team` once
+invoices carry many payment rows. add_contribution_indexes() is run by the
+post_model_sync patch v1_0.add_contribution_indexes; it can be run again
+safely (existing indexes are kept).
+
+Check from the command line:
+    bench --site <site> execute sales_person_net_contribution.sales_person_net_contribution.contribution_indexes.check_contribution_indexes
+
+Structure:
+1. Index Functions
+2. EXPLAIN Check Functions
+"""
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, getdate, today
+
+from sales_person_net_contribution.sales_person_net_contribution.report.sales_commission.sales_commission import (
+    get_query as get_sales_commission_query,
+)
+
+# (doctype, fields, index name)
+CONTRIBUTION_INDEXES = (
+    # Cancel / recalculation: Sales Team rows written for a Payment Entry
+    ("Sales Team", ("custom_payment_entry", "parent"), "net_contribution_payment_entry_index"),
+    # Prefetch / fallback: Sales Team rows of an invoice, order or customer
+    ("Sales Team", ("parent", "parenttype"), "net_contribution_parent_index"),
+    # Payment Entries allocated to an invoice
+    ("Payment Entry Reference", ("reference_doctype", "reference_name", "parent"),
+     "net_contribution_reference_index"),
+    # Submitted invoices of a company in a date range (equality columns first)
+    ("Sales Invoice", ("docstatus", "company", "posting_date"), "net_contribution_posting_index"),
+)
+
+
+# ============================================================================
+# SECTION 1: INDEX FUNCTIONS
+# ============================================================================
+
+def add_contribution_indexes():
+    """
+    Create the composite indexes in CONTRIBUTION_INDEXES (skips existing ones)
+    """
+    for doctype, fields, index_name in CONTRIBUTION_INDEXES:
+        frappe.db.add_index(doctype, list(fields), index_name)
+
+
+# ============================================================================
+# SECTION 2: EXPLAIN CHECK FUNCTIONS
+# ============================================================================
+
+def get_sample_values():
+    """
+    Pick real values for the checked queries so the plans reflect site data
+
+    Returns:
+        frappe._dict: payment_entry, sales_invoice, company, from_date, to_date
+    """
+    payment_entry = frappe.db.get_value(
+        "Payment Entry", {"docstatus": 1, "payment_type": "Receive"}, "name",
+        order_by="creation desc")
+    sales_invoice = frappe.db.get_value(
+        "Sales Invoice", {"docstatus": 1}, ["name", "company"], as_dict=True,
+        order_by="creation desc") or frappe._dict()
+
+    return frappe._dict(
+        payment_entry=payment_entry or "",
+        sales_invoice=sales_invoice.get("name") or "",
+        company=sales_invoice.get("company") or frappe.defaults.get_user_default("Company") or "",
+        from_date=add_days(today(), -30),
+        to_date=getdate(today()),
+    )
+
+
+def get_index_checks(sample):
+    """
+    Build the queries whose plans are checked
+
+    Args:
+        sample: Values from get_sample_values
+
+    Returns:
+        list: [{"check", "table", "expected_index", "query", "params"}]
+              ("table" is the table or alias as shown by EXPLAIN)
+    """
+    report_query, report_params = get_sales_commission_query(frappe._dict(
+        from_date=sample.from_date, to_date=sample.to_date, company=sample.company))
+    all_companies_query, all_companies_params = get_sales_commission_query(frappe._dict(
+        from_date=sample.from_date, to_date=sample.to_date))
+
+    return [
+        {
+            "check": "sales_commission report",
+            "table": "l",
+            "expected_index": "company_invoice_posting_date_index",
+            "query": report_query,
+            "params": report_params,
+        },
+        {
+            "check": "sales_commission report without company filter",
+            "table": "l",
+            "expected_index": "invoice_posting_date_is_cancelled_index",
+            "query": all_companies_query,
+            "params": all_companies_params,
+        },
+        {
+            "check": "Sales Team rows of a Payment Entry (cancel / update)",
+            "table": "tabSales Team",
+            "expected_index": "net_contribution_payment_entry_index",
+            "query": """
+                SELECT name, parent FROM `tabSales Team`
+                WHERE custom_payment_entry = %(payment_entry)s
+            """,
+            "params": {"payment_entry": sample.payment_entry},
+        },
+        {
+            "check": "Sales Team rows of an invoice (prefetch)",
+            "table": "tabSales Team",
+            "expected_index": "net_contribution_parent_index",
+            "query": """
+                SELECT name, parent, sales_person, incentives, custom_payment_entry
+                FROM `tabSales Team`
+                WHERE parenttype = 'Sales Invoice' AND parentfield = 'sales_team'
+                    AND parent IN %(invoices)s
+            """,
+            "params": {"invoices": (sample.sales_invoice,)},
+        },
+        {
+            "check": "Payment Entry References of an invoice",
+            "table": "tabPayment Entry Reference",
+            "expected_index": "net_contribution_reference_index",
+            "query": """
+                SELECT parent, allocated_amount FROM `tabPayment Entry Reference`
+                WHERE reference_doctype = 'Sales Invoice' AND reference_name = %(sales_invoice)s
+            """,
+            "params": {"sales_invoice": sample.sales_invoice},
+        },
+        {
+            "check": "Submitted Sales Invoices of a company in a date range",
+            "table": "tabSales Invoice",
+            "expected_index": "net_contribution_posting_index",
+            "query": """
+                SELECT name FROM `tabSales Invoice`
+                WHERE docstatus = 1 AND company = %(company)s
+                    AND posting_date BETWEEN %(from_date)s AND %(to_date)s
+            """,
+            "params": {"company": sample.company, "from_date": sample.from_date,
+                       "to_date": sample.to_date},
+        },
+    ]
+
+
+def explain_query(query, params):
+    """
+    Get the MariaDB execution plan of a query
+
+    Args:
+        query: SQL query
+        params: Query parameters
+
+    Returns:
+        list: EXPLAIN rows (dicts with table, type, key, rows, Extra, ...)
+    """
+    return frappe.db.sql("EXPLAIN " + query, params, as_dict=True)
+
+
+@frappe.whitelist()
+def check_contribution_indexes():
+    """
+    EXPLAIN the report query and the cancel / update lookups and report the index used
+
+    A check passes when the checked table is not read with a full scan
+    (type "ALL"). The plan depends on table statistics: on an almost empty
+    site the optimizer may prefer a full scan or report "Impossible WHERE".
+
+    Returns:
+        list: [{"check", "table", "type", "key", "expected_index", "rows",
+                "extra", "uses_index", "uses_expected_index"}]
+    """
+    frappe.only_for("System Manager")
+
+    if frappe.db.db_type != "mariadb":
+        frappe.throw(_("The index check supports MariaDB only"))
+
+    results = []
+    for check in get_index_checks(get_sample_values()):
+        plan = explain_query(check["query"], check["params"])
+        row = next((row for row in plan if row.get("table") == check["table"]), {})
+
+        results.append({
+            "check": check["check"],
+            "table": check["table"],
+            "type": row.get("type"),
+            "key": row.get("key"),
+            "expected_index": check["expected_index"],
+            "rows": row.get("rows"),
+            "extra": row.get("Extra"),
+            "uses_index": bool(row.get("key")) and row.get("type") != "ALL",
+            "uses_expected_index": row.get("key") == check["expected_index"],
+        })
+
+    return results
@@ -0,0 +1,327 @@
+"""
+Sales Person Contribution Ledger
+Append-only ledger of net contribution and incentives per sales person, invoice and Payment Entry
+
+Entries are written when a submitted Payment Entry is calculated (submit hook,
+background job, button, bulk and batch recalculation) and reversed when it is
+cancelled. Like GL Entry, a reversal marks the original rows is_cancelled = 1
+and appends negated rows, so active contributions are "is_cancelled = 0".
+Every write invalidates the cached sales_commission results of the touched
+company and invoice posting dates (after the commit, see report_cache).
+Reports and payroll queries read the ledger with indexed scans instead of
+joining Sales Invoice, Payment Entry Reference and Payment Entry over the
+whole history.
+Entries of receipts submitted before the ledger existed are filled by a
+background backfill; until it finished, is_backfill_pending() is set.
+
+Structure:
+1. Row Functions
+2. Writer Functions
+3. Hook Functions
+4. Aggregate API
+5. Backfill State
+"""
+
+import frappe
+from frappe import _
+from frappe.utils import cint, flt, getdate, now_datetime
+
+from sales_person_net_contribution.sales_person_net_contribution import report_cache
+
+LEDGER_DOCTYPE = "Sales Person Contribution Ledger"
+
+# Data fields of a ledger row (in insert order)
+LEDGER_FIELDS = (
+    "sales_person", "sales_invoice", "payment_entry", "posting_date",
+    "invoice_posting_date", "company", "customer",
+    "allocated_amount", "net_base", "commission_rate", "incentive",
+)
+
+# Fields negated in reversal rows
+LEDGER_AMOUNT_FIELDS = ("allocated_amount", "net_base", "incentive")
+
+# Allowed groupings / date fields of the aggregate API
+LEDGER_GROUP_BY_FIELDS = ("sales_person", "sales_invoice", "payment_entry", "customer", "company")
+LEDGER_DATE_FIELDS = ("posting_date", "invoice_posting_date")
+
+# Global default set while the ledger backfill has not finished
+BACKFILL_PENDING_KEY = "sales_person_net_contribution_ledger_backfill_pending"
+
+
+# ============================================================================
+# SECTION 1: ROW FUNCTIONS
+# ============================================================================
+
+def make_ledger_row(payment_entry_name, posting_date, sales_invoice, sales_person,
+                    commission_rate, allocated_amount, net_base, incentive):
+    """
+    Build one ledger row
+
+    Args:
+        payment_entry_name: Name of Payment Entry
+        posting_date: Payment Entry posting date
+        sales_invoice: Invoice context (see payment_entry.prefetch_invoice_context)
+        sales_person: Sales Person name
+        commission_rate: Commission rate used for the incentive
+        allocated_amount: Amount of the Payment Entry allocated to the invoice
+        net_base: Net paid after all deductions (commission base)
+        incentive: Calculated incentive
+
+    Returns:
+        frappe._dict: Ledger row values (LEDGER_FIELDS)
+    """
+    return frappe._dict(
+        sales_person=sales_person,
+        sales_invoice=sales_invoice.name,
+        payment_entry=payment_entry_name,
+        posting_date=getdate(posting_date),
+        invoice_posting_date=sales_invoice.get('posting_date'),
+        company=sales_invoice.get('company'),
+        customer=sales_invoice.get('customer'),
+        allocated_amount=flt(allocated_amount),
+        net_base=flt(net_base),
+        commission_rate=flt(commission_rate),
+        incentive=flt(incentive),
+    )
+
+
+def get_ledger_signature(rows):
+    """
+    Describe ledger rows independent of order and float noise
+
+    Args:
+        rows: Iterable of ledger rows
+
+    Returns:
+        list: Sorted tuples of the compared values
+    """
+    return sorted(
+        (
+            row.sales_invoice, row.sales_person, str(getdate(row.posting_date)),
+            flt(row.allocated_amount, 2), flt(row.net_base, 2),
+            flt(row.commission_rate, 6), flt(row.incentive, 2),
+        )
+        for row in rows
+    )
+
+
+# ============================================================================
+# SECTION 2: WRITER FUNCTIONS
+# ============================================================================
+
+def get_active_ledger_entries(payment_entry_names):
+    """
+    Load the active (not cancelled) ledger rows of Payment Entries in one query
+
+    Args:
+        payment_entry_names: Iterable of Payment Entry names
+
+    Returns:
+        dict: {payment_entry_name: [ledger rows]}
+    """
+    payment_entry_names = tuple(dict.fromkeys(payment_entry_names))
+    if not payment_entry_names:
+        return {}
+
+    rows = frappe.db.sql("""
+        SELECT name, {fields}
+        FROM `tab{doctype}`
+        WHERE payment_entry IN %(payment_entries)s AND is_cancelled = 0
+    """.format(fields=", ".join(LEDGER_FIELDS), doctype=LEDGER_DOCTYPE),
+        {"payment_entries": payment_entry_names}, as_dict=True)
+
+    active_entries = {name: [] for name in payment_entry_names}
+    for row in rows:
+        active_entries[row.payment_entry].append(row)
+
+    return active_entries
+
+
+def insert_ledger_entries(rows, is_cancelled=0):
+    """
+    Append ledger rows with one bulk INSERT
+
+    Args:
+        rows: List of ledger rows (see make_ledger_row)
+        is_cancelled: 1 for reversal rows
+    """
+    if not rows:
+        return
+
+    timestamp = now_datetime()
+    user = frappe.session.user
+    fields = ["name", "creation", "modified", "modified_by", "owner", "docstatus",
+              "idx", "is_cancelled", *LEDGER_FIELDS]
+
+    values = [
+        (frappe.generate_hash(length=10), timestamp, timestamp, user, user, 0, 0, is_cancelled,
+         *(row.get(fieldname) for fieldname in LEDGER_FIELDS))
+        for row in rows
+    ]
+
+    frappe.db.bulk_insert(LEDGER_DOCTYPE, fields, values)
+
+    report_cache.invalidate_report_cache_after_commit(
+        (row.get('company'), row.get('invoice_posting_date')) for row in rows)
+
+
+def reverse_ledger_entries(active_rows):
+    """
+    Reverse ledger rows: mark them cancelled and append negated rows
+
+    Args:
+        active_rows: Ledger rows with "name" (see get_active_ledger_entries)
+    """
+    if not active_rows:
+        return
+
+    frappe.db.sql("""
+        UPDATE `tab{doctype}`
+        SET is_cancelled = 1, modified = %(modified)s, modified_by = %(user)s
+        WHERE name IN %(names)s
+    """.format(doctype=LEDGER_DOCTYPE), {
+        "modified": now_datetime(),
+        "user": frappe.session.user,
+        "names": tuple(row.name for row in active_rows),
+    })
+
+    reversal_rows = []
+    for row in active_rows:
+        reversal_row = frappe._dict(row)
+        for fieldname in LEDGER_AMOUNT_FIELDS:
+            reversal_row[fieldname] = -flt(row.get(fieldname))
+        reversal_rows.append(reversal_row)
+
+    insert_ledger_entries(reversal_rows, is_cancelled=1)
+
+
+def replace_ledger_entries(payment_entry_name, rows, active_rows=None):
+    """
+    Make the active ledger rows of a Payment Entry equal to the calculated rows
+
+    Nothing is written when they already match; otherwise the active rows are
+    reversed and the calculated rows appended.
+
+    Args:
+        payment_entry_name: Name of Payment Entry
+        rows: Calculated ledger rows (see make_ledger_row)
+        active_rows: Optional preloaded active rows of this Payment Entry
+
+    Returns:
+        bool: True if the ledger was changed
+    """
+    if active_rows is None:
+        active_rows = get_active_ledger_entries([payment_entry_name]).get(payment_entry_name, [])
+
+    if get_ledger_signature(active_rows) == get_ledger_signature(rows):
+        return False
+
+    reverse_ledger_entries(active_rows)
+    insert_ledger_entries(rows)
+
+    return True
+
+
+def cancel_ledger_entries(payment_entry_name):
+    """
+    Reverse all active ledger rows of a Payment Entry
+
+    Args:
+        payment_entry_name: Name of Payment Entry
+
+    Returns:
+        int: Number of reversed rows
+    """
+    active_rows = get_active_ledger_entries([payment_entry_name]).get(payment_entry_name, [])
+    reverse_ledger_entries(active_rows)
+    return len(active_rows)
+
+
+# ============================================================================
+# SECTION 3: HOOK FUNCTIONS
+# ============================================================================
+
+def on_payment_entry_trash(doc, method=None):
+    """
+    Hook: delete the ledger rows of a deleted (cancelled or draft) Payment Entry
+    """
+    frappe.db.delete(LEDGER_DOCTYPE, {"payment_entry": doc.name})
+
+
+# ============================================================================
+# SECTION 4: AGGREGATE API
+# ============================================================================
+
+@frappe.whitelist()
+def get_sales_person_contributions(from_date, to_date, company=None, sales_person=None,
+                                   group_by="sales_person", based_on="posting_date"):
+    """
+    Aggregate active ledger rows for a date range
+
+    Args:
+        from_date: Start date
+        to_date: End date
+        company: Optional company
+        sales_person: Optional Sales Person
+        group_by: One of LEDGER_GROUP_BY_FIELDS
+        based_on: "posting_date" (Payment Entry) or "invoice_posting_date"
+
+    Returns:
+        list: [{group_by, "net_base", "incentive", "allocated_amount",
+                "invoice_count", "payment_entry_count"}]
+    """
+    frappe.has_permission(LEDGER_DOCTYPE, "read", throw=True)
+
+    if group_by not in LEDGER_GROUP_BY_FIELDS:
+        frappe.throw(_("Invalid group by: {0}").format(group_by))
+    if based_on not in LEDGER_DATE_FIELDS:
+        frappe.throw(_("Invalid date field: {0}").format(based_on))
+
+    conditions = [f"{based_on} BETWEEN %(from_date)s AND %(to_date)s", "is_cancelled = 0"]
+    params = {"from_date": getdate(from_date), "to_date": getdate(to_date)}
+
+    if company:
+        conditions.append("company = %(company)s")
+        params["company"] = company
+    if sales_person:
+        conditions.append("sales_person = %(sales_person)s")
+        params["sales_person"] = sales_person
+
+    return frappe.db.sql("""
+        SELECT
+            {group_by},
+            SUM(net_base) AS net_base,
+            SUM(incentive) AS incentive,
+            SUM(allocated_amount) AS allocated_amount,
+            COUNT(DISTINCT sales_invoice) AS invoice_count,
+            COUNT(DISTINCT payment_entry) AS payment_entry_count
+        FROM `tab{doctype}`
+        WHERE {conditions}
+        GROUP BY {group_by}
+        ORDER BY incentive DESC
+    """.format(group_by=group_by, doctype=LEDGER_DOCTYPE, conditions=" AND ".join(conditions)),
+        params, as_dict=True)
+
+
+# ============================================================================
+# SECTION 5: BACKFILL STATE
+# ============================================================================
+
+def set_backfill_pending(pending):
+    """
+    Mark the ledger backfill as queued (True) or finished (False)
+
+    Args:
+        pending: bool
+    """
+    frappe.db.set_global(BACKFILL_PENDING_KEY, 1 if pending else 0)
+
+
+def is_backfill_pending():
+    """
+    Check whether the ledger may still miss rows of older receipts
+
+    Returns:
+        bool: True until the backfill finished
+    """
+    return bool(cint(frappe.db.get_global(BACKFILL_PENDING_KEY)))
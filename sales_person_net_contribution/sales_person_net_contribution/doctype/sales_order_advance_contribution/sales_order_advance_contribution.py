@@ -0,0 +1,15 @@
+# Copyright (c) 2026, abdopcnet@gmail.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class SalesOrderAdvanceContribution(Document):
+	pass
+
+
+def on_doctype_update():
+	"""Composite indexes for recording and attribution lookups"""
+	frappe.db.add_index("Sales Order Advance Contribution", ["sales_order", "status"])
+	frappe.db.add_index("Sales Order Advance Contribution", ["payment_entry", "status"])
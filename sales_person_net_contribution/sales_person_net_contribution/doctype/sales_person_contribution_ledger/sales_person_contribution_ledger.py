@@ -0,0 +1,24 @@
+# Copyright (c) 2026, abdopcnet@gmail.com and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+
+
+class SalesPersonContributionLedger(Document):
+	def validate(self):
+		# Append-only: entries are reversed by new rows, never edited
+		if not self.is_new():
+			frappe.throw(_("Sales Person Contribution Ledger entries cannot be modified"))
+
+
+def on_doctype_update():
+	"""Composite indexes for the report and aggregate APIs"""
+	frappe.db.add_index("Sales Person Contribution Ledger", ["company", "invoice_posting_date"])
+	# sales_commission without a company filter: range scan on the invoice date
+	frappe.db.add_index("Sales Person Contribution Ledger", ["invoice_posting_date", "is_cancelled"])
+	frappe.db.add_index("Sales Person Contribution Ledger", ["sales_person", "invoice_posting_date"])
+	frappe.db.add_index("Sales Person Contribution Ledger", ["company", "posting_date"])
+	frappe.db.add_index("Sales Person Contribution Ledger", ["sales_person", "posting_date"])
+	frappe.db.add_index("Sales Person Contribution Ledger", ["payment_entry", "is_cancelled"])
@@ -8,13 +8,69 @@ Structure:
 3. Deduction Distribution Functions
 4. Invoice Processing Functions (per case)
 5. Sales Team Update Functions
-6. Main Calculation Function
-7. Hook Functions (on_validate, on_submit, on_cancel)
+6. Payment Entry References Update Functions
+7. Single Invoice Processing Function
+8. Message Generation Functions
+9. Input Fingerprint Functions
+10. Main Calculation Function
+11. Hook Functions (on_validate, on_submit, on_cancel)
+12. Async Submit Functions
+13. Contribution Ledger Functions
+14. Sales Order Advance Functions
 """
 
+import hashlib
+import json
+from contextlib import contextmanager
+from functools import partial
+
 import frappe
 from frappe import _
-from frappe.utils import flt
+from frappe.utils import cint, flt, getdate, now_datetime
+
+from sales_person_net_contribution.sales_person_net_contribution import (
+    advance_contribution,
+    contribution_engine,
+    contribution_ledger,
+    pipeline_profiler,
+    sales_team_cache as shared_sales_team_cache,
+)
+
+# Invoices whose Sales Team changes are written by one set of bulk statements
+SALES_TEAM_WRITE_CHUNK_SIZE = 500
+
+# Payment Entry field storing the input fingerprint of the last calculation
+FINGERPRINT_FIELD = "custom_net_contribution_fingerprint"
+
+# Bump when the calculation changes so stored fingerprints stop matching
+FINGERPRINT_VERSION = 1
+
+# Site config: process every submit in the background
+ASYNC_SUBMIT_CONFIG_KEY = "sales_person_net_contribution_async_submit"
+
+# Site config: process submits with more references than this in the background
+ASYNC_REFERENCE_THRESHOLD_CONFIG_KEY = "sales_person_net_contribution_async_reference_threshold"
+
+# Dedicated RQ queue (configure it under "workers" in common_site_config.json);
+# "short" is used when no worker listens on it
+ASYNC_SUBMIT_QUEUE = "net_contribution"
+
+# Redis key prefix "<prefix>:<root Payment Entry name>" -> latest submitted amendment
+ASYNC_SUBMIT_CACHE_KEY = "sales_person_net_contribution:async_submit"
+
+# Redis key prefix "<prefix>:<root Payment Entry name>" held by the job of a chain
+ASYNC_SUBMIT_LOCK_KEY = "sales_person_net_contribution:async_submit_lock"
+
+# Seconds the chain lock is held at most (a killed job never blocks a chain longer)
+ASYNC_SUBMIT_LOCK_TTL = 15 * 60
+
+# Delete a key only while it still holds the given value (atomic compare-and-delete)
+COMPARE_AND_DELETE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
 
 
 # ============================================================================
@@ -133,24 +189,108 @@ def analyze_payment_entry_references(payment_entry):
     reference_rows_count = sum(1 for r in payment_entry.references
                                if r.reference_doctype == "Sales Invoice" and r.reference_name)
 
-    if invoice_count == 0:
-        case_type = "no_invoices"
-    elif invoice_count == 1:
-        if reference_rows_count == 1:
-            case_type = "single_invoice"
-        else:
-            case_type = "single_invoice_multiple_rows"
-    else:
-        case_type = "multiple_invoices"
-
     return {
         "sales_invoice_references": sales_invoice_references,
         "sales_order_references": sales_order_references,
-        "case_type": case_type,
+        "case_type": get_case_type(invoice_count, reference_rows_count),
         "reference_rows_count": reference_rows_count
     }
 
 
+def get_case_type(invoice_count, reference_rows_count):
+    """
+    Determine case type from the number of invoices and Sales Invoice reference rows
+
+    Args:
+        invoice_count: Number of distinct Sales Invoices
+        reference_rows_count: Number of Sales Invoice reference rows
+
+    Returns:
+        str: "no_invoices" | "single_invoice" | "single_invoice_multiple_rows" | "multiple_invoices"
+    """
+    if invoice_count == 0:
+        return "no_invoices"
+    if invoice_count == 1:
+        if reference_rows_count == 1:
+            return "single_invoice"
+        return "single_invoice_multiple_rows"
+    return "multiple_invoices"
+
+
+def prefetch_invoice_context(invoice_names):
+    """
+    Load header fields and Sales Team rows for referenced Sales Invoices in two queries
+
+    The returned context replaces full Sales Invoice documents for everything
+    the calculation reads (totals, currency, customer, Sales Team, Sales Order).
+
+    Args:
+        invoice_names: Iterable of Sales Invoice names
+
+    Returns:
+        dict: {invoice_name: frappe._dict} with header fields, "sales_order"
+              (first linked Sales Order) and "sales_team" (list of rows ordered by idx)
+    """
+    invoice_names = tuple(dict.fromkeys(name for name in invoice_names if name))
+    if not invoice_names:
+        return {}
+
+    invoices = frappe.db.sql("""
+        SELECT
+            si.name, si.customer, si.customer_name, si.company, si.currency,
+            si.posting_date, si.grand_total, si.total_taxes_and_charges, si.docstatus, si.modified,
+            (SELECT sii.sales_order FROM `tabSales Invoice Item` sii
+             WHERE sii.parent = si.name AND sii.parenttype = 'Sales Invoice'
+                AND IFNULL(sii.sales_order, '') != ''
+             ORDER BY sii.idx LIMIT 1) AS sales_order
+        FROM `tabSales Invoice` si
+        WHERE si.name IN %(invoices)s
+    """, {"invoices": invoice_names}, as_dict=True)
+
+    invoice_context = {}
+    for invoice in invoices:
+        invoice.sales_team = []
+        invoice_context[invoice.name] = invoice
+
+    if not invoice_context:
+        return invoice_context
+
+    sales_team_rows = frappe.db.sql("""
+        SELECT
+            name, parent, idx, sales_person, commission_rate, allocated_percentage,
+            incentives, custom_payment_entry, custom_date
+        FROM `tabSales Team`
+        WHERE parenttype = 'Sales Invoice' AND parentfield = 'sales_team'
+            AND parent IN %(invoices)s
+        ORDER BY parent, idx
+    """, {"invoices": tuple(invoice_context)}, as_dict=True)
+
+    for row in sales_team_rows:
+        invoice_context[row.parent].sales_team.append(row)
+
+    return invoice_context
+
+
+def get_invoice_context(invoice_context, invoice_name):
+    """
+    Get context for one invoice, prefetching it if it is not in the context yet
+
+    Args:
+        invoice_context: dict from prefetch_invoice_context (or None)
+        invoice_name: Name of Sales Invoice
+
+    Returns:
+        frappe._dict: Invoice context, or None if the invoice does not exist
+    """
+    if invoice_context is None:
+        invoice_context = {}
+
+    if invoice_name not in invoice_context:
+        invoice_context.update(prefetch_invoice_context([invoice_name]))
+
+    return invoice_context.get(invoice_name)
+
+
 # ============================================================================
 # SECTION 3: DEDUCTION DISTRIBUTION FUNCTIONS
 # ============================================================================
@@ -171,15 +311,8 @@ def calculate_total_deductions(payment_entry):
     Returns:
         float: Total deductions amount
     """
-    total_deductions = 0
-    if payment_entry.deductions:
-        for deduction in payment_entry.deductions:
-            if deduction.amount:
-                try:
-                    total_deductions += flt(deduction.amount)
-                except (ValueError, TypeError):
-                    pass
-    return total_deductions
+    return contribution_engine.calculate_total_deductions(
+        deduction.amount for deduction in payment_entry.deductions or [])
 
 
 def distribute_deductions_to_invoices(sales_invoice_references, total_deductions, total_paid):
@@ -200,22 +333,8 @@ def distribute_deductions_to_invoices(sales_invoice_references, total_deductions
     Returns:
         dict: {invoice_name: deduction_amount}
     """
-    invoice_deductions = {}
-
-    if total_paid > 0:
-        # Proportional distribution
-        for invoice_name, allocated_amount in sales_invoice_references.items():
-            deduction_ratio = allocated_amount / total_paid
-            invoice_deductions[invoice_name] = total_deductions * \
-                deduction_ratio
-    else:
-        # Equal distribution if total_paid is 0
-        if len(sales_invoice_references) > 0:
-            equal_deduction = total_deductions / len(sales_invoice_references)
-            for invoice_name in sales_invoice_references.keys():
-                invoice_deductions[invoice_name] = equal_deduction
-
-    return invoice_deductions
+    return contribution_engine.distribute_deductions(
+        sales_invoice_references, total_deductions, total_paid)
 
 
 # ============================================================================
@@ -223,7 +342,8 @@ def distribute_deductions_to_invoices(sales_invoice_references, total_deductions
 # ============================================================================
 
 def process_single_invoice_case(payment_entry, payment_entry_name, invoice_name,
-                                allocated_amount, invoice_deduction):
+                                allocated_amount, invoice_deduction,
+                                invoice_context=None, sales_team_cache=None):
     """
     Process Case 1: Single invoice in Payment Entry
 
@@ -233,20 +353,24 @@ def process_single_invoice_case(payment_entry, payment_entry_name, invoice_name,
         invoice_name: Name of Sales Invoice
         allocated_amount: Allocated amount for this invoice
         invoice_deduction: Deduction amount for this invoice
+        invoice_context: Optional dict from prefetch_invoice_context
+        sales_team_cache: Optional dict shared across calls (see get_original_sales_team)
 
     Returns:
-        dict: Result with status, message, and details
+        dict: Result with status, values and reference_values (or error)
     """
     invoice_net_paid = allocated_amount - invoice_deduction
     return process_single_invoice(
         payment_entry, payment_entry_name, invoice_name,
-        allocated_amount, invoice_deduction, invoice_net_paid
+        allocated_amount, invoice_deduction, invoice_net_paid,
+        invoice_context=invoice_context, sales_team_cache=sales_team_cache
     )
 
 
 def process_single_invoice_multiple_rows_case(payment_entry, payment_entry_name,
                                               invoice_name, total_allocated_amount,
-                                              invoice_deduction):
+                                              invoice_deduction, invoice_context=None,
+                                              sales_team_cache=None):
     """
     Process Case 2: Single invoice in multiple rows (same invoice repeated)
 
@@ -258,65 +382,83 @@ def process_single_invoice_multiple_rows_case(payment_entry, payment_entry_name,
         invoice_name: Name of Sales Invoice
         total_allocated_amount: Total allocated amount (sum of all rows)
         invoice_deduction: Deduction amount for this invoice
+        invoice_context: Optional dict from prefetch_invoice_context
+        sales_team_cache: Optional dict shared across calls (see get_original_sales_team)
 
     Returns:
-        dict: Result with status, message, and details
+        dict: Result with status, values and reference_values (or error)
     """
     invoice_net_paid = total_allocated_amount - invoice_deduction
     return process_single_invoice(
         payment_entry, payment_entry_name, invoice_name,
-        total_allocated_amount, invoice_deduction, invoice_net_paid
+        total_allocated_amount, invoice_deduction, invoice_net_paid,
+        invoice_context=invoice_context, sales_team_cache=sales_team_cache
     )
 
 
 def process_multiple_invoices_case(payment_entry, payment_entry_name,
-                                   sales_invoice_references, invoice_deductions):
+                                   sales_invoice_references, invoice_deductions,
+                                   invoice_context=None, sales_team_cache=None):
     """
     Process Case 3: Multiple different invoices in Payment Entry
 
+    Every invoice is calculated from the prefetched context first; the Sales
+    Team changes of all invoices are then written together (see
+    write_invoice_results), so the number of queries does not grow with the
+    number of invoices.
+
     Args:
         payment_entry: Payment Entry document
         payment_entry_name: Name of Payment Entry
         sales_invoice_references: dict {invoice_name: allocated_amount}
         invoice_deductions: dict {invoice_name: deduction_amount}
+        invoice_context: Optional dict from prefetch_invoice_context
+        sales_team_cache: Optional dict shared across calls (see get_original_sales_team)
 
     Returns:
-        dict: Aggregated result with status, message, and details
+        dict: Aggregated result with status, values and reference_values
     """
     results = []
 
+    if invoice_context is None:
+        invoice_context = prefetch_invoice_context(sales_invoice_references)
+
+    reference_rows_by_invoice = get_reference_rows_by_invoice(payment_entry)
+
     for invoice_name, allocated_amount in sales_invoice_references.items():
         invoice_deduction = invoice_deductions.get(invoice_name, 0)
         invoice_net_paid = allocated_amount - invoice_deduction
 
-        result = process_single_invoice(
+        result = prepare_single_invoice(
             payment_entry, payment_entry_name, invoice_name,
-            allocated_amount, invoice_deduction, invoice_net_paid
+            allocated_amount, invoice_deduction, invoice_net_paid,
+            invoice_context=invoice_context, sales_team_cache=sales_team_cache,
+            reference_rows=reference_rows_by_invoice.get(invoice_name, [])
         )
         results.append(result)
 
-    # Build aggregated message
-    message_parts = []
+    write_invoice_results(results)
+
+    # Aggregate results
     total_updated_persons = 0
     success_count = 0
+    reference_values = {}
 
-    for i, result in enumerate(results, 1):
+    for result in results:
         if result.get("status") == "success":
             success_count += 1
-            message_parts.append(
-                f"<b>Invoice {i}: {result['invoice_name']}</b><br>")
-            message_parts.append(result["message"])
-            message_parts.append("<br>")
+            reference_values.update(result.get("reference_values") or {})
             total_updated_persons += result.get("updated_persons", 0)
-        else:
-            message_parts.append(
-                f"<b>Error in Invoice {i}: {result.get('invoice_name', 'Unknown')}</b><br>")
-            message_parts.append(result.get("error", "Unknown error"))
-            message_parts.append("<br>")
+
+    errors = [
+        f"{result.get('invoice_name', 'Unknown')}: {result.get('error', 'Unknown error')}"
+        for result in results if result.get("status") != "success"
+    ]
 
     return {
         "status": "success" if success_count > 0 else "error",
-        "message": "".join(message_parts),
+        "error": "; ".join(errors) if not success_count else None,
+        "reference_values": reference_values,
         "values": {
             "total_invoices": len(results),
             "success_invoices": success_count,
@@ -326,10 +468,71 @@ def process_multiple_invoices_case(payment_entry, payment_entry_name,
     }
 
 
+def process_invoices(payment_entry, payment_entry_name, case_type,
+                     sales_invoice_references, invoice_deductions,
+                     invoice_context=None, sales_team_cache=None):
+    """
+    Process the referenced invoices with the processor of the case type
+
+    Args:
+        payment_entry: Payment Entry document
+        payment_entry_name: Name of Payment Entry
+        case_type: "single_invoice", "single_invoice_multiple_rows" or "multiple_invoices"
+        sales_invoice_references: dict {invoice_name: allocated_amount}
+        invoice_deductions: dict {invoice_name: deduction_amount}
+        invoice_context: Optional dict from prefetch_invoice_context
+        sales_team_cache: Optional dict shared across calls (see get_original_sales_team)
+
+    Returns:
+        dict: Result of the case processor
+    """
+    if case_type == "multiple_invoices":
+        return process_multiple_invoices_case(
+            payment_entry, payment_entry_name,
+            sales_invoice_references, invoice_deductions,
+            invoice_context=invoice_context, sales_team_cache=sales_team_cache
+        )
+
+    invoice_name, allocated_amount = next(iter(sales_invoice_references.items()))
+    processor = process_single_invoice_multiple_rows_case \
+        if case_type == "single_invoice_multiple_rows" else process_single_invoice_case
+
+    return processor(
+        payment_entry, payment_entry_name, invoice_name,
+        allocated_amount, invoice_deductions.get(invoice_name, 0),
+        invoice_context=invoice_context, sales_team_cache=sales_team_cache
+    )
+
+
 # ============================================================================
 # SECTION 5: SALES TEAM UPDATE FUNCTIONS
 # ============================================================================
 
+def collect_sales_team_members(sales_team_rows):
+    """
+    Build unique sales team member list from Sales Team rows
+
+    Args:
+        sales_team_rows: Iterable of Sales Team rows (documents or dicts)
+
+    Returns:
+        list: List of sales team members with their details
+    """
+    original_sales_team = []
+    seen_sales_persons = set()
+
+    for sales_person_row in sales_team_rows or []:
+        if sales_person_row.get('sales_person') and sales_person_row.get('sales_person') not in seen_sales_persons:
+            original_sales_team.append({
+                'sales_person': sales_person_row.get('sales_person'),
+                'commission_rate': sales_person_row.get('commission_rate'),
+                'allocated_percentage': sales_person_row.get('allocated_percentage'),
+            })
+            seen_sales_persons.add(sales_person_row.get('sales_person'))
+
+    return original_sales_team
+
+
 def get_sales_team_from_invoice(sales_invoice):
     """
     Get Sales Team from Sales Invoice (Priority 1)
@@ -343,104 +546,125 @@ def get_sales_team_from_invoice(sales_invoice):
     - custom_date: Custom field for Payment Entry date
 
     Args:
-        sales_invoice: Sales Invoice document
+        sales_invoice: Invoice context (see prefetch_invoice_context) or Sales Invoice document
 
     Returns:
         list: List of sales team members with their details
     """
-    original_sales_team = []
-    seen_sales_persons = set()
+    if sales_invoice.get('sales_team'):
+        return collect_sales_team_members(sales_invoice.sales_team)
 
-    if hasattr(sales_invoice, 'sales_team') and sales_invoice.sales_team:
-        for sales_person_row in sales_invoice.sales_team:
-            if sales_person_row.sales_person and sales_person_row.sales_person not in seen_sales_persons:
-                original_sales_team.append({
-                    'sales_person': sales_person_row.sales_person,
-                    'commission_rate': sales_person_row.commission_rate,
-                    'allocated_percentage': sales_person_row.allocated_percentage,
-                })
-                seen_sales_persons.add(sales_person_row.sales_person)
+    return []
 
-    return original_sales_team
+
+def get_sales_team_rows(parenttype, parent):
+    """
+    Read Sales Team rows of a parent document without loading the document
+
+    Args:
+        parenttype: Parent DocType (Sales Order, Customer)
+        parent: Parent document name
+
+    Returns:
+        list: Sales Team rows ordered by idx
+    """
+    return frappe.db.sql("""
+        SELECT sales_person, commission_rate, allocated_percentage
+        FROM `tabSales Team`
+        WHERE parenttype = %(parenttype)s AND parent = %(parent)s
+        ORDER BY idx
+    """, {"parenttype": parenttype, "parent": parent}, as_dict=True)
+
+
+def resolve_sales_team(parenttype, parent):
+    """
+    Resolve the Sales Team of a Sales Order / Customer from the database
+
+    Args:
+        parenttype: Parent DocType (Sales Order, Customer)
+        parent: Parent document name
+
+    Returns:
+        list: List of sales team members with their details
+    """
+    return collect_sales_team_members(get_sales_team_rows(parenttype, parent))
 
 
-def get_sales_team_from_sales_order(sales_invoice):
+def get_sales_team_from_sales_order(sales_invoice, sales_team_cache=None):
     """
     Get Sales Team from Sales Order (Priority 2)
 
+    Resolved through the per-call dict and the shared Sales Team cache
+    (see sales_team_cache.py).
+
     Args:
-        sales_invoice: Sales Invoice document
+        sales_invoice: Invoice context (see prefetch_invoice_context) or Sales Invoice document
+        sales_team_cache: Optional dict {(doctype, name): sales_team} shared across calls
 
     Returns:
         list: List of sales team members with their details
     """
     original_sales_team = []
-    seen_sales_persons = set()
 
-    if sales_invoice.get('items'):
-        sales_order_name = None
-        for item in sales_invoice.items:
+    sales_order_name = sales_invoice.get('sales_order')
+    if not sales_order_name:
+        for item in sales_invoice.get('items') or []:
             if item.sales_order:
                 sales_order_name = item.sales_order
                 break
 
-        if sales_order_name:
-            try:
-                sales_order = frappe.get_doc("Sales Order", sales_order_name)
-                if hasattr(sales_order, 'sales_team') and sales_order.sales_team:
-                    for sales_person_row in sales_order.sales_team:
-                        if sales_person_row.sales_person and sales_person_row.sales_person not in seen_sales_persons:
-                            original_sales_team.append({
-                                'sales_person': sales_person_row.sales_person,
-                                'commission_rate': sales_person_row.commission_rate,
-                                'allocated_percentage': sales_person_row.allocated_percentage,
-                            })
-                            seen_sales_persons.add(
-                                sales_person_row.sales_person)
-            except frappe.DoesNotExistError:
-                pass
+    if sales_order_name:
+        cache_key = ("Sales Order", sales_order_name)
+        if sales_team_cache is not None and cache_key in sales_team_cache:
+            return list(sales_team_cache[cache_key])
+
+        original_sales_team = shared_sales_team_cache.get_cached_sales_team(
+            "Sales Order", sales_order_name, resolve_sales_team)
+
+        if sales_team_cache is not None:
+            sales_team_cache[cache_key] = original_sales_team
 
     return original_sales_team
 
 
-def get_sales_team_from_customer(sales_invoice):
+def get_sales_team_from_customer(sales_invoice, sales_team_cache=None):
     """
     Get Sales Team from Customer (Priority 3)
 
+    Resolved through the per-call dict and the shared Sales Team cache
+    (see sales_team_cache.py).
+
     Args:
-        sales_invoice: Sales Invoice document
+        sales_invoice: Invoice context (see prefetch_invoice_context) or Sales Invoice document
+        sales_team_cache: Optional dict {(doctype, name): sales_team} shared across calls
 
     Returns:
         list: List of sales team members with their details
     """
     original_sales_team = []
-    seen_sales_persons = set()
 
     if sales_invoice.customer:
-        try:
-            customer = frappe.get_doc("Customer", sales_invoice.customer)
-            if hasattr(customer, 'sales_team') and customer.sales_team:
-                for sales_person_row in customer.sales_team:
-                    if sales_person_row.sales_person and sales_person_row.sales_person not in seen_sales_persons:
-                        original_sales_team.append({
-                            'sales_person': sales_person_row.sales_person,
-                            'commission_rate': sales_person_row.commission_rate,
-                            'allocated_percentage': sales_person_row.allocated_percentage,
-                        })
-                        seen_sales_persons.add(sales_person_row.sales_person)
-        except frappe.DoesNotExistError:
-            pass
+        cache_key = ("Customer", sales_invoice.customer)
+        if sales_team_cache is not None and cache_key in sales_team_cache:
+            return list(sales_team_cache[cache_key])
+
+        original_sales_team = shared_sales_team_cache.get_cached_sales_team(
+            "Customer", sales_invoice.customer, resolve_sales_team)
+
+        if sales_team_cache is not None:
+            sales_team_cache[cache_key] = original_sales_team
 
     return original_sales_team
 
 
-def get_original_sales_team(sales_invoice):
+def get_original_sales_team(sales_invoice, sales_team_cache=None):
     """
     Get original Sales Team structure from Sales Invoice, Sales Order, or Customer
     Priority: Sales Invoice -> Sales Order -> Customer
 
     Args:
-        sales_invoice: Sales Invoice document
+        sales_invoice: Invoice context (see prefetch_invoice_context) or Sales Invoice document
+        sales_team_cache: Optional dict {(doctype, name): sales_team} shared across calls
 
     Returns:
         list: List of sales team members with their details
@@ -450,29 +674,55 @@ def get_original_sales_team(sales_invoice):
 
     # Priority 2: Sales Order
     if not original_sales_team:
-        original_sales_team = get_sales_team_from_sales_order(sales_invoice)
+        original_sales_team = get_sales_team_from_sales_order(
+            sales_invoice, sales_team_cache)
 
     # Priority 3: Customer
     if not original_sales_team:
-        original_sales_team = get_sales_team_from_customer(sales_invoice)
+        original_sales_team = get_sales_team_from_customer(
+            sales_invoice, sales_team_cache)
 
     return original_sales_team
 
 
+def build_sales_team_members(original_sales_team):
+    """
+    Convert sales team member dicts to calculation engine members
+
+    Args:
+        original_sales_team: List of sales team member dicts (see collect_sales_team_members)
+
+    Returns:
+        list: List of contribution_engine.SalesTeamMember
+    """
+    return [
+        contribution_engine.SalesTeamMember(
+            sales_person=member.get('sales_person'),
+            commission_rate=member.get('commission_rate'),
+            allocated_percentage=member.get('allocated_percentage')
+        )
+        for member in original_sales_team
+        if member.get('sales_person')
+    ]
+
+
 def update_sales_team_for_payment_entry(sales_invoice, payment_entry_name,
                                         payment_entry_date, original_sales_team,
                                         net_paid_after_all_deductions):
     """
-    Update or create Sales Team rows for Payment Entry
+    Compute Sales Team row changes for Payment Entry (diff against stored rows)
 
     Logic:
     1. Delete rows without custom_payment_entry (generic rows)
     2. For each sales person:
        - If row exists with same custom_payment_entry and sales_person: UPDATE
+         (only when a value actually changed)
        - Else: CREATE new row
 
+    Nothing is written here; pass "sales_team_changes" to write_sales_team_changes.
+
     Args:
-        sales_invoice: Sales Invoice document
+        sales_invoice: Invoice context (see prefetch_invoice_context)
         payment_entry_name: Name of Payment Entry
         payment_entry_date: Date of Payment Entry
         original_sales_team: List of original sales team members
@@ -481,116 +731,287 @@ def update_sales_team_for_payment_entry(sales_invoice, payment_entry_name,
     Returns:
         dict: {
             "updated_count": int,
-            "sales_persons_details": list
+            "sales_persons_details": list,
+            "sales_team_changes": {"insert": list, "update": list, "delete": list}
         }
     """
-    # Step 1: Delete rows without custom_payment_entry
-    rows_to_remove = []
-    for sales_person_row in sales_invoice.sales_team:
-        if not getattr(sales_person_row, 'custom_payment_entry', None):
-            rows_to_remove.append(sales_person_row)
+    computed_rows = []
+    sales_persons_details = []
 
-    for row in rows_to_remove:
-        sales_invoice.remove(row)
+    # Calculate incentives for each sales person
+    incentive_results = contribution_engine.calculate_incentives(
+        build_sales_team_members(original_sales_team),
+        net_paid_after_all_deductions
+    )
 
-    # Step 2: Update or create rows for each sales person
-    updated_count = 0
-    sales_persons_details = []
+    for incentive in incentive_results:
+        computed_rows.append({
+            'sales_person': incentive.sales_person,
+            'commission_rate': incentive.commission_rate,
+            'allocated_percentage': incentive.allocated_percentage,
+            'incentives': incentive.incentives,
+            'custom_payment_entry': payment_entry_name,
+            'custom_date': getdate(payment_entry_date),
+        })
 
-    for sales_person_data in original_sales_team:
-        if not sales_person_data.get('sales_person'):
-            continue
+        # Store details for message
+        sales_persons_details.append({
+            "name": incentive.sales_person,
+            "commission_rate": incentive.commission_rate,
+            "incentives": incentive.incentives,
+            "net_paid_after_all_deductions": net_paid_after_all_deductions,
+            "commission_rate_decimal": incentive.commission_rate_decimal
+        })
 
-        sales_person_name = sales_person_data['sales_person']
+    return {
+        "updated_count": len(computed_rows),
+        "sales_persons_details": sales_persons_details,
+        "sales_team_changes": diff_sales_team_rows(
+            sales_invoice, payment_entry_name, computed_rows)
+    }
 
-        # Get commission rate
-        commission_rate = sales_person_data.get('commission_rate')
-        if commission_rate is None:
-            commission_rate = 0
-        else:
-            try:
-                commission_rate = flt(commission_rate)
-            except (ValueError, TypeError):
-                commission_rate = 0
 
-        commission_rate_display = commission_rate
+def diff_sales_team_rows(sales_invoice, payment_entry_name, computed_rows):
+    """
+    Diff computed Sales Team rows of a Payment Entry against the stored rows
 
-        # Convert commission_rate to decimal if it's greater than 1
-        if commission_rate > 1:
-            commission_rate_decimal = commission_rate / 100
-        else:
-            commission_rate_decimal = commission_rate
+    Args:
+        sales_invoice: Invoice context (see prefetch_invoice_context)
+        payment_entry_name: Name of Payment Entry
+        computed_rows: List of row dicts (sales_person, commission_rate,
+            allocated_percentage, incentives, custom_payment_entry, custom_date)
 
-        # Calculate incentives
-        incentives = flt(
-            commission_rate_decimal * net_paid_after_all_deductions,
-            precision=2
-        )
+    Returns:
+        dict: {"insert": list, "update": list, "delete": list}
+    """
+    stored_rows = sales_invoice.get('sales_team') or []
+
+    # Delete rows without custom_payment_entry
+    rows_to_delete = [row.name for row in stored_rows
+                      if not row.get('custom_payment_entry')]
+
+    stored_rows_for_payment = {
+        row.sales_person: row for row in stored_rows
+        if row.get('custom_payment_entry') == payment_entry_name
+    }
+
+    rows_to_insert = []
+    rows_to_update = []
 
+    for row_values in computed_rows:
         # Check if row exists with same custom_payment_entry and sales_person
-        existing_row = None
-        for row in sales_invoice.sales_team:
-            if (getattr(row, 'custom_payment_entry', None) == payment_entry_name and
-                    row.sales_person == sales_person_name):
-                existing_row = row
-                break
+        existing_row = stored_rows_for_payment.get(row_values['sales_person'])
 
         if existing_row:
-            # Update existing row
-            existing_row.commission_rate = commission_rate_display
-            existing_row.allocated_percentage = sales_person_data.get(
-                'allocated_percentage', 0)
-            existing_row.incentives = incentives
-            existing_row.custom_payment_entry = payment_entry_name
-            existing_row.custom_date = payment_entry_date
+            # Update existing row only if a value changed
+            if is_sales_team_row_changed(existing_row, row_values):
+                rows_to_update.append(dict(row_values, name=existing_row.name))
         else:
             # Create new row in Sales Team
-            sales_invoice.append('sales_team', {
-                'sales_person': sales_person_name,
-                'commission_rate': commission_rate_display,
-                'allocated_percentage': sales_person_data.get('allocated_percentage', 0),
-                'incentives': incentives,
-                'custom_payment_entry': payment_entry_name,
-                'custom_date': payment_entry_date,
-            })
-
-        # Store details for message
-        sales_persons_details.append({
-            "name": sales_person_name,
-            "commission_rate": commission_rate_display,
-            "incentives": incentives,
-            "net_paid_after_all_deductions": net_paid_after_all_deductions,
-            "commission_rate_decimal": commission_rate_decimal
-        })
-
-        updated_count += 1
+            rows_to_insert.append(row_values)
 
     return {
-        "updated_count": updated_count,
-        "sales_persons_details": sales_persons_details
+        "insert": rows_to_insert,
+        "update": rows_to_update,
+        "delete": rows_to_delete,
     }
 
 
-def remove_sales_team_for_payment_entry(sales_invoice, payment_entry_name):
+def is_sales_team_row_changed(stored_row, row_values):
+    """
+    Check whether computed Sales Team values differ from a stored row
+
+    Args:
+        stored_row: Stored Sales Team row (from invoice context)
+        row_values: Computed values for the row
+
+    Returns:
+        bool: True if the row needs to be updated
+    """
+    for fieldname in ('commission_rate', 'allocated_percentage', 'incentives'):
+        if flt(stored_row.get(fieldname), 6) != flt(row_values[fieldname], 6):
+            return True
+
+    stored_date = stored_row.get('custom_date')
+    return (getdate(stored_date) if stored_date else None) != row_values['custom_date']
+
+
+def write_sales_team_changes(sales_invoice, sales_team_changes):
+    """
+    Persist Sales Team changes of one invoice (see write_sales_team_changes_bulk)
+
+    Args:
+        sales_invoice: Invoice context (see prefetch_invoice_context)
+        sales_team_changes: "sales_team_changes" from update_sales_team_for_payment_entry
+
+    Returns:
+        bool: True if anything was written
+    """
+    return bool(write_sales_team_changes_bulk([(sales_invoice, sales_team_changes)]))
+
+
+def write_sales_team_changes_bulk(invoice_changes):
+    """
+    Persist Sales Team changes of many invoices with targeted SQL on `tabSales Team`
+
+    Writes only the changed child rows and touches each Sales Invoice `modified`
+    once, instead of saving whole invoices (no invoice validations, no rewrite
+    of other child tables, no Version record). Every SALES_TEAM_WRITE_CHUNK_SIZE
+    invoices share one DELETE, one UPDATE, one bulk INSERT and one parent
+    UPDATE. The invoice contexts are updated to reflect the stored rows.
+
+    Args:
+        invoice_changes: List of (invoice context, sales_team_changes) with
+            "sales_team_changes" from update_sales_team_for_payment_entry
+
+    Returns:
+        int: Number of invoices written
+    """
+    changed = [
+        (sales_invoice, sales_team_changes)
+        for sales_invoice, sales_team_changes in invoice_changes
+        if any(sales_team_changes.get(key) for key in ("insert", "update", "delete"))
+    ]
+
+    for start in range(0, len(changed), SALES_TEAM_WRITE_CHUNK_SIZE):
+        write_sales_team_chunk(changed[start:start + SALES_TEAM_WRITE_CHUNK_SIZE])
+
+    return len(changed)
+
+
+def write_sales_team_chunk(invoice_changes):
+    """
+    Write one chunk of write_sales_team_changes_bulk
+
+    Args:
+        invoice_changes: List of (invoice context, sales_team_changes), all with changes
+    """
+    timestamp = now_datetime()
+    user = frappe.session.user
+
+    rows_to_delete = [
+        name for _, changes in invoice_changes for name in changes.get("delete") or []]
+    rows_to_update = [
+        row for _, changes in invoice_changes for row in changes.get("update") or []]
+    parent_names = tuple(sales_invoice.name for sales_invoice, _ in invoice_changes)
+
+    if rows_to_delete:
+        frappe.db.sql("""
+            DELETE FROM `tabSales Team`
+            WHERE name IN %(names)s AND parent IN %(parents)s
+        """, {"names": tuple(rows_to_delete), "parents": parent_names})
+
+    if rows_to_update:
+        update_fields = ('commission_rate', 'allocated_percentage',
+                         'incentives', 'custom_date')
+        set_clauses = []
+        params = []
+        for fieldname in update_fields:
+            cases = []
+            for row in rows_to_update:
+                cases.append("WHEN %s THEN %s")
+                params.extend([row['name'], row[fieldname]])
+            set_clauses.append(
+                f"`{fieldname}` = CASE name {' '.join(cases)} END")
+
+        params.extend([timestamp, user])
+        params.extend(row['name'] for row in rows_to_update)
+
+        frappe.db.sql(f"""
+            UPDATE `tabSales Team`
+            SET {', '.join(set_clauses)}, modified = %s, modified_by = %s
+            WHERE name IN ({', '.join(['%s'] * len(rows_to_update))})
+        """, tuple(params))
+
+    deleted_names = set(rows_to_delete)
+    updated_values = {row['name']: row for row in rows_to_update}
+    insert_fields = [
+        'name', 'creation', 'modified', 'modified_by', 'owner', 'docstatus',
+        'parent', 'parentfield', 'parenttype', 'idx',
+        'sales_person', 'commission_rate', 'allocated_percentage', 'incentives',
+        'custom_payment_entry', 'custom_date',
+    ]
+    values = []
+
+    for sales_invoice, changes in invoice_changes:
+        kept_rows = [row for row in sales_invoice.get('sales_team') or []
+                     if row.name not in deleted_names]
+        rows_to_insert = changes.get("insert") or []
+
+        next_idx = max((row.idx or 0 for row in kept_rows), default=0) + 1
+        for idx, row in enumerate(rows_to_insert, next_idx):
+            row['name'] = frappe.generate_hash(length=10)
+            row['idx'] = idx
+            values.append((
+                row['name'], timestamp, timestamp, user, user,
+                sales_invoice.docstatus or 0,
+                sales_invoice.name, 'sales_team', 'Sales Invoice', idx,
+                row['sales_person'], row['commission_rate'],
+                row['allocated_percentage'], row['incentives'],
+                row['custom_payment_entry'], row['custom_date'],
+            ))
+
+        # Keep the invoice context in sync with the stored rows
+        for row in kept_rows:
+            row.update(updated_values.get(row.name, {}))
+        sales_invoice.sales_team = kept_rows + [frappe._dict(row) for row in rows_to_insert]
+        sales_invoice.modified = timestamp
+
+    if values:
+        frappe.db.bulk_insert("Sales Team", insert_fields, values)
+
+    # Touch each parent once so list views and sync see the change
+    frappe.db.sql("""
+        UPDATE `tabSales Invoice`
+        SET modified = %(modified)s, modified_by = %(user)s
+        WHERE name IN %(names)s
+    """, {"modified": timestamp, "user": user, "names": parent_names})
+
+    for parent_name in parent_names:
+        frappe.clear_document_cache("Sales Invoice", parent_name)
+
+
+def remove_sales_team_for_payment_entry(payment_entry_name):
     """
     Remove Sales Team rows associated with Payment Entry (for cancel)
 
+    Set-based on the (custom_payment_entry, parent) index: one SELECT for the
+    affected invoices, one DELETE and one UPDATE touching each Sales Invoice
+    `modified` once. Covers referenced invoices and invoices reached through
+    Sales Order advances alike.
+
     Args:
-        sales_invoice: Sales Invoice document
         payment_entry_name: Name of Payment Entry to remove
 
     Returns:
-        int: Number of rows removed
+        dict: {invoice_name: number of rows removed}
     """
-    rows_to_remove = []
-    for sales_person_row in sales_invoice.sales_team:
-        if getattr(sales_person_row, 'custom_payment_entry', None) == payment_entry_name:
-            rows_to_remove.append(sales_person_row)
+    removed_counts = dict(frappe.db.sql("""
+        SELECT parent, COUNT(*)
+        FROM `tabSales Team`
+        WHERE custom_payment_entry = %(payment_entry)s AND parenttype = 'Sales Invoice'
+        GROUP BY parent
+    """, {"payment_entry": payment_entry_name}))
 
-    for row in rows_to_remove:
-        sales_invoice.remove(row)
+    if not removed_counts:
+        return {}
 
-    return len(rows_to_remove)
+    frappe.db.sql("""
+        DELETE FROM `tabSales Team`
+        WHERE custom_payment_entry = %(payment_entry)s AND parenttype = 'Sales Invoice'
+    """, {"payment_entry": payment_entry_name})
+
+    frappe.db.sql("""
+        UPDATE `tabSales Invoice`
+        SET modified = %(modified)s, modified_by = %(user)s
+        WHERE name IN %(names)s
+    """, {"modified": now_datetime(), "user": frappe.session.user,
+          "names": tuple(removed_counts)})
+
+    for invoice_name in removed_counts:
+        frappe.clear_document_cache("Sales Invoice", invoice_name)
+
+    return {invoice_name: cint(count) for invoice_name, count in removed_counts.items()}
 
 
 # ============================================================================
@@ -606,35 +1027,29 @@ def calculate_tax_amount_from_invoice(sales_invoice, allocated_amount):
     - tax_amount = allocated_amount * tax_ratio
 
     Args:
-        sales_invoice: Sales Invoice document
+        sales_invoice: Invoice context (see prefetch_invoice_context) or Sales Invoice document
         allocated_amount: Allocated amount for this invoice
 
     Returns:
         float: Tax amount proportional to allocated amount
     """
-    try:
-        grand_total = flt(sales_invoice.grand_total or 0)
-        total_taxes_and_charges = flt(
-            sales_invoice.total_taxes_and_charges or 0)
+    return contribution_engine.calculate_tax_amount(
+        sales_invoice.grand_total, sales_invoice.total_taxes_and_charges, allocated_amount)
 
-        if grand_total > 0:
-            tax_ratio = total_taxes_and_charges / grand_total
-            tax_amount = allocated_amount * tax_ratio
-        else:
-            tax_amount = 0
 
-        return flt(tax_amount, precision=2)
-    except (ValueError, TypeError, ZeroDivisionError):
-        return 0
+REFERENCE_VALUE_FIELDS = (
+    "custom_tax_amount_from_allocated",
+    "custom_net_without_tax",
+    "custom_net_without_tax_without_deductions",
+)
 
 
-def update_payment_entry_references(payment_entry_name, invoice_name,
-                                    total_allocated_amount, total_invoice_deduction,
-                                    sales_invoice):
+def calculate_reference_values(payment_entry, invoice_name, total_allocated_amount,
+                               total_invoice_deduction, sales_invoice, reference_rows=None):
     """
-    Update custom fields in Payment Entry References table for the invoice
+    Calculate custom fields for the Payment Entry References rows of one invoice
 
-    Fields to update:
+    Fields calculated:
     - custom_tax_amount_from_allocated: Tax amount calculated from allocated amount
     - custom_net_without_tax_without_deductions: allocated_amount - tax_amount - deducted
       (Net amount without tax and without deductions)
@@ -645,98 +1060,153 @@ def update_payment_entry_references(payment_entry_name, invoice_name,
     - custom_net_without_tax_without_deductions = allocated_amount - tax_amount - deducted
     - custom_net_without_tax = allocated_amount - tax_amount
 
-    If invoice appears in multiple rows, values are distributed proportionally based on allocated_amount in each row
+    If invoice appears in multiple rows, values are distributed proportionally based on allocated_amount in each row.
+    Rows are read from the in-memory Payment Entry; nothing is queried or written.
 
     Args:
-        payment_entry_name: Name of Payment Entry
+        payment_entry: Payment Entry document
         invoice_name: Name of Sales Invoice
         total_allocated_amount: Total allocated amount for this invoice across all rows
         total_invoice_deduction: Total deduction amount for this invoice
-        sales_invoice: Sales Invoice document
+        sales_invoice: Invoice context (see prefetch_invoice_context) or Sales Invoice document
+        reference_rows: Optional ReferenceInput rows of this invoice (see
+            get_reference_rows_by_invoice); read from the Payment Entry otherwise
+
+    Returns:
+        dict: {reference_row_name: {fieldname: value}}
     """
-    try:
-        # Get all reference rows for this invoice with their allocated amounts
-        reference_rows = frappe.get_all(
-            "Payment Entry Reference",
-            filters={
-                "parent": payment_entry_name,
-                "reference_doctype": "Sales Invoice",
-                "reference_name": invoice_name
-            },
-            fields=["name", "allocated_amount"]
-        )
+    # Get all reference rows for this invoice with their allocated amounts
+    if reference_rows is None:
+        reference_rows = get_reference_rows_by_invoice(payment_entry).get(invoice_name, [])
+
+    invoice = contribution_engine.InvoiceInput(
+        name=invoice_name,
+        grand_total=flt(sales_invoice.grand_total or 0),
+        total_taxes_and_charges=flt(sales_invoice.total_taxes_and_charges or 0)
+    )
 
-        if not reference_rows:
-            return
+    reference_results = contribution_engine.calculate_reference_results(
+        reference_rows, invoice, total_allocated_amount, total_invoice_deduction)
 
-        # Calculate total allocated amount from all rows for this invoice
-        total_row_allocated = sum(flt(row.allocated_amount or 0)
-                                  for row in reference_rows)
+    return {
+        result.name: {
+            "custom_tax_amount_from_allocated": result.tax_amount,
+            "custom_net_without_tax_without_deductions": result.net_without_tax_without_deductions,
+            "custom_net_without_tax": result.net_without_tax
+        }
+        for result in reference_results
+    }
 
-        if total_row_allocated == 0:
-            return
 
-        # Update each reference row proportionally
-        for row in reference_rows:
-            row_allocated = flt(row.allocated_amount or 0)
+def get_reference_rows_by_invoice(payment_entry):
+    """
+    Group the Sales Invoice reference rows of a Payment Entry in one pass
 
-            # Calculate proportional values for this row
-            if total_row_allocated > 0:
-                ratio = row_allocated / total_row_allocated
-                row_allocated_proportional = total_allocated_amount * ratio
-                row_deduction_proportional = total_invoice_deduction * ratio
-            else:
-                # If total is 0, distribute equally
-                row_count = len(reference_rows)
-                row_allocated_proportional = total_allocated_amount / \
-                    row_count if row_count > 0 else 0
-                row_deduction_proportional = total_invoice_deduction / \
-                    row_count if row_count > 0 else 0
-
-            # Calculate tax amount for this row
-            row_tax_amount = calculate_tax_amount_from_invoice(
-                sales_invoice, row_allocated_proportional)
-
-            # Calculate custom_net_without_tax_without_deductions
-            # Formula: allocated_amount - tax_amount - deducted
-            row_net_without_tax_without_deductions = row_allocated_proportional - \
-                row_tax_amount - row_deduction_proportional
-
-            # Calculate custom_net_without_tax
-            # Formula: allocated_amount - tax_amount (only tax, no deductions)
-            row_net_without_tax = row_allocated_proportional - row_tax_amount
-
-            # Update the row
-            frappe.db.set_value(
-                "Payment Entry Reference",
-                row.name,
-                {
-                    "custom_tax_amount_from_allocated": flt(row_tax_amount, precision=2),
-                    "custom_net_without_tax_without_deductions": flt(row_net_without_tax_without_deductions, precision=2),
-                    "custom_net_without_tax": flt(row_net_without_tax, precision=2)
-                }
-            )
+    Args:
+        payment_entry: Payment Entry document
 
-        frappe.db.commit()
+    Returns:
+        dict: {invoice_name: [contribution_engine.ReferenceInput]}
+    """
+    reference_rows = {}
+    for row in payment_entry.references:
+        if row.reference_doctype == "Sales Invoice" and row.reference_name:
+            reference_rows.setdefault(row.reference_name, []).append(
+                contribution_engine.ReferenceInput(
+                    name=row.name,
+                    invoice_name=row.reference_name,
+                    allocated_amount=flt(row.allocated_amount or 0)
+                ))
 
-    except Exception as e:
-        frappe.log_error(
-            frappe.get_traceback(),
-            _("Error updating Payment Entry References for invoice {0}").format(
-                invoice_name)
-        )
+    return reference_rows
+
+
+def set_reference_values(payment_entry, reference_values):
+    """
+    Set calculated custom fields on the in-memory Payment Entry References rows
+
+    Used from the validate hook so the normal document save persists the values.
+
+    Args:
+        payment_entry: Payment Entry document
+        reference_values: dict from calculate_reference_values
+    """
+    if not reference_values:
+        return
+
+    for row in payment_entry.references:
+        if row.name in reference_values:
+            row.update(reference_values[row.name])
+
+
+def update_payment_entry_references(payment_entry_name, reference_values):
+    """
+    Persist calculated custom fields with one set-based UPDATE for the Payment Entry
+
+    Used for submitted documents and bulk recalculation, where the Payment Entry
+    is not being saved. Errors are raised, so the caller's savepoint / rollback
+    also undoes the Sales Team and ledger rows of the same calculation.
+
+    Args:
+        payment_entry_name: Name of Payment Entry
+        reference_values: dict from calculate_reference_values
+    """
+    if not reference_values:
+        return
+
+    set_clauses = []
+    params = []
+    for fieldname in REFERENCE_VALUE_FIELDS:
+        cases = []
+        for row_name, values in reference_values.items():
+            cases.append("WHEN %s THEN %s")
+            params.extend([row_name, values[fieldname]])
+        set_clauses.append(
+            f"`{fieldname}` = CASE name {' '.join(cases)} END")
+
+    params.append(payment_entry_name)
+    params.extend(reference_values)
+
+    frappe.db.sql(f"""
+        UPDATE `tabPayment Entry Reference`
+        SET {', '.join(set_clauses)}
+        WHERE parent = %s
+            AND name IN ({', '.join(['%s'] * len(reference_values))})
+    """, tuple(params))
 
 
 # ============================================================================
 # SECTION 7: SINGLE INVOICE PROCESSING FUNCTION
 # ============================================================================
 
+@contextmanager
+def net_contribution_savepoint():
+    """
+    Run a block inside a database savepoint
+
+    The calculation never commits; the caller (request, document hook or
+    background job) owns the single commit. A failing block is rolled back
+    to the savepoint so no half-updated invoice is left in the transaction.
+    """
+    save_point = f"net_contribution_{frappe.generate_hash(length=8)}"
+    frappe.db.savepoint(save_point)
+    try:
+        yield
+    except Exception:
+        frappe.db.rollback(save_point=save_point)
+        raise
+    else:
+        frappe.db.release_savepoint(save_point)
+
+
 def process_single_invoice(payment_entry, payment_entry_name, invoice_name,
-                           allocated_amount, invoice_deduction, invoice_net_paid):
+                           allocated_amount, invoice_deduction, invoice_net_paid,
+                           invoice_context=None, sales_team_cache=None):
     """
     Process a single Sales Invoice to update Sales Team with net contribution
 
-    This function handles all cases where we process one invoice at a time
+    Only structured values are returned; the HTML message is rendered by
+    render_net_contribution_message for the interactive button.
 
     Args:
         payment_entry: Payment Entry document
@@ -745,35 +1215,70 @@ def process_single_invoice(payment_entry, payment_entry_name, invoice_name,
         allocated_amount: Allocated amount for this invoice
         invoice_deduction: Deduction amount for this invoice
         invoice_net_paid: Net paid amount for this invoice (after deduction)
+        invoice_context: Optional dict from prefetch_invoice_context
+        sales_team_cache: Optional dict shared across calls (see get_original_sales_team)
 
     Returns:
-        dict: Result with status, message, and details
+        dict: Result with status, values and reference_values (or error)
+    """
+    result = prepare_single_invoice(
+        payment_entry, payment_entry_name, invoice_name,
+        allocated_amount, invoice_deduction, invoice_net_paid,
+        invoice_context=invoice_context, sales_team_cache=sales_team_cache
+    )
+    write_invoice_results([result])
+    return result
+
+
+def prepare_single_invoice(payment_entry, payment_entry_name, invoice_name,
+                           allocated_amount, invoice_deduction, invoice_net_paid,
+                           invoice_context=None, sales_team_cache=None,
+                           reference_rows=None):
+    """
+    Calculate one Sales Invoice without writing anything
+
+    Successful results carry the invoice context and its "sales_team_changes"
+    until write_invoice_results persists them.
+
+    Args:
+        payment_entry: Payment Entry document
+        payment_entry_name: Name of Payment Entry
+        invoice_name: Name of Sales Invoice
+        allocated_amount: Allocated amount for this invoice
+        invoice_deduction: Deduction amount for this invoice
+        invoice_net_paid: Net paid amount for this invoice (after deduction)
+        invoice_context: Optional dict from prefetch_invoice_context
+        sales_team_cache: Optional dict shared across calls (see get_original_sales_team)
+        reference_rows: Optional reference rows of this invoice (see calculate_reference_values)
+
+    Returns:
+        dict: Result with status, values, reference_values, "invoice" and
+              "sales_team_changes" (or error)
     """
     try:
-        # Get Sales Invoice document
-        sales_invoice = frappe.get_doc("Sales Invoice", invoice_name)
+        # Get prefetched invoice header and Sales Team
+        invoice = get_invoice_context(invoice_context, invoice_name)
+        if not invoice:
+            return {
+                "status": "error",
+                "invoice_name": invoice_name,
+                "error": _("Sales Invoice {0} not found").format(invoice_name)
+            }
 
         # Get total taxes and charges from Sales Invoice
         try:
             total_taxes_and_charges = flt(
-                sales_invoice.total_taxes_and_charges or 0)
+                invoice.total_taxes_and_charges or 0)
         except (ValueError, TypeError):
             total_taxes_and_charges = 0
 
-        # Get grand total from Sales Invoice
-        try:
-            grand_total = flt(sales_invoice.grand_total or 0)
-        except (ValueError, TypeError):
-            grand_total = 0
-
-        # Get currency from Payment Entry or Sales Invoice
-        currency = payment_entry.paid_to_account_currency or payment_entry.company_currency or sales_invoice.currency or "EGP"
-
         # Calculate net_paid_after_all_deductions for this invoice
         net_paid_after_all_deductions = invoice_net_paid - total_taxes_and_charges
 
         # Get original Sales Team structure
-        original_sales_team = get_original_sales_team(sales_invoice)
+        with pipeline_profiler.profile_stage("sales_team"):
+            original_sales_team = get_original_sales_team(
+                invoice, sales_team_cache)
 
         # If still no Sales Team found, return error
         if not original_sales_team:
@@ -783,12 +1288,13 @@ def process_single_invoice(payment_entry, payment_entry_name, invoice_name,
                 "error": _("Sales Team not found in invoice {0}, order, or customer. Please add Sales Team members first.").format(invoice_name)
             }
 
-        # Update Sales Team
+        # Compute Sales Team changes
         payment_entry_date = payment_entry.posting_date or frappe.utils.today()
-        update_result = update_sales_team_for_payment_entry(
-            sales_invoice, payment_entry_name, payment_entry_date,
-            original_sales_team, net_paid_after_all_deductions
-        )
+        with pipeline_profiler.profile_stage("incentives"):
+            update_result = update_sales_team_for_payment_entry(
+                invoice, payment_entry_name, payment_entry_date,
+                original_sales_team, net_paid_after_all_deductions
+            )
 
         if update_result["updated_count"] == 0:
             return {
@@ -797,70 +1303,21 @@ def process_single_invoice(payment_entry, payment_entry_name, invoice_name,
                 "error": _("No sales persons found in Sales Team to update")
             }
 
-        # Save the Sales Invoice document
-        sales_invoice.save(ignore_permissions=True)
-        frappe.db.commit()
-
-        # Update Payment Entry References table with calculated values
-        # This updates the custom fields to show calculation details for each invoice
-        update_payment_entry_references(
-            payment_entry_name, invoice_name,
+        # Calculate Payment Entry References custom fields for this invoice
+        # (persisted by the caller: in-memory on validate, one UPDATE otherwise)
+        reference_values = calculate_reference_values(
+            payment_entry, invoice_name,
             allocated_amount, invoice_deduction,
-            sales_invoice
+            invoice, reference_rows
         )
 
-        # Build message for this invoice
-        grand_total_formatted = frappe.format_value(
-            grand_total, {'fieldtype': 'Currency', 'currency': currency}, sales_invoice)
-        total_taxes_formatted = frappe.format_value(total_taxes_and_charges, {
-            'fieldtype': 'Currency', 'currency': currency}, sales_invoice)
-        allocated_amount_formatted = frappe.format_value(
-            allocated_amount, {'fieldtype': 'Currency', 'currency': currency}, payment_entry)
-        invoice_deduction_formatted = frappe.format_value(
-            invoice_deduction, {'fieldtype': 'Currency', 'currency': currency}, payment_entry)
-        invoice_net_paid_formatted = frappe.format_value(
-            invoice_net_paid, {'fieldtype': 'Currency', 'currency': currency}, payment_entry)
-        net_paid_after_all_formatted = frappe.format_value(net_paid_after_all_deductions, {
-            'fieldtype': 'Currency', 'currency': currency}, payment_entry)
-
-        # Uniform font size with minimal spacing
-        uniform_style = 'style="font-size: 12px; line-height: 1.3; color: #2c3e50; margin: 0; padding: 0;"'
-        header_style = 'style="font-size: 12px; font-weight: bold; color: #2c3e50; margin: 0; padding: 0; margin-top: 2px;"'
-
-        message_parts = [
-            f'<div {header_style}>Sales Invoice: {invoice_name}</div>',
-            f'<div {uniform_style}>Grand Total: {grand_total_formatted}</div>',
-            f'<div {uniform_style}>Total Taxes: {total_taxes_formatted}</div>',
-            f'<div {header_style}>Payment Entry:</div>',
-            f'<div {uniform_style}>Allocated Amount: {allocated_amount_formatted}</div>',
-            f'<div {uniform_style}>Deductions: {invoice_deduction_formatted}</div>',
-            f'<div {uniform_style}>Net Paid: {invoice_net_paid_formatted}</div>',
-            f'<div {uniform_style}>Net Paid After All Deductions: {net_paid_after_all_formatted}</div>',
-            f'<div {header_style}>Sales Team:</div>'
-        ]
-
-        for detail in update_result["sales_persons_details"]:
-            if detail["commission_rate"] > 1:
-                commission_rate_display = f"{detail['commission_rate']}%"
-            else:
-                commission_rate_display = f"{detail['commission_rate'] * 100}%"
-
-            net_paid_formatted = flt(
-                detail['net_paid_after_all_deductions'], precision=2)
-            incentives_formatted = flt(detail['incentives'], precision=2)
-            commission_rate_decimal = detail['commission_rate_decimal']
-
-            message_parts.extend([
-                f'<div {uniform_style}>Sales Person: {detail["name"]}</div>',
-                f'<div {uniform_style}>Commission Rate: {commission_rate_display}</div>',
-                f'<div {uniform_style}>Incentives: {net_paid_formatted:,.2f} × {commission_rate_decimal} = {incentives_formatted:,.2f}</div>'
-            ])
-
         return {
             "status": "success",
             "invoice_name": invoice_name,
-            "message": "".join(message_parts),
             "updated_persons": update_result["updated_count"],
+            "reference_values": reference_values,
+            "invoice": invoice,
+            "sales_team_changes": update_result["sales_team_changes"],
             "values": {
                 "allocated_amount": allocated_amount,
                 "invoice_deduction": invoice_deduction,
@@ -881,11 +1338,49 @@ def process_single_invoice(payment_entry, payment_entry_name, invoice_name,
         }
 
 
+def write_invoice_results(results):
+    """
+    Write the Sales Team changes of prepared invoice results together
+
+    All invoices are written inside one savepoint; if the write fails, every
+    successful result becomes an error and nothing is left half written.
+    "invoice" and "sales_team_changes" are removed from the results.
+
+    Args:
+        results: List of prepare_single_invoice results (updated in place)
+    """
+    prepared = [result for result in results if result.get("status") == "success"]
+
+    try:
+        if prepared:
+            with pipeline_profiler.profile_stage("write_sales_team"), net_contribution_savepoint():
+                write_sales_team_changes_bulk([
+                    (result["invoice"], result["sales_team_changes"]) for result in prepared])
+    except Exception as e:
+        invoice_names = ", ".join(result["invoice_name"] for result in prepared)
+        frappe.log_error(frappe.get_traceback(), _(
+            "Error processing invoice {0}").format(invoice_names))
+        for result in prepared:
+            result.update({
+                "status": "error",
+                "error": _("Error processing invoice: {0}").format(str(e)),
+                "reference_values": None,
+            })
+    finally:
+        for result in results:
+            result.pop("invoice", None)
+            result.pop("sales_team_changes", None)
+
+
 # ============================================================================
 # SECTION 8: MESSAGE GENERATION FUNCTIONS
 # ============================================================================
 
-def generate_status_message(payment_entry, references_analysis, sales_invoice_references):
+# Jinja template of the interactive result message (compiled once per process)
+NET_CONTRIBUTION_MESSAGE_TEMPLATE = "sales_person_net_contribution/templates/net_contribution_message.html"
+
+def generate_status_message(payment_entry, references_analysis, sales_invoice_references,
+                            invoice_context=None):
     """
     Generate status message explaining the case and what will be done
 
@@ -893,6 +1388,7 @@ def generate_status_message(payment_entry, references_analysis, sales_invoice_re
         payment_entry: Payment Entry document
         references_analysis: Result from analyze_payment_entry_references
         sales_invoice_references: dict {invoice_name: allocated_amount}
+        invoice_context: Optional dict from prefetch_invoice_context
 
     Returns:
         str: Formatted status message in Arabic with RTL styling
@@ -904,11 +1400,10 @@ def generate_status_message(payment_entry, references_analysis, sales_invoice_re
     customer_name = ""
     if sales_invoice_references:
         first_invoice_name = list(sales_invoice_references.keys())[0]
-        try:
-            first_invoice = frappe.get_doc("Sales Invoice", first_invoice_name)
+        first_invoice = get_invoice_context(
+            invoice_context, first_invoice_name)
+        if first_invoice:
             customer_name = first_invoice.customer_name or first_invoice.customer or ""
-        except:
-            pass
 
     # LTR styling
     rtl_style = 'style="direction: ltr; text-align: left; font-family: Arial, sans-serif;"'
@@ -963,161 +1458,358 @@ def generate_status_message(payment_entry, references_analysis, sales_invoice_re
     return "".join(message_parts)
 
 
-def generate_summary_message(payment_entry, references_analysis, sales_invoice_references,
-                             invoice_deductions, results):
+def build_invoice_summary(sales_invoice, allocated_amount, invoice_deduction):
     """
-    Generate summary message showing calculation details for each invoice
+    Build the calculation summary values of one invoice for the message template
+
+    Args:
+        sales_invoice: Invoice context (see prefetch_invoice_context)
+        allocated_amount: Allocated amount for this invoice
+        invoice_deduction: Deduction amount for this invoice
+
+    Returns:
+        dict: Formatted summary values (without currency symbol)
+    """
+    grand_total = flt(sales_invoice.grand_total or 0)
+    total_taxes = flt(sales_invoice.total_taxes_and_charges or 0)
+
+    # Calculate tax amount from allocated amount
+    tax_amount = calculate_tax_amount_from_invoice(
+        sales_invoice, allocated_amount)
+
+    # Calculate net_without_tax_rate_without_deductions
+    net_without_tax_rate_without_deductions = allocated_amount - \
+        tax_amount - invoice_deduction
+
+    return {
+        "allocated_amount": f"{flt(allocated_amount, 2):,.2f}",
+        "tax_rate": flt(total_taxes / grand_total * 100 if grand_total > 0 else 0, precision=1),
+        "tax_amount": f"{flt(tax_amount, 2):,.2f}",
+        "invoice_deduction": f"{flt(invoice_deduction, 2):,.2f}",
+        "net_without_tax_without_deductions": f"{flt(net_without_tax_rate_without_deductions, 2):,.2f}",
+    }
+
+
+def build_invoice_details(payment_entry, sales_invoice, values):
+    """
+    Build the formatted calculation details of one invoice for the message template
 
     Args:
         payment_entry: Payment Entry document
-        references_analysis: Result from analyze_payment_entry_references
+        sales_invoice: Invoice context (see prefetch_invoice_context)
+        values: "values" of a successful process_single_invoice result
+
+    Returns:
+        dict: Formatted currency values and sales persons
+    """
+    # Get currency from Payment Entry or Sales Invoice
+    currency = payment_entry.paid_to_account_currency or payment_entry.company_currency or sales_invoice.currency or "EGP"
+    currency_df = {'fieldtype': 'Currency', 'currency': currency}
+
+    def format_currency(value, doc):
+        return frappe.format_value(value, currency_df, doc)
+
+    sales_persons = []
+    for detail in values["sales_persons_details"]:
+        if detail["commission_rate"] > 1:
+            commission_rate_display = f"{detail['commission_rate']}%"
+        else:
+            commission_rate_display = f"{detail['commission_rate'] * 100}%"
+
+        sales_persons.append({
+            "name": detail["name"],
+            "commission_rate": commission_rate_display,
+            "commission_rate_decimal": detail["commission_rate_decimal"],
+            "net_paid_after_all_deductions": f"{flt(detail['net_paid_after_all_deductions'], precision=2):,.2f}",
+            "incentives": f"{flt(detail['incentives'], precision=2):,.2f}",
+        })
+
+    return {
+        "grand_total": format_currency(flt(sales_invoice.grand_total or 0), sales_invoice),
+        "total_taxes_and_charges": format_currency(values["total_taxes_and_charges"], sales_invoice),
+        "allocated_amount": format_currency(values["allocated_amount"], payment_entry),
+        "invoice_deduction": format_currency(values["invoice_deduction"], payment_entry),
+        "invoice_net_paid": format_currency(values["invoice_net_paid"], payment_entry),
+        "net_paid_after_all_deductions": format_currency(
+            values["net_paid_after_all_deductions"], payment_entry),
+        "sales_persons": sales_persons,
+    }
+
+
+def render_net_contribution_message(payment_entry, case_type, sales_invoice_references,
+                                    invoice_deductions, results, invoice_context):
+    """
+    Render the completion, summary and details message for the interactive button
+
+    Hooks and batch callers never call this; they only use the structured values.
+
+    Args:
+        payment_entry: Payment Entry document
+        case_type: Type of case processed
         sales_invoice_references: dict {invoice_name: allocated_amount}
         invoice_deductions: dict {invoice_name: deduction_amount}
-        results: List of processing results
+        results: List of process_single_invoice results
+        invoice_context: dict from prefetch_invoice_context
 
     Returns:
-        str: Formatted summary message in Arabic with RTL styling
+        str: HTML message rendered from NET_CONTRIBUTION_MESSAGE_TEMPLATE
     """
-    # Uniform font size with minimal spacing
-    uniform_style = 'style="font-size: 12px; line-height: 1.3; color: #2c3e50; margin: 0; padding: 0;"'
-    header_style = 'style="font-size: 12px; font-weight: bold; color: #2c3e50; margin: 0; padding: 0; border-bottom: 1px solid #27ae60; padding-bottom: 2px; margin-bottom: 2px;"'
-    invoice_header_style = 'style="font-size: 12px; font-weight: bold; color: #2980b9; margin: 0; padding: 0; margin-top: 2px;"'
-    calc_style = 'style="font-size: 12px; line-height: 1.3; color: #34495e; margin: 0; padding: 0;"'
-    value_style = 'style="color: #27ae60; font-weight: bold;"'
+    results_by_invoice = {result.get("invoice_name"): result for result in results}
+    invoices = []
 
-    message_parts = ['<div>']
-    message_parts.append(f'<div {header_style}>Calculation Summary</div>')
+    for invoice_name, allocated_amount in sales_invoice_references.items():
+        result = results_by_invoice.get(invoice_name) or {}
+        sales_invoice = invoice_context.get(invoice_name)
+        invoice = {
+            "invoice_name": invoice_name,
+            "status": result.get("status"),
+            "error": result.get("error"),
+        }
 
-    case_type = references_analysis["case_type"]
+        if sales_invoice:
+            invoice["summary"] = build_invoice_summary(
+                sales_invoice, allocated_amount, invoice_deductions.get(invoice_name, 0))
+            if result.get("status") == "success":
+                invoice["details"] = build_invoice_details(
+                    payment_entry, sales_invoice, result["values"])
+        else:
+            invoice["summary_error"] = _("Sales Invoice {0} not found").format(invoice_name)
 
-    for invoice_name, allocated_amount in sales_invoice_references.items():
-        invoice_deduction = invoice_deductions.get(invoice_name, 0)
+        invoices.append(invoice)
 
-        # Get invoice details
-        try:
-            sales_invoice = frappe.get_doc("Sales Invoice", invoice_name)
-            grand_total = flt(sales_invoice.grand_total or 0)
-            total_taxes = flt(sales_invoice.total_taxes_and_charges or 0)
-
-            # Calculate tax amount from allocated amount
-            tax_amount = calculate_tax_amount_from_invoice(
-                sales_invoice, allocated_amount)
-
-            # Calculate net_without_tax_rate_without_deductions
-            net_without_tax_rate_without_deductions = allocated_amount - \
-                tax_amount - invoice_deduction
-
-            # Format values (without currency symbol)
-            allocated_formatted = f"{flt(allocated_amount, 2):,.2f}"
-            tax_formatted = f"{flt(tax_amount, 2):,.2f}"
-            deduction_formatted = f"{flt(invoice_deduction, 2):,.2f}"
-            net_formatted = f"{flt(net_without_tax_rate_without_deductions, 2):,.2f}"
-
-            message_parts.append(
-                f'<div {invoice_header_style}>📄 {invoice_name}</div>')
-            message_parts.append(
-                f'<div {calc_style}>Allocated Amount: <span {value_style}>{allocated_formatted}</span></div>')
-            message_parts.append(
-                f'<div {calc_style}>Tax ({flt(total_taxes/grand_total*100 if grand_total > 0 else 0, precision=1)}%): <span {value_style}>- {tax_formatted}</span></div>')
-            message_parts.append(
-                f'<div {calc_style}>Deductions: <span {value_style}>- {deduction_formatted}</span></div>')
-            message_parts.append(
-                f'<div {calc_style}><b>Net without tax and deductions: <span style="color: #e74c3c; font-weight: bold;">{net_formatted}</span></b></div>')
-
-        except Exception as e:
-            message_parts.append(
-                f'<div {invoice_header_style}>📄 {invoice_name}</div>')
-            message_parts.append(
-                f'<div {calc_style} style="color: #e74c3c;">Error calculating details: {str(e)}</div>')
+    return frappe.render_template(NET_CONTRIBUTION_MESSAGE_TEMPLATE, {
+        "case_type": case_type,
+        "invoices": invoices,
+        "success_count": sum(1 for invoice in invoices if invoice["status"] == "success"),
+    })
 
-    message_parts.append('</div>')
-    return "".join(message_parts)
 
+# ============================================================================
+# SECTION 9: INPUT FINGERPRINT FUNCTIONS
+# ============================================================================
 
-def generate_completion_message(case_type, results, customer_name=""):
+def get_sales_invoice_names(payment_entry):
     """
-    Generate completion message after processing
+    Get the Sales Invoices referenced by a Payment Entry (in row order)
 
     Args:
-        case_type: Type of case processed
-        results: List of results from processing
-        customer_name: Customer name
+        payment_entry: Payment Entry document
 
     Returns:
-        str: Formatted completion message in English with compact styling
+        list: Unique Sales Invoice names
     """
-    # Uniform font size with minimal spacing
-    item_style = 'style="font-size: 12px; line-height: 1.3; color: #2c3e50; margin: 0; padding: 0;"'
+    return list(dict.fromkeys(
+        row.reference_name for row in payment_entry.get('references') or []
+        if row.reference_doctype == "Sales Invoice" and row.reference_name
+    ))
 
-    message_parts = ['<div>']
 
-    if case_type == "single_invoice" or case_type == "single_invoice_multiple_rows":
-        if results and results[0].get("status") == "success":
-            message_parts.append(
-                f'<div {item_style}>✅️ Updated Sales Person</div>')
-            message_parts.append(
-                f'<div {item_style}>✅️ Updated Sales Person incentives</div>')
-            message_parts.append(
-                f'<div {item_style}>✅️ Updated Payment Reference</div>')
-        else:
-            message_parts.append(
-                f'<div {item_style} style="color: #e74c3c;">❌ Error: Failed to update invoice</div>')
+def get_sales_team_version(sales_invoice, payment_entry_name, sales_team_cache=None):
+    """
+    Describe the resolved Sales Team of an invoice and the rows written for a Payment Entry
 
-    elif case_type == "multiple_invoices":
-        success_count = sum(1 for r in results if r.get("status") == "success")
-        total_count = len(results)
-
-        if success_count > 0:
-            message_parts.append(
-                f'<div {item_style}>✅️ Updated Sales Person</div>')
-            message_parts.append(
-                f'<div {item_style}>✅️ Updated Sales Person incentives</div>')
-            message_parts.append(
-                f'<div {item_style}>✅️ Updated Payment Reference</div>')
-            message_parts.append(
-                f'<div {item_style} style="color: #27ae60;">Processed: {success_count} of {total_count} invoices</div>')
-        else:
-            message_parts.append(
-                f'<div {item_style} style="color: #e74c3c;">❌ Error: Failed to process all invoices</div>')
+    The written rows make a manual change to the invoice Sales Team count as
+    an input change.
 
-    message_parts.append('</div>')
-    return "".join(message_parts)
+    Args:
+        sales_invoice: Invoice context (see prefetch_invoice_context)
+        payment_entry_name: Name of Payment Entry
+        sales_team_cache: Optional dict shared across calls (see get_original_sales_team)
+
+    Returns:
+        list: [resolved members, rows written for this Payment Entry]
+    """
+    resolved = [
+        [member.get('sales_person'), flt(member.get('commission_rate')),
+         flt(member.get('allocated_percentage'))]
+        for member in get_original_sales_team(sales_invoice, sales_team_cache)
+    ]
+    written = [
+        [row.sales_person, flt(row.incentives, 2), str(row.custom_date or "")]
+        for row in sales_invoice.get('sales_team') or []
+        if row.custom_payment_entry == payment_entry_name
+    ]
+    return [resolved, written]
+
+
+def calculate_input_fingerprint(payment_entry, invoice_context, sales_team_cache=None):
+    """
+    Hash the inputs of the net contribution calculation
+
+    Inputs: references (doctype, name, allocated), deductions, total allocated,
+    posting date and the Sales Team version of every referenced invoice.
+    Fields that do not affect the calculation (remarks, accounts, ...) are
+    ignored, so editing them does not trigger a recalculation.
+
+    Args:
+        payment_entry: Payment Entry document (values being saved)
+        invoice_context: dict from prefetch_invoice_context
+        sales_team_cache: Optional dict shared across calls (see get_original_sales_team)
+
+    Returns:
+        str: SHA1 hex digest
+    """
+    sales_team_versions = {}
+    for invoice_name in get_sales_invoice_names(payment_entry):
+        sales_invoice = get_invoice_context(invoice_context, invoice_name)
+        sales_team_versions[invoice_name] = get_sales_team_version(
+            sales_invoice, payment_entry.name, sales_team_cache) if sales_invoice else None
+
+    inputs = {
+        "version": FINGERPRINT_VERSION,
+        "posting_date": str(payment_entry.posting_date or ""),
+        "total_allocated_amount": flt(payment_entry.total_allocated_amount),
+        "references": [
+            [row.reference_doctype, row.reference_name, flt(row.allocated_amount)]
+            for row in payment_entry.get('references') or []
+        ],
+        "deductions": [flt(row.amount) for row in payment_entry.get('deductions') or []],
+        "sales_team": sales_team_versions,
+    }
+
+    return hashlib.sha1(
+        json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_calculation_memo(payment_entry_name):
+    """
+    Get the calculation recorded earlier in this request for a Payment Entry
+
+    Args:
+        payment_entry_name: Name of Payment Entry
+
+    Returns:
+        frappe._dict | None: {"fingerprint", "invoice_context"}
+    """
+    return (frappe.flags.net_contribution_memo or {}).get(payment_entry_name)
+
+
+def set_calculation_memo(payment_entry_name, fingerprint, invoice_context):
+    """
+    Record a finished (or skipped as unchanged) calculation for this request
+
+    frappe.flags is reset for every request / job, so on_submit can reuse the
+    result of validate in the same submit without leaking across requests.
+
+    Args:
+        payment_entry_name: Name of Payment Entry
+        fingerprint: Input fingerprint after the calculation
+        invoice_context: dict from prefetch_invoice_context (synced with the writes)
+    """
+    if frappe.flags.net_contribution_memo is None:
+        frappe.flags.net_contribution_memo = {}
+
+    frappe.flags.net_contribution_memo[payment_entry_name] = frappe._dict(
+        fingerprint=fingerprint,
+        invoice_context=invoice_context
+    )
 
 
 # ============================================================================
-# SECTION 9: MAIN CALCULATION FUNCTION
+# SECTION 10: MAIN CALCULATION FUNCTION
 # ============================================================================
 
 @frappe.whitelist()
-def calculate_net_contribution(payment_entry_name):
+def calculate_net_contribution(payment_entry_name, debug=None):
     """
-    Main function to calculate net paid after all deductions and update Sales Invoice Sales Team
-
-    Flow:
-    1. Validate Payment Entry name
-    2. Get Payment Entry document
-    3. Validate fields
-    4. Analyze references (determine case type)
-    5. Calculate total deductions
-    6. Distribute deductions to invoices
-    7. Process invoices based on case type
-    8. Return aggregated result
+    Whitelisted API to calculate net contribution for one Payment Entry
 
     Args:
         payment_entry_name: Name of the Payment Entry document
+        debug: Return the per-stage breakdown under "profile" (System Manager only,
+            see pipeline_profiler)
 
     Returns:
         dict: Result message and calculated values
     """
-    try:
-        # Step 1: Validate Payment Entry name
+    debug = cint(debug) and "System Manager" in frappe.get_roles()
+
+    with pipeline_profiler.profiled_call(
+            "calculate_net_contribution", payment_entry_name, force=debug) as profile:
+        result = run_net_contribution(payment_entry_name, render_message=True)
+
+    if debug and profile:
+        result["profile"] = profile.summary
+
+    return result
+
+
+def run_net_contribution(payment_entry_name, sales_team_cache=None,
+                         update_references=True, render_message=False,
+                         invoice_context=None):
+    """
+    Load a Payment Entry by name and calculate its net contribution
+
+    Used by the whitelisted API (form button) and bulk recalculation. Hooks
+    already hold the document and call calculate_net_contribution_for_doc.
+
+    Args:
+        payment_entry_name: Name of the Payment Entry document
+        sales_team_cache: Optional dict {(doctype, name): sales_team} shared across
+            Payment Entries (used by bulk recalculation)
+        update_references: See calculate_net_contribution_for_doc
+        render_message: See calculate_net_contribution_for_doc
+        invoice_context: Optional dict from prefetch_invoice_context to reuse
+
+    Returns:
+        dict: See calculate_net_contribution_for_doc
+    """
+    # Validate Payment Entry name and get the document
+    with pipeline_profiler.profile_stage("load"):
         payment_entry_name = validate_payment_entry_name(payment_entry_name)
+        payment_entry = pipeline_profiler.get_doc("Payment Entry", payment_entry_name)
 
-        # Step 2: Get Payment Entry document
-        payment_entry = frappe.get_doc("Payment Entry", payment_entry_name)
+    return calculate_net_contribution_for_doc(
+        payment_entry, sales_team_cache=sales_team_cache,
+        update_references=update_references, render_message=render_message,
+        invoice_context=invoice_context
+    )
 
-        # Step 3: Validate fields
-        validation_result = validate_payment_entry_fields(payment_entry)
+
+@pipeline_profiler.profiled("calculate_net_contribution_for_doc")
+def calculate_net_contribution_for_doc(payment_entry, sales_team_cache=None,
+                                       update_references=True, render_message=False,
+                                       invoice_context=None):
+    """
+    Main function to calculate net paid after all deductions and update Sales Invoice Sales Team
+
+    Works on the given (possibly unsaved) Payment Entry document: hooks pass the
+    live document, so the values being saved are used and the Payment Entry is
+    not loaded again.
+
+    Flow:
+    1. Validate fields
+    2. Analyze references (determine case type)
+    3. Calculate total deductions
+    4. Distribute deductions to invoices
+    5. Prefetch invoice context (headers + Sales Team rows)
+    6. Process invoices based on case type
+    7. Persist Payment Entry References custom fields (one UPDATE) and, for
+       submitted entries, the Sales Person Contribution Ledger
+    8. Render the HTML message (interactive button only)
+    9. Return aggregated result
+
+    Args:
+        payment_entry: Payment Entry document
+        sales_team_cache: Optional dict {(doctype, name): sales_team} shared across
+            Payment Entries (used by bulk recalculation)
+        update_references: Write References custom fields to the database. Pass False
+            when the caller sets "reference_values" on the document being saved.
+        render_message: Render the HTML message. Hooks and batch callers leave it
+            False and only use the structured values.
+        invoice_context: Optional dict from prefetch_invoice_context to reuse
+
+    Returns:
+        dict: Status, calculated values, "reference_values"
+              ({reference_row_name: {fieldname: value}}), "error" and
+              "message" (HTML, empty unless render_message)
+    """
+    payment_entry_name = payment_entry.name
+
+    try:
+        # Step 1: Validate fields
+        with pipeline_profiler.profile_stage("validate"):
+            validation_result = validate_payment_entry_fields(payment_entry)
         if validation_result["status"] == "error":
             frappe.throw(validation_result["message"])
         if validation_result["status"] == "skip":
@@ -1126,70 +1818,104 @@ def calculate_net_contribution(payment_entry_name):
                 "message": validation_result["message"]
             }
 
-        # Step 4: Analyze references
-        references_analysis = analyze_payment_entry_references(payment_entry)
+        # Step 2: Analyze references
+        with pipeline_profiler.profile_stage("analyze_references"):
+            references_analysis = analyze_payment_entry_references(payment_entry)
 
-        # For now, only support Sales Invoice
-        if references_analysis["sales_order_references"]:
-            frappe.throw(
-                _("Sales Order support will be added later. Please use Sales Invoice only."))
-
-        if not references_analysis["sales_invoice_references"]:
+        # Sales Order references are advances: recorded as pending on submit
+        sales_order_references = references_analysis["sales_order_references"]
+        if not (references_analysis["sales_invoice_references"] or sales_order_references):
             frappe.throw(_("No Sales Invoice found in references"))
 
-        # Step 4.5: Validate only Case 1 (single invoice) is allowed
+        # Step 2.5: Every case type is processed ("no_invoices": advances only)
         case_type = references_analysis["case_type"]
-        if case_type != "single_invoice":
-            frappe.throw(_("Only one invoice allowed"))
-
-        # Step 5: Calculate total deductions
-        total_deductions = calculate_total_deductions(payment_entry)
-
-        # Step 6: Get total paid amount
-        try:
-            total_paid = flt(payment_entry.total_allocated_amount or 0)
-        except (ValueError, TypeError):
-            total_paid = 0
 
-        # Step 7: Distribute deductions to invoices
-        invoice_deductions = distribute_deductions_to_invoices(
-            references_analysis["sales_invoice_references"],
-            total_deductions,
-            total_paid
-        )
+        # Fallback Sales Teams (Sales Order / Customer) are resolved once per call
+        if sales_team_cache is None:
+            sales_team_cache = {}
 
-        # Step 8: Process Case 1 only (single invoice)
-        invoice_name = list(
-            references_analysis["sales_invoice_references"].keys())[0]
-        allocated_amount = references_analysis["sales_invoice_references"][invoice_name]
-        invoice_deduction = invoice_deductions.get(invoice_name, 0)
+        with pipeline_profiler.profile_stage("deductions"):
+            # Step 3: Calculate total deductions
+            total_deductions = calculate_total_deductions(payment_entry)
 
-        result = process_single_invoice_case(
-            payment_entry, payment_entry_name, invoice_name,
-            allocated_amount, invoice_deduction
-        )
+            # Step 3.5: Get total paid amount
+            try:
+                total_paid = flt(payment_entry.total_allocated_amount or 0)
+            except (ValueError, TypeError):
+                total_paid = 0
 
-        # Add completion and summary messages
-        if result.get("status") == "success":
-            completion_msg = generate_completion_message(
-                case_type, [result]
-            )
-            summary_msg = generate_summary_message(
-                payment_entry, references_analysis,
+            # Step 4: Distribute deductions to invoices
+            invoice_deductions = distribute_deductions_to_invoices(
                 references_analysis["sales_invoice_references"],
-                invoice_deductions, [result]
+                total_deductions,
+                total_paid
             )
-            # Combine messages: completion + summary + details (minimal spacing)
-            if result.get("message"):
-                result["message"] = completion_msg + \
-                    "<div style='margin-top: 2px;'></div>" + summary_msg + \
-                    "<div style='margin-top: 2px;'></div>" + \
-                    result["message"]
+
+        # Step 5: Prefetch invoice headers and Sales Teams once for the whole pipeline
+        if invoice_context is None:
+            with pipeline_profiler.profile_stage("prefetch"):
+                invoice_context = prefetch_invoice_context(
+                    references_analysis["sales_invoice_references"])
+
+        # Step 6: Process invoices based on case type (advance only: nothing to process)
+        if case_type == "no_invoices":
+            result = {"status": "success", "values": {}, "reference_values": {}}
+        else:
+            with pipeline_profiler.profile_stage("process_invoices"):
+                result = process_invoices(
+                    payment_entry, payment_entry_name, case_type,
+                    references_analysis["sales_invoice_references"], invoice_deductions,
+                    invoice_context=invoice_context, sales_team_cache=sales_team_cache
+                )
+        invoice_results = (result.get("values") or {}).get("results") \
+            if case_type == "multiple_invoices" else [result]
+
+        if sales_order_references and result.get("status") == "success":
+            result.setdefault("values", {})["pending_advances"] = sales_order_references
+
+        # Step 7: Persist References custom fields with one set-based UPDATE
+        if update_references and result.get("status") == "success":
+            with pipeline_profiler.profile_stage("update_references"):
+                update_payment_entry_references(
+                    payment_entry_name, result.get("reference_values"))
+
+            if payment_entry.docstatus == 1:
+                with pipeline_profiler.profile_stage("ledger"):
+                    sync_contribution_ledger(
+                        payment_entry, invoice_context, sales_team_cache)
+
+                if sales_order_references:
+                    with pipeline_profiler.profile_stage("advances"):
+                        sync_advance_contributions(payment_entry)
+
+        # Step 8: Render the message only for the interactive button
+        message = ""
+        if render_message and result.get("status") == "success":
+            try:
+                with pipeline_profiler.profile_stage("render_message"):
+                    if case_type != "no_invoices":
+                        message = render_net_contribution_message(
+                            payment_entry, case_type,
+                            references_analysis["sales_invoice_references"],
+                            invoice_deductions, invoice_results, invoice_context
+                        )
+                    if sales_order_references:
+                        message += "<p>{0}</p>".format(_(
+                            "Advance recorded as pending contribution for Sales Order {0}; "
+                            "it is attributed when the Sales Invoice is submitted").format(
+                                ", ".join(sales_order_references)))
+            except Exception:
+                # The calculation is already written; do not fail on the message
+                frappe.log_error(frappe.get_traceback(), _(
+                    "Error rendering net contribution message"))
+                message = _("Net contribution updated")
 
         return {
             "status": result.get("status", "success"),
-            "message": result.get("message", ""),
-            "values": result.get("values", {})
+            "message": message,
+            "error": result.get("error"),
+            "values": result.get("values", {}),
+            "reference_values": result.get("reference_values") or {}
         }
 
     except frappe.ValidationError:
@@ -1201,13 +1927,17 @@ def calculate_net_contribution(payment_entry_name):
 
 
 # ============================================================================
-# SECTION 10: HOOK FUNCTIONS
+# SECTION 11: HOOK FUNCTIONS
 # ============================================================================
 
+@pipeline_profiler.profiled("on_validate")
 def on_validate(doc, method=None):
     """
     Automatically calculate net contribution when Payment Entry is validated (on save)
     Only for payment_type = "Receive" and only for existing documents (not new)
+
+    Skipped when the input fingerprint matches the one stored by the last
+    calculation (e.g. only a remark changed).
     """
     if doc.payment_type != "Receive":
         return
@@ -1216,8 +1946,30 @@ def on_validate(doc, method=None):
     if doc.is_new() or getattr(doc, "__islocal", False):
         return
 
+    # Background submit: the job calculates after the commit
+    if doc.docstatus == 1 and should_process_submit_async(doc):
+        return
+
     try:
-        calculate_net_contribution(doc.name)
+        with pipeline_profiler.profile_stage("prefetch"):
+            invoice_context = prefetch_invoice_context(get_sales_invoice_names(doc))
+        with pipeline_profiler.profile_stage("fingerprint"):
+            fingerprint = calculate_input_fingerprint(doc, invoice_context)
+        if fingerprint == doc.get(FINGERPRINT_FIELD):
+            set_calculation_memo(doc.name, fingerprint, invoice_context)
+            return
+
+        # References custom fields are set in memory and saved with the document
+        with net_contribution_savepoint():
+            result = calculate_net_contribution_for_doc(
+                doc, update_references=False, invoice_context=invoice_context)
+        set_reference_values(doc, result.get("reference_values"))
+
+        # Fingerprint after the write, so the rows just written are part of it
+        if result.get("status") == "success":
+            fingerprint = calculate_input_fingerprint(doc, invoice_context)
+            doc.set(FINGERPRINT_FIELD, fingerprint)
+            set_calculation_memo(doc.name, fingerprint, invoice_context)
     except Exception as e:
         # Log error but don't prevent save
         frappe.log_error(
@@ -1227,16 +1979,47 @@ def on_validate(doc, method=None):
         )
 
 
+@pipeline_profiler.profiled("on_submit")
 def on_submit(doc, method=None):
     """
     Automatically calculate net contribution when Payment Entry is submitted
     Only for payment_type = "Receive"
+
+    validate runs just before on_submit in the same request. When it already
+    calculated (or found the inputs unchanged) and the fingerprint still
+    matches, the result is reused and only the fingerprint is finalized.
+    In async mode the calculation is handed to a background job instead.
     """
     if doc.payment_type != "Receive":
         return
 
+    if should_process_submit_async(doc):
+        enqueue_submitted_payment_entry(doc)
+        return
+
     try:
-        calculate_net_contribution(doc.name)
+        memo = get_calculation_memo(doc.name)
+        with pipeline_profiler.profile_stage("fingerprint"):
+            memo_matches = memo and calculate_input_fingerprint(
+                doc, memo.invoice_context) == memo.fingerprint
+        if memo_matches:
+            with pipeline_profiler.profile_stage("ledger"), net_contribution_savepoint():
+                sync_contribution_ledger(doc, memo.invoice_context)
+                sync_advance_contributions(doc)
+            finalize_net_contribution(doc, memo.fingerprint)
+            return
+
+        with pipeline_profiler.profile_stage("prefetch"):
+            invoice_context = prefetch_invoice_context(get_sales_invoice_names(doc))
+        with net_contribution_savepoint():
+            result = calculate_net_contribution_for_doc(doc, invoice_context=invoice_context)
+        # Keep the in-memory rows in line with the References UPDATE
+        set_reference_values(doc, result.get("reference_values"))
+
+        if result.get("status") == "success":
+            fingerprint = calculate_input_fingerprint(doc, invoice_context)
+            finalize_net_contribution(doc, fingerprint)
+            set_calculation_memo(doc.name, fingerprint, invoice_context)
     except Exception as e:
         # Log error but don't prevent submission
         frappe.log_error(
@@ -1246,40 +2029,53 @@ def on_submit(doc, method=None):
         )
 
 
+def finalize_net_contribution(doc, fingerprint):
+    """
+    Store the input fingerprint of a submitted Payment Entry
+
+    on_submit runs after the document is written, so the value is set with
+    db_set (only when it differs from the stored one).
+
+    Args:
+        doc: Payment Entry document
+        fingerprint: Input fingerprint after the calculation
+    """
+    if doc.get(FINGERPRINT_FIELD) != fingerprint:
+        doc.db_set(FINGERPRINT_FIELD, fingerprint, update_modified=False)
+
+
+@pipeline_profiler.profiled("on_cancel")
 def on_cancel(doc, method=None):
     """
     Remove Sales Team entries associated with this Payment Entry when cancelled
+    and reverse its Sales Person Contribution Ledger rows
     Only for payment_type = "Receive"
     """
     if doc.payment_type != "Receive":
         return
 
     try:
-        # Analyze references to get all Sales Invoices
-        references_analysis = analyze_payment_entry_references(doc)
+        with pipeline_profiler.profile_stage("ledger"), net_contribution_savepoint():
+            contribution_ledger.cancel_ledger_entries(doc.name)
+            advance_contribution.cancel_advance_entries(doc.name)
+    except Exception as e:
+        frappe.log_error(
+            frappe.get_traceback(),
+            _("Error reversing contribution ledger on cancel Payment Entry {0}").format(
+                doc.name)
+        )
 
-        # Process each Sales Invoice to remove Payment Entry references
-        for invoice_name in references_analysis["sales_invoice_references"].keys():
-            try:
-                sales_invoice = frappe.get_doc("Sales Invoice", invoice_name)
-                removed_count = remove_sales_team_for_payment_entry(
-                    sales_invoice, doc.name)
-
-                if removed_count > 0:
-                    sales_invoice.save(ignore_permissions=True)
-                    frappe.db.commit()
-
-                    frappe.msgprint(
-                        _("Deleted {0} row(s) from Sales Team in invoice {1}").format(
-                            removed_count, invoice_name),
-                        indicator="green"
-                    )
-            except Exception as e:
-                frappe.log_error(
-                    frappe.get_traceback(),
-                    _("Error removing sales person commission from invoice {0} on cancel Payment Entry {1}").format(
-                        invoice_name, doc.name)
-                )
+    try:
+        # Committed together with the cancellation
+        with pipeline_profiler.profile_stage("remove_sales_team"), net_contribution_savepoint():
+            removed_counts = remove_sales_team_for_payment_entry(doc.name)
+
+        if removed_counts:
+            frappe.msgprint(
+                _("Deleted {0} row(s) from Sales Team in invoice(s) {1}").format(
+                    sum(removed_counts.values()), ", ".join(removed_counts)),
+                indicator="green"
+            )
     except Exception as e:
         # Log error but don't prevent cancellation
         frappe.log_error(
@@ -1287,3 +2083,623 @@ def on_cancel(doc, method=None):
             _("Error removing sales person commission on cancel Payment Entry {0}").format(
                 doc.name)
         )
+
+
+# ============================================================================
+# SECTION 12: ASYNC SUBMIT FUNCTIONS
+# ============================================================================
+
+def should_process_submit_async(payment_entry):
+    """
+    Check whether the submit calculation runs in a background job
+
+    Site config:
+    - sales_person_net_contribution_async_submit: 1 for every submit
+    - sales_person_net_contribution_async_reference_threshold: N to send only
+      Payment Entries with more than N references to the background
+
+    Args:
+        payment_entry: Payment Entry document
+
+    Returns:
+        bool: True to enqueue instead of calculating in the request
+    """
+    if cint(frappe.conf.get(ASYNC_SUBMIT_CONFIG_KEY)):
+        return True
+
+    threshold = cint(frappe.conf.get(ASYNC_REFERENCE_THRESHOLD_CONFIG_KEY))
+    return bool(threshold) and len(payment_entry.get('references') or []) > threshold
+
+
+def get_async_submit_queue():
+    """
+    Get the RQ queue for background submits
+
+    Returns:
+        str: ASYNC_SUBMIT_QUEUE when a worker is configured for it, else "short"
+    """
+    from frappe.utils.background_jobs import get_queues_timeout
+
+    return ASYNC_SUBMIT_QUEUE if ASYNC_SUBMIT_QUEUE in get_queues_timeout() else "short"
+
+
+def get_async_submit_key(root_name):
+    """
+    Build the Redis key holding the latest submitted amendment of a chain
+
+    Plain GET / SET are used (not frappe.cache.get_value) so a running job
+    sees values written by other processes instead of its local cache.
+
+    Args:
+        root_name: Root name of the amendment chain
+
+    Returns:
+        str: Redis key with site prefix
+    """
+    return frappe.cache.make_key(f"{ASYNC_SUBMIT_CACHE_KEY}:{root_name}")
+
+
+def get_latest_submitted(root_name):
+    """
+    Get the latest submitted amendment recorded for a chain
+
+    Args:
+        root_name: Root name of the amendment chain
+
+    Returns:
+        str | None: Payment Entry name
+    """
+    value = frappe.cache.get(get_async_submit_key(root_name))
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def get_amendment_root(payment_entry):
+    """
+    Get the first document of an amendment chain
+
+    Args:
+        payment_entry: Payment Entry document
+
+    Returns:
+        str: Name of the original (non-amended) Payment Entry
+    """
+    root_name = payment_entry.name
+    amended_from = payment_entry.amended_from
+
+    while amended_from:
+        root_name = amended_from
+        amended_from = frappe.db.get_value("Payment Entry", amended_from, "amended_from")
+
+    return root_name
+
+
+def get_async_submit_lock_key(root_name):
+    """
+    Build the Redis key of the lock held by the job processing a chain
+
+    Args:
+        root_name: Root name of the amendment chain
+
+    Returns:
+        str: Redis key with site prefix
+    """
+    return frappe.cache.make_key(f"{ASYNC_SUBMIT_LOCK_KEY}:{root_name}")
+
+
+def clear_latest_submitted(root_name, payment_entry_name):
+    """
+    Delete the latest submitted amendment of a chain if it is still the given one
+
+    Args:
+        root_name: Root name of the amendment chain
+        payment_entry_name: Amendment that was processed
+
+    Returns:
+        bool: True when deleted, False when a newer amendment was recorded
+    """
+    return bool(frappe.cache.eval(
+        COMPARE_AND_DELETE_SCRIPT, 1, get_async_submit_key(root_name), payment_entry_name))
+
+
+def is_submit_job_queued(job_id):
+    """
+    Check whether the job of a chain is waiting in its queue (not yet started)
+
+    Args:
+        job_id: Job id passed to frappe.enqueue
+
+    Returns:
+        bool | None: True when queued, False when started, None when there is no such job
+    """
+    from frappe.utils.background_jobs import get_job
+
+    job = get_job(job_id)
+    if not job:
+        return None
+
+    status = job.get_status()
+    if status == "queued":
+        return True
+    return False if status == "started" else None
+
+
+def enqueue_submitted_payment_entry(payment_entry):
+    """
+    Enqueue one background job per amendment chain after the submit is committed
+
+    The latest submitted amendment is stored in Redis under the chain root
+    after the commit, so a job never reads an uncommitted document.
+    Repeated submits collapse into a job that is still queued; a started job
+    may already have done its final check, so a follow-up job is enqueued
+    (see process_submitted_payment_entry).
+
+    Args:
+        payment_entry: Submitted Payment Entry document
+    """
+    root_name = get_amendment_root(payment_entry)
+    frappe.db.after_commit.add(
+        partial(queue_submitted_payment_entry, root_name, payment_entry.name))
+
+
+def queue_submitted_payment_entry(root_name, payment_entry_name):
+    """
+    After-commit callback: record the latest amendment and enqueue its job
+
+    Args:
+        root_name: Root name of the amendment chain
+        payment_entry_name: Submitted Payment Entry name
+    """
+    frappe.cache.set(get_async_submit_key(root_name), payment_entry_name, ex=24 * 60 * 60)
+
+    job_id = f"net_contribution_submit::{root_name}"
+    job_queued = is_submit_job_queued(job_id)
+    if job_queued:
+        return
+
+    frappe.enqueue(
+        process_submitted_payment_entry,
+        queue=get_async_submit_queue(),
+        # A started job keeps its id; the follow-up job gets its own
+        job_id=job_id if job_queued is None else None,
+        root_name=root_name
+    )
+
+
+def process_submitted_payment_entry(root_name):
+    """
+    Background job: calculate net contribution for the latest submitted amendment
+
+    Only one job per chain works at a time (Redis lock). A job that finds the
+    lock taken exits: the holder checks the chain again after releasing the
+    lock, so a submit that arrived during its final check is still processed.
+
+    Args:
+        root_name: Root name of the amendment chain (see get_amendment_root)
+    """
+    lock_key = get_async_submit_lock_key(root_name)
+
+    while frappe.cache.set(lock_key, 1, nx=True, ex=ASYNC_SUBMIT_LOCK_TTL):
+        try:
+            process_latest_submitted(root_name)
+        finally:
+            frappe.cache.delete(lock_key)
+
+        if not get_latest_submitted(root_name):
+            break
+
+
+def process_latest_submitted(root_name):
+    """
+    Calculate the latest submitted amendments of a chain until none is left
+
+    Entries submitted while the job runs are picked up before it returns. The
+    chain key is deleted with a compare-and-delete, so an amendment recorded
+    during the final check is never dropped.
+
+    Args:
+        root_name: Root name of the amendment chain
+    """
+    processed_name = None
+
+    while True:
+        payment_entry_name = get_latest_submitted(root_name)
+        if not payment_entry_name:
+            break
+        if payment_entry_name == processed_name:
+            if clear_latest_submitted(root_name, processed_name):
+                break
+            continue
+
+        calculate_submitted_payment_entry(payment_entry_name)
+        processed_name = payment_entry_name
+
+
+def calculate_submitted_payment_entry(payment_entry_name):
+    """
+    Calculate one submitted Payment Entry in the background job (one commit)
+
+    Failures are rolled back and logged.
+
+    Args:
+        payment_entry_name: Name of Payment Entry
+    """
+    try:
+        payment_entry = pipeline_profiler.get_doc("Payment Entry", payment_entry_name)
+
+        # Cancelled before the job ran; on_cancel already cleaned up
+        if payment_entry.docstatus == 1:
+            invoice_context = prefetch_invoice_context(
+                get_sales_invoice_names(payment_entry))
+            result = calculate_net_contribution_for_doc(
+                payment_entry, invoice_context=invoice_context)
+
+            if result.get("status") == "success":
+                finalize_net_contribution(
+                    payment_entry,
+                    calculate_input_fingerprint(payment_entry, invoice_context))
+
+        frappe.db.commit()
+    except Exception:
+        frappe.db.rollback()
+        frappe.log_error(
+            frappe.get_traceback(),
+            _("Error calculating net contribution in background for Payment Entry {0}").format(
+                payment_entry_name)
+        )
+    finally:
+        frappe.clear_messages()
+
+
+# ============================================================================
+# SECTION 13: CONTRIBUTION LEDGER FUNCTIONS
+# ============================================================================
+
+def build_ledger_rows(payment_entry, invoice_context, sales_team_cache=None):
+    """
+    Calculate the Sales Person Contribution Ledger rows of a Payment Entry
+
+    Uses the same calculation as the Sales Team update, on the in-memory
+    Payment Entry and the (synced) invoice context.
+
+    Args:
+        payment_entry: Payment Entry document
+        invoice_context: dict from prefetch_invoice_context
+        sales_team_cache: Optional dict shared across calls (see get_original_sales_team)
+
+    Returns:
+        list: Ledger rows (see contribution_ledger.make_ledger_row)
+    """
+    invoices = {}
+    for invoice_name in get_sales_invoice_names(payment_entry):
+        sales_invoice = get_invoice_context(invoice_context, invoice_name)
+        if not sales_invoice:
+            continue
+
+        invoices[invoice_name] = contribution_engine.InvoiceInput(
+            name=invoice_name,
+            grand_total=flt(sales_invoice.grand_total or 0),
+            total_taxes_and_charges=flt(sales_invoice.total_taxes_and_charges or 0),
+            sales_team=build_sales_team_members(
+                get_original_sales_team(sales_invoice, sales_team_cache))
+        )
+
+    payment = contribution_engine.PaymentInput(
+        name=payment_entry.name,
+        total_allocated_amount=flt(payment_entry.total_allocated_amount or 0),
+        deductions=[deduction.amount for deduction in payment_entry.get('deductions') or []],
+        references=[
+            contribution_engine.ReferenceInput(
+                name=row.name,
+                invoice_name=row.reference_name,
+                allocated_amount=flt(row.allocated_amount or 0)
+            )
+            for row in payment_entry.get('references') or []
+            if row.reference_doctype == "Sales Invoice" and row.reference_name in invoices
+        ]
+    )
+
+    contribution = contribution_engine.calculate_contribution(payment, invoices)
+
+    ledger_rows = []
+    for invoice_name, invoice_result in contribution.invoices.items():
+        sales_invoice = get_invoice_context(invoice_context, invoice_name)
+        for incentive in invoice_result.incentives:
+            ledger_rows.append(contribution_ledger.make_ledger_row(
+                payment_entry.name, payment_entry.posting_date, sales_invoice,
+                incentive.sales_person, incentive.commission_rate,
+                invoice_result.allocated_amount,
+                invoice_result.net_paid_after_all_deductions,
+                incentive.incentives
+            ))
+
+    return ledger_rows
+
+
+def sync_contribution_ledger(payment_entry, invoice_context, sales_team_cache=None):
+    """
+    Bring the ledger rows of a submitted Payment Entry in line with its calculation
+
+    Only rows of the referenced Sales Invoices are compared; rows of invoices
+    the Payment Entry reached through a Sales Order advance are kept.
+
+    Args:
+        payment_entry: Payment Entry document (submitted)
+        invoice_context: dict from prefetch_invoice_context (synced with the writes)
+        sales_team_cache: Optional dict shared across calls (see get_original_sales_team)
+
+    Returns:
+        bool: True if the ledger was changed
+    """
+    invoice_names = set(get_sales_invoice_names(payment_entry))
+    active_rows = [
+        row for row in contribution_ledger.get_active_ledger_entries(
+            [payment_entry.name]).get(payment_entry.name, [])
+        if row.sales_invoice in invoice_names
+    ]
+
+    return contribution_ledger.replace_ledger_entries(
+        payment_entry.name,
+        build_ledger_rows(payment_entry, invoice_context, sales_team_cache),
+        active_rows=active_rows
+    )
+
+
+# ============================================================================
+# SECTION 14: SALES ORDER ADVANCE FUNCTIONS
+# ============================================================================
+
+def sync_advance_contributions(payment_entry):
+    """
+    Record the Sales Order references of a submitted Payment Entry as pending advances
+
+    Deductions are shared with the same formula as for invoices (by allocated
+    amount over the total allocated amount). Advances whose orders already
+    have submitted Sales Invoices are attributed to them right away.
+
+    Args:
+        payment_entry: Payment Entry document (submitted)
+
+    Returns:
+        bool: True if advance rows were written
+    """
+    sales_order_references = analyze_payment_entry_references(
+        payment_entry)["sales_order_references"]
+    if not sales_order_references:
+        return False
+
+    order_deductions = distribute_deductions_to_invoices(
+        sales_order_references,
+        calculate_total_deductions(payment_entry),
+        flt(payment_entry.total_allocated_amount or 0)
+    )
+
+    written = advance_contribution.sync_advance_entries(
+        payment_entry, sales_order_references, order_deductions)
+
+    # Orders invoiced before the advance was paid
+    if written:
+        attribute_advance_contributions(
+            advance_contribution.get_submitted_order_invoices(sales_order_references))
+
+    return written
+
+
+def allocate_pending_advances(invoice_orders, invoice_context, advances_by_order,
+                              attributed_amounts=None):
+    """
+    Assign pending advances to submitted invoices of their Sales Orders (oldest advance first)
+
+    An invoice takes at most its grand total less the advances already
+    attributed to it. A fully used advance row becomes Attributed to the
+    invoice; a partly used one is split: the used part (with its share of
+    the deduction) becomes a new Attributed row and the row keeps the rest.
+
+    Args:
+        invoice_orders: dict {invoice_name: [sales_order]}
+        invoice_context: dict from prefetch_invoice_context
+        advances_by_order: dict {sales_order: [pending advance rows]}
+        attributed_amounts: Optional dict {invoice_name: amount already attributed}
+
+    Returns:
+        tuple: ({(payment_entry, invoice_name): {"allocated", "deduction", "posting_date"}},
+                [updated advance rows], [new Attributed rows])
+    """
+    attributed_amounts = attributed_amounts or {}
+    allocations = {}
+    updated = {}
+    new_rows = []
+
+    for invoice_name, sales_orders in invoice_orders.items():
+        invoice = invoice_context.get(invoice_name)
+        if not invoice or invoice.docstatus != 1:
+            continue
+
+        capacity = flt(invoice.grand_total) - flt(attributed_amounts.get(invoice_name))
+        for sales_order in sales_orders:
+            for advance in advances_by_order.get(sales_order, []):
+                allocated_amount = flt(advance.allocated_amount)
+                if advance.sales_invoice or capacity <= 0 or allocated_amount <= 0:
+                    continue
+
+                amount = min(allocated_amount, capacity)
+                deduction = flt(advance.deduction) * amount / allocated_amount
+
+                allocation = allocations.setdefault(
+                    (advance.payment_entry, invoice_name),
+                    frappe._dict(allocated=0.0, deduction=0.0, posting_date=advance.posting_date))
+                allocation.allocated += amount
+                allocation.deduction += deduction
+
+                if amount < allocated_amount:
+                    new_rows.append(frappe._dict(
+                        advance, status="Attributed", allocated_amount=amount,
+                        deduction=deduction, attributed_amount=amount,
+                        sales_invoice=invoice_name))
+                    advance.allocated_amount = allocated_amount - amount
+                    advance.deduction = flt(advance.deduction) - deduction
+                else:
+                    advance.attributed_amount = amount
+                    advance.sales_invoice = invoice_name
+                updated[advance.name] = advance
+                capacity -= amount
+
+    return allocations, list(updated.values()), new_rows
+
+
+def attribute_advance_contributions(invoice_names, sales_team_cache=None):
+    """
+    Attribute pending Sales Order advances to submitted Sales Invoices
+
+    One query maps the invoices to their Sales Orders, one loads (and locks)
+    the pending advances of those orders, one sums what the invoices already
+    took and two load the invoice context. Sales Team rows of all
+    (Payment Entry, invoice) pairs are written together, ledger rows are
+    appended with one INSERT and the advance rows written with one UPDATE
+    and one INSERT (split rows).
+
+    Args:
+        invoice_names: Iterable of submitted Sales Invoice names
+        sales_team_cache: Optional dict shared across calls (see get_original_sales_team)
+
+    Returns:
+        int: Number of advances (partly) attributed
+    """
+    invoice_orders = advance_contribution.get_invoice_sales_orders(invoice_names)
+    if not invoice_orders:
+        return 0
+
+    advances_by_order = advance_contribution.get_pending_advances(
+        sales_order for sales_orders in invoice_orders.values() for sales_order in sales_orders)
+    if not advances_by_order:
+        return 0
+
+    if sales_team_cache is None:
+        sales_team_cache = {}
+
+    invoice_context = prefetch_invoice_context(invoice_orders)
+    allocations, advances, split_rows = allocate_pending_advances(
+        invoice_orders, invoice_context, advances_by_order,
+        advance_contribution.get_attributed_amounts(invoice_orders))
+    if not advances:
+        return 0
+
+    invoice_changes = []
+    ledger_rows = []
+    for (payment_entry_name, invoice_name), allocation in allocations.items():
+        sales_invoice = invoice_context[invoice_name]
+        invoice_result = contribution_engine.calculate_invoice_contribution(
+            contribution_engine.InvoiceInput(
+                name=invoice_name,
+                grand_total=flt(sales_invoice.grand_total or 0),
+                total_taxes_and_charges=flt(sales_invoice.total_taxes_and_charges or 0),
+                sales_team=build_sales_team_members(
+                    get_original_sales_team(sales_invoice, sales_team_cache))
+            ),
+            allocation.allocated, allocation.deduction
+        )
+        if not invoice_result.incentives:
+            continue
+
+        payment_entry_date = getdate(allocation.posting_date)
+        computed_rows = []
+        for incentive in invoice_result.incentives:
+            computed_rows.append({
+                'sales_person': incentive.sales_person,
+                'commission_rate': incentive.commission_rate,
+                'allocated_percentage': incentive.allocated_percentage,
+                'incentives': incentive.incentives,
+                'custom_payment_entry': payment_entry_name,
+                'custom_date': payment_entry_date,
+            })
+            ledger_rows.append(contribution_ledger.make_ledger_row(
+                payment_entry_name, payment_entry_date, sales_invoice,
+                incentive.sales_person, incentive.commission_rate,
+                invoice_result.allocated_amount,
+                invoice_result.net_paid_after_all_deductions,
+                incentive.incentives
+            ))
+
+        invoice_changes.append(
+            (sales_invoice, diff_sales_team_rows(sales_invoice, payment_entry_name, computed_rows)))
+
+    write_sales_team_changes_bulk(invoice_changes)
+    contribution_ledger.insert_ledger_entries(ledger_rows)
+    advance_contribution.update_attributed_advances(advances)
+    advance_contribution.insert_advance_entries(split_rows)
+
+    return len(advances)
+
+
+def revert_advance_contributions(invoice_name):
+    """
+    Undo the advances attributed to a cancelled Sales Invoice
+
+    Reverses the ledger rows of its (Payment Entry, invoice) pairs, deletes
+    their Sales Team rows and puts the advance rows back to Pending, so an
+    amended invoice (or another invoice of the order) can take them again.
+
+    Args:
+        invoice_name: Name of the cancelled Sales Invoice
+
+    Returns:
+        int: Number of advance rows put back to Pending
+    """
+    advances = advance_contribution.get_invoice_attributed_advances(invoice_name)
+    if not advances:
+        return 0
+
+    payment_entry_names = tuple(dict.fromkeys(advance.payment_entry for advance in advances))
+
+    active_entries = contribution_ledger.get_active_ledger_entries(payment_entry_names)
+    contribution_ledger.reverse_ledger_entries([
+        row for rows in active_entries.values() for row in rows
+        if row.sales_invoice == invoice_name
+    ])
+
+    frappe.db.sql("""
+        DELETE FROM `tabSales Team`
+        WHERE custom_payment_entry IN %(payment_entries)s
+            AND parent = %(invoice)s AND parenttype = 'Sales Invoice'
+    """, {"payment_entries": payment_entry_names, "invoice": invoice_name})
+    frappe.clear_document_cache("Sales Invoice", invoice_name)
+
+    advance_contribution.reset_attributed_advances([advance.name for advance in advances])
+
+    return len(advances)
+
+
+def on_sales_invoice_cancel(doc, method=None):
+    """
+    Hook: put the advances attributed to the invoice back to Pending
+
+    Runs in the cancel transaction; a failure is logged and does not block
+    the cancel.
+    """
+    try:
+        with net_contribution_savepoint():
+            revert_advance_contributions(doc.name)
+    except Exception:
+        frappe.log_error(
+            frappe.get_traceback(),
+            _("Error reverting Sales Order advances of Sales Invoice {0}").format(doc.name)
+        )
+
+
+def on_sales_invoice_submit(doc, method=None):
+    """
+    Hook: attribute pending advances of the invoice's Sales Orders
+
+    Runs in the submit transaction; a failure is logged and does not block
+    the submit (the advances stay pending).
+    """
+    if not any(item.get('sales_order') for item in doc.get('items') or []):
+        return
+
+    try:
+        with net_contribution_savepoint():
+            attribute_advance_contributions([doc.name])
+    except Exception:
+        frappe.log_error(
+            frappe.get_traceback(),
+            _("Error attributing Sales Order advances to Sales Invoice {0}").format(doc.name)
+        )
@@ -0,0 +1,271 @@
+"""
+Pipeline Profiler
+Per-stage wall time, SQL query count and get_doc count for the net contribution pipeline
+
+Disabled by default. Enable it in site_config.json:
+    "sales_person_net_contribution_profile": 1,
+    "sales_person_net_contribution_profile_slow_ms": 1000
+
+While enabled, every calculate_net_contribution call and Payment Entry hook
+is profiled; calls slower than the threshold are written as one JSON line to
+logs/sales_person_net_contribution.log. A System Manager can also profile a
+single button call with calculate_net_contribution(..., debug=1), which
+returns the breakdown under "profile" regardless of the site config.
+
+Stages nest: a stage entered inside another is named "<outer>.<inner>" and
+its counts are included in the outer stage. Only the outermost profiled
+call collects and logs; nested calls (e.g. on_submit ->
+calculate_net_contribution_for_doc) add their stages to it.
+
+Structure:
+1. Configuration Functions
+2. Counter Functions
+3. Profiling Functions
+4. Report Functions
+"""
+
+import functools
+import json
+import time
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import cint, flt
+
+# Site config: profile every call
+PROFILE_CONFIG_KEY = "sales_person_net_contribution_profile"
+
+# Site config: log calls slower than this (milliseconds)
+PROFILE_SLOW_MS_CONFIG_KEY = "sales_person_net_contribution_profile_slow_ms"
+
+DEFAULT_SLOW_MS = 1000
+
+# frappe.logger name (logs/<name>.log)
+PROFILE_LOGGER = "sales_person_net_contribution"
+
+
+# ============================================================================
+# SECTION 1: CONFIGURATION FUNCTIONS
+# ============================================================================
+
+def is_profiling_enabled():
+    """
+    Check the site config switch
+
+    Returns:
+        bool: True if every call is profiled
+    """
+    return bool(cint(frappe.conf.get(PROFILE_CONFIG_KEY)))
+
+
+def get_slow_threshold_ms():
+    """
+    Get the slow call threshold
+
+    Returns:
+        float: Milliseconds (DEFAULT_SLOW_MS when not configured)
+    """
+    return flt(frappe.conf.get(PROFILE_SLOW_MS_CONFIG_KEY)) or DEFAULT_SLOW_MS
+
+
+def get_active_profile():
+    """
+    Get the profile collected in this request / job
+
+    Returns:
+        frappe._dict | None: Active profile
+    """
+    return frappe.flags.net_contribution_profile
+
+
+# ============================================================================
+# SECTION 2: COUNTER FUNCTIONS
+# ============================================================================
+
+def get_doc(*args, **kwargs):
+    """
+    frappe.get_doc for the pipeline's own loads, counted in the active profile
+
+    The count is kept on the request-local profile, so concurrent requests
+    never count each other's loads and frappe.get_doc itself is left alone.
+
+    Returns:
+        Document: See frappe.get_doc
+    """
+    profile = get_active_profile()
+    if profile is not None:
+        profile.get_doc += 1
+    return frappe.get_doc(*args, **kwargs)
+
+
+@contextmanager
+def count_queries(profile):
+    """
+    Count frappe.db.sql calls of this connection while the block runs
+
+    frappe.db is per request, so the wrapper is set on the connection object
+    and removed afterwards (like frappe.recorder).
+
+    Args:
+        profile: Profile whose "sql" counter is incremented
+    """
+    db = frappe.db
+    had_own_sql = "sql" in vars(db)
+    original_sql = db.sql
+
+    def sql(*args, **kwargs):
+        profile.sql += 1
+        return original_sql(*args, **kwargs)
+
+    db.sql = sql
+    try:
+        yield
+    finally:
+        if had_own_sql:
+            db.sql = original_sql
+        else:
+            del db.sql
+
+
+# ============================================================================
+# SECTION 3: PROFILING FUNCTIONS
+# ============================================================================
+
+@contextmanager
+def profiled_call(call, payment_entry_name, force=False):
+    """
+    Profile a pipeline entry point
+
+    Does nothing when profiling is disabled (and not forced) or when an outer
+    call is already profiled.
+
+    Args:
+        call: Entry point name (e.g. "on_submit")
+        payment_entry_name: Name of Payment Entry
+        force: Profile even when the site config switch is off (debug mode)
+
+    Yields:
+        frappe._dict | None: The profile; "summary" is set when the block ends
+    """
+    active_profile = get_active_profile()
+    if active_profile is not None or not (force or is_profiling_enabled()):
+        yield active_profile
+        return
+
+    profile = frappe._dict(
+        call=call,
+        payment_entry=payment_entry_name,
+        sql=0,
+        get_doc=0,
+        stages={},
+        stack=[],
+        started=time.perf_counter(),
+        summary=None,
+    )
+
+    frappe.flags.net_contribution_profile = profile
+    try:
+        with count_queries(profile):
+            yield profile
+    finally:
+        frappe.flags.net_contribution_profile = None
+        profile.summary = get_profile_summary(profile)
+        log_slow_call(profile.summary)
+
+
+def profiled(call):
+    """
+    Decorator: profile a function whose first argument is the Payment Entry document
+
+    Args:
+        call: Entry point name
+
+    Returns:
+        Decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(doc, *args, **kwargs):
+            with profiled_call(call, doc.name):
+                return function(doc, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def profile_stage(stage):
+    """
+    Record wall time, SQL and get_doc count of a pipeline stage
+
+    Repeated stages (e.g. one per invoice) are summed.
+
+    Args:
+        stage: Stage name
+    """
+    profile = get_active_profile()
+    if profile is None:
+        yield
+        return
+
+    profile.stack.append(stage)
+    name = ".".join(profile.stack)
+    started = time.perf_counter()
+    sql, get_doc = profile.sql, profile.get_doc
+
+    try:
+        yield
+    finally:
+        profile.stack.pop()
+        totals = profile.stages.setdefault(name, {"calls": 0, "ms": 0.0, "sql": 0, "get_doc": 0})
+        totals["calls"] += 1
+        totals["ms"] += (time.perf_counter() - started) * 1000
+        totals["sql"] += profile.sql - sql
+        totals["get_doc"] += profile.get_doc - get_doc
+
+
+# ============================================================================
+# SECTION 4: REPORT FUNCTIONS
+# ============================================================================
+
+def get_profile_summary(profile):
+    """
+    Build the breakdown of a finished profile
+
+    Args:
+        profile: Profile from profiled_call
+
+    Returns:
+        dict: {"call", "payment_entry", "total_ms", "sql", "get_doc",
+               "stages": [{"stage", "calls", "ms", "sql", "get_doc"}]}
+    """
+    return {
+        "call": profile.call,
+        "payment_entry": profile.payment_entry,
+        "total_ms": round((time.perf_counter() - profile.started) * 1000, 2),
+        "sql": profile.sql,
+        "get_doc": profile.get_doc,
+        "stages": [
+            {"stage": stage, **totals, "ms": round(totals["ms"], 2)}
+            for stage, totals in profile.stages.items()
+        ],
+    }
+
+
+def log_slow_call(summary):
+    """
+    Write one structured log line for a call slower than the threshold
+
+    Args:
+        summary: See get_profile_summary
+    """
+    if summary["total_ms"] < get_slow_threshold_ms():
+        return
+
+    try:
+        frappe.logger(PROFILE_LOGGER).warning(json.dumps(
+            {"event": "slow_net_contribution", **summary}, default=str, separators=(",", ":")))
+    except Exception:
+        # Profiling must never fail the calculation
+        pass
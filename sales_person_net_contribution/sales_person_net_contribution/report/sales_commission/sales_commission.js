@@ -35,7 +35,31 @@ frappe.query_reports['sales_commission'] = {
 			fieldtype: 'Link',
 			options: 'Sales Person',
 		},
+		{
+			fieldname: 'page_length',
+			label: __('عدد الصفوف'),
+			fieldtype: 'Int',
+		},
+		{
+			fieldname: 'start',
+			label: __('بداية من صف'),
+			fieldtype: 'Int',
+			depends_on: 'eval:doc.page_length',
+		},
 	],
+
+	onload: function(report) {
+		// Full export without paging, streamed by the server
+		['CSV', 'Excel'].forEach(function(file_format) {
+			report.page.add_inner_button(file_format, function() {
+				open_url_post(frappe.request.url, {
+					cmd: 'sales_person_net_contribution.sales_person_net_contribution.report.sales_commission.sales_commission.export_report',
+					filters: JSON.stringify(report.get_filter_values()),
+					file_format: file_format,
+				});
+			}, __('تصدير كامل'));
+		});
+	},
 	
 	formatter: function(value, row, column, data, default_formatter) {
 		value = default_formatter(value, row, column, data);
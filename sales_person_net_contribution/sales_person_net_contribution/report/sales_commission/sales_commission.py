@@ -1,9 +1,25 @@
 # Copyright (c) 2025, abdopcnet@gmail.com and contributors
 # For license information, please see license.txt
 
+import csv
+import io
+import json
+import tempfile
+
 import frappe
 from frappe import _
-from frappe.utils import getdate, flt
+from frappe.utils import add_days, cint, get_first_day, getdate
+
+from sales_person_net_contribution.sales_person_net_contribution import (
+	contribution_ledger,
+	report_cache,
+)
+
+# Export formats of export_report: (extension, mimetype)
+EXPORT_FORMATS = {
+	"CSV": ("csv", "text/csv; charset=utf-8"),
+	"Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
 
 
 def execute(filters=None):
@@ -14,7 +30,8 @@ def execute(filters=None):
 		filters (dict): Dictionary containing filter values
 		
 	Returns:
-		tuple: (columns, data) - columns definition and data rows
+		tuple: (columns, data) - columns definition and data rows, plus a
+			message while the contribution ledger backfill is pending
 	"""
 	if not filters:
 		filters = frappe._dict({})
@@ -22,12 +39,24 @@ def execute(filters=None):
 	# Get columns definition
 	columns = get_columns()
 	
-	# Get data based on filters
-	data = get_data(filters)
+	# Get data based on filters (served from the Redis cache when unchanged)
+	data = report_cache.get_cached_report(filters, get_data)
+	
+	# Receipts submitted before the ledger existed are still being filled in
+	if contribution_ledger.is_backfill_pending():
+		return columns, data, get_backfill_message()
 	
 	return columns, data
 
 
+def get_backfill_message():
+	"""Notice shown while the contribution ledger backfill has not finished"""
+	return _(
+		"جاري تعبئة سجل مساهمات مناديب البيع من المدفوعات السابقة في الخلفية. "
+		"قد لا تظهر بعض الفواتير أو العمولات حتى انتهاء التعبئة."
+	)
+
+
 def get_columns():
 	"""Define report columns"""
 	columns = [
@@ -80,6 +109,16 @@ def get_columns():
 			"label": _("نسبة العمولة (%)"),
 			"fieldtype": "Percent",
 		},
+		{
+			"fieldname": "net_base",
+			"label": _("صافي أساس العمولة"),
+			"fieldtype": "Currency",
+		},
+		{
+			"fieldname": "incentive",
+			"label": _("العمولة المستحقة"),
+			"fieldtype": "Currency",
+		},
 		{
 			"fieldname": "mode_of_payment",
 			"label": _("طريقة الدفع"),
@@ -124,115 +163,319 @@ def get_columns():
 def get_data(filters):
 	"""
 	Get report data based on filters
-	
+
+	Reads the Sales Person Contribution Ledger (active rows only) with indexed
+	range scans on invoice posting date / company / sales person, so the cost
+	grows with the result size, not with the history. Sales Invoice and
+	Payment Entry are joined by primary key for the display columns.
+	One row per invoice, sales person and commission rate; invoices without
+	a calculated receipt have no ledger rows and are not listed.
+	Rows are paged with page_length / start when given. Numeric columns are
+	never NULL (COALESCE in SQL), so rows are returned as read.
+
+	Without paging, ranges longer than a month are read one month at a time
+	(newest first, same order as one query) and progress is published after
+	each month, which the prepared report job shows while it runs.
+
 	Args:
 		filters (dict): Filter dictionary containing from_date, to_date, etc.
-		
+
 	Returns:
 		list: List of dictionaries containing report data
 	"""
-	# Query: One row per invoice with aggregated payment data
+	periods = get_periods(filters)
+	if cint(filters.get("page_length")) or len(periods) <= 1:
+		return run_query(filters)
+
+	data = []
+	for index, (from_date, to_date) in enumerate(periods, 1):
+		data.extend(run_query(frappe._dict(filters, from_date=from_date, to_date=to_date)))
+		frappe.publish_progress(
+			index * 100 / len(periods),
+			title=_("تقرير عمولة مناديب البيع"),
+			description=_("شهر {0} من {1}").format(index, len(periods))
+		)
+
+	return data
+
+
+def run_query(filters):
+	"""
+	Run the report query for the given filters
+
+	Args:
+		filters (dict): Filter dictionary
+
+	Returns:
+		list: List of dictionaries containing report data
+	"""
+	query, params = get_query(filters)
+
+	if params:
+		return frappe.db.sql(query, params, as_dict=True)
+
+	return frappe.db.sql(query, as_dict=True)
+
+
+def get_periods(filters):
+	"""
+	Split the filter date range into calendar months, newest first
+
+	Args:
+		filters (dict): Filter dictionary
+
+	Returns:
+		list: [(from_date, to_date)]; empty when a date filter is missing
+	"""
+	if not filters.get("from_date") or not filters.get("to_date"):
+		return []
+
+	from_date = getdate(filters.get("from_date"))
+	period_end = getdate(filters.get("to_date"))
+
+	periods = []
+	while period_end >= from_date:
+		period_start = max(get_first_day(period_end), from_date)
+		periods.append((period_start, period_end))
+		period_end = add_days(period_start, -1)
+
+	return periods
+
+
+def get_query(filters):
+	"""
+	Build the report query (also used by the EXPLAIN index check)
+
+	Args:
+		filters (dict): Filter dictionary
+
+	Returns:
+		tuple: (query, params_dict)
+	"""
+	# Get conditions and parameters
+	conditions, params = get_conditions(filters)
+
+	# Query: One row per invoice and sales person with aggregated payment data
 	query = """
 		SELECT
-			si.name AS sales_invoice,
-			si.company,
-			si.customer,
-			si.posting_date,
+			l.sales_invoice,
+			l.company,
+			l.customer,
+			l.invoice_posting_date AS posting_date,
 			si.custom_sales_invoice_number AS customer_invoice_reference_no,
-			si.grand_total,
-			(si.grand_total - COALESCE(si.total_taxes_and_charges, 0)) AS subtotal_without_vat,
-			(SELECT sales_person FROM `tabSales Team` 
-			 WHERE parent = si.name AND parenttype = 'Sales Invoice' 
-			 LIMIT 1) AS sales_person,
-			(SELECT commission_rate FROM `tabSales Team` 
-			 WHERE parent = si.name AND parenttype = 'Sales Invoice' 
-			 LIMIT 1) AS commission_rate,
+			COALESCE(si.grand_total, 0) AS grand_total,
+			(COALESCE(si.grand_total, 0) - COALESCE(si.total_taxes_and_charges, 0)) AS subtotal_without_vat,
+			l.sales_person,
+			COALESCE(l.commission_rate, 0) AS commission_rate,
+			COALESCE(SUM(l.net_base), 0) AS net_base,
+			COALESCE(SUM(l.incentive), 0) AS incentive,
 			GROUP_CONCAT(DISTINCT pe.mode_of_payment SEPARATOR ', ') AS mode_of_payment,
 			SUM(COALESCE(pe.paid_amount, 0)) AS paid_amount,
-			SUM(COALESCE(per.allocated_amount, 0)) AS total_allocated_amount,
+			COALESCE(SUM(l.allocated_amount), 0) AS total_allocated_amount,
 			SUM(COALESCE(pe.custom_total_taxes, 0)) AS custom_total_taxes,
 			SUM(COALESCE(pe.custom_total_cheques_amount, 0)) AS custom_total_cheques_amount,
 			GROUP_CONCAT(DISTINCT pe.reference_date SEPARATOR ', ') AS reference_date,
 			GROUP_CONCAT(DISTINCT pe.reference_no SEPARATOR ', ') AS reference_no
-		FROM `tabSales Invoice` si
-		LEFT JOIN `tabPayment Entry Reference` per
-			ON per.reference_doctype = 'Sales Invoice'
-			AND per.reference_name = si.name
-		LEFT JOIN `tabPayment Entry` pe
-			ON pe.name = per.parent
-			AND pe.docstatus = 1
-			AND pe.party_type = 'Customer'
-			AND pe.company = si.company
-		WHERE si.docstatus = 1
+		FROM `tabSales Person Contribution Ledger` l
+		INNER JOIN `tabSales Invoice` si
+			ON si.name = l.sales_invoice
+		INNER JOIN `tabPayment Entry` pe
+			ON pe.name = l.payment_entry
+		WHERE l.is_cancelled = 0
 	"""
-	
-	# Get conditions and parameters
-	conditions, params = get_conditions(filters)
-	
+
 	if conditions:
 		query += " AND " + conditions
-	
+
 	query += """
-		GROUP BY si.name, si.company, si.customer, si.posting_date, 
-		         si.custom_sales_invoice_number, si.grand_total, si.total_taxes_and_charges
-		ORDER BY si.posting_date DESC, si.name DESC
+		GROUP BY l.sales_invoice, l.company, l.customer, l.invoice_posting_date,
+		         si.custom_sales_invoice_number, si.grand_total, si.total_taxes_and_charges,
+		         l.sales_person, l.commission_rate
+		ORDER BY l.invoice_posting_date DESC, l.sales_invoice DESC, l.sales_person
 	"""
-	
-	# Execute query
-	if params:
-		data = frappe.db.sql(query, params, as_dict=True)
-	else:
-		data = frappe.db.sql(query, as_dict=True)
-	
-	# Format numeric fields
-	for row in data:
-		row["grand_total"] = flt(row.get("grand_total", 0))
-		row["subtotal_without_vat"] = flt(row.get("subtotal_without_vat", 0))
-		row["commission_rate"] = flt(row.get("commission_rate", 0))
-		row["paid_amount"] = flt(row.get("paid_amount", 0))
-		row["total_allocated_amount"] = flt(row.get("total_allocated_amount", 0))
-		row["custom_total_taxes"] = flt(row.get("custom_total_taxes", 0))
-		row["custom_total_cheques_amount"] = flt(row.get("custom_total_cheques_amount", 0))
-	
-	return data
 
+	# Paging
+	limit, limit_params = get_limit(filters)
+	query += limit
+	params.update(limit_params)
+
+	return query, params
 
-def get_conditions(filters):
+
+def get_conditions(filters, alias="l"):
 	"""
-	Build WHERE conditions based on filters with proper parameterization
-	
+	Build WHERE conditions on the contribution ledger based on filters with proper parameterization
+
 	Args:
 		filters (dict): Filter dictionary
-		
+		alias (str): Alias of the ledger table in the query
+
 	Returns:
 		tuple: (conditions_string, params_dict) - SQL WHERE conditions and parameters
 	"""
 	conditions = []
 	params = {}
-	
+
 	if filters.get("from_date"):
 		from_date = getdate(filters.get("from_date"))
-		conditions.append("si.posting_date >= %(from_date)s")
+		conditions.append(f"{alias}.invoice_posting_date >= %(from_date)s")
 		params["from_date"] = from_date
-	
+
 	if filters.get("to_date"):
 		to_date = getdate(filters.get("to_date"))
-		conditions.append("si.posting_date <= %(to_date)s")
+		conditions.append(f"{alias}.invoice_posting_date <= %(to_date)s")
 		params["to_date"] = to_date
-	
+
 	if filters.get("company"):
-		conditions.append("si.company = %(company)s")
+		conditions.append(f"{alias}.company = %(company)s")
 		params["company"] = filters.get("company")
-	
+
 	if filters.get("customer"):
-		conditions.append("si.customer = %(customer)s")
+		conditions.append(f"{alias}.customer = %(customer)s")
 		params["customer"] = filters.get("customer")
-	
+
 	if filters.get("sales_person"):
-		conditions.append("sp.sales_person = %(sales_person)s")
+		conditions.append(f"{alias}.sales_person = %(sales_person)s")
 		params["sales_person"] = filters.get("sales_person")
-	
+
 	if conditions:
 		return " AND ".join(conditions), params
-	
+
 	return "", {}
+
+
+def get_limit(filters):
+	"""
+	Build the LIMIT / OFFSET clause from the page_length and start filters
+
+	Args:
+		filters (dict): Filter dictionary
+
+	Returns:
+		tuple: (limit_clause, params_dict) - empty when page_length is not set
+	"""
+	page_length = cint(filters.get("page_length"))
+	if page_length <= 0:
+		return "", {}
+
+	return " LIMIT %(page_length)s OFFSET %(start)s", {
+		"page_length": page_length,
+		"start": max(cint(filters.get("start")), 0),
+	}
+
+
+@frappe.whitelist()
+def export_report(filters=None, file_format="CSV"):
+	"""
+	Stream the full report (no paging) as a CSV or Excel download
+
+	Rows are read with an unbuffered server-side cursor and written one by one
+	to a temporary file, so memory stays constant for any date range. The file
+	is sent after the query finished (the database connection is closed when
+	the request ends).
+
+	Args:
+		filters (dict | str): Report filters
+		file_format (str): "CSV" or "Excel"
+
+	Returns:
+		werkzeug.wrappers.Response: File download
+	"""
+	from werkzeug.wrappers import Response
+	from werkzeug.wsgi import wrap_file
+
+	if not frappe.get_doc("Report", "sales_commission").is_permitted():
+		frappe.throw(_("You don't have access to Report: {0}").format("sales_commission"),
+			frappe.PermissionError)
+
+	if file_format not in EXPORT_FORMATS:
+		frappe.throw(_("Unsupported export format: {0}").format(file_format))
+
+	if isinstance(filters, str):
+		filters = json.loads(filters)
+	filters = frappe._dict(filters or {})
+	filters.pop("page_length", None)
+	filters.pop("start", None)
+
+	columns = get_columns()
+	rows = iter_export_rows(filters, columns)
+
+	export_file = tempfile.TemporaryFile()
+	if file_format == "CSV":
+		write_csv(export_file, columns, rows)
+	else:
+		write_xlsx(export_file, columns, rows)
+
+	content_length = export_file.tell()
+	export_file.seek(0)
+
+	extension, mimetype = EXPORT_FORMATS[file_format]
+	response = Response(
+		wrap_file(frappe.local.request.environ, export_file),
+		mimetype=mimetype,
+		direct_passthrough=True
+	)
+	response.headers["Content-Length"] = str(content_length)
+	response.headers["Content-Disposition"] = (
+		f'attachment; filename="sales_commission_{filters.get("from_date") or ""}_{filters.get("to_date") or ""}.{extension}"'
+	)
+
+	return response
+
+
+def iter_export_rows(filters, columns):
+	"""
+	Yield report rows as lists in column order from an unbuffered cursor
+
+	Args:
+		filters (dict): Report filters (without paging)
+		columns (list): Report columns
+
+	Yields:
+		list: Row values in column order
+	"""
+	query, params = get_query(filters)
+	fieldnames = [column["fieldname"] for column in columns]
+
+	with frappe.db.unbuffered_cursor():
+		for row in frappe.db.sql(query, params, as_dict=True, as_iterator=True):
+			yield [row.get(fieldname) for fieldname in fieldnames]
+
+
+def write_csv(export_file, columns, rows):
+	"""
+	Write rows to a binary file as UTF-8 CSV (with BOM for Excel)
+
+	Args:
+		export_file: Binary file object
+		columns (list): Report columns (labels are the header)
+		rows: Iterable of row value lists
+	"""
+	text_file = io.TextIOWrapper(export_file, encoding="utf-8-sig", newline="")
+	writer = csv.writer(text_file)
+	writer.writerow([column["label"] for column in columns])
+	for row in rows:
+		writer.writerow(row)
+
+	text_file.flush()
+	text_file.detach()
+
+
+def write_xlsx(export_file, columns, rows):
+	"""
+	Write rows to a binary file as XLSX with a write-only (streaming) workbook
+
+	Args:
+		export_file: Binary file object
+		columns (list): Report columns (labels are the header)
+		rows: Iterable of row value lists
+	"""
+	from openpyxl import Workbook
+
+	workbook = Workbook(write_only=True)
+	worksheet = workbook.create_sheet("sales_commission")
+	worksheet.append([column["label"] for column in columns])
+	for row in rows:
+		worksheet.append(row)
+
+	workbook.save(export_file)
@@ -0,0 +1,355 @@
+"""
+Sales Commission Report Cache
+Cache sales_commission results in Redis, keyed by normalized filters
+
+Managers open the same month many times a day; repeated views are served
+from frappe.cache instead of running the aggregate query again.
+
+Keys:
+- "<prefix>:<sha1 of normalized filters>" -> report rows
+- Index hash per company ("<index prefix>:<company>", ALL_COMPANIES for
+  reports without a company filter): {cache key: [from_date, to_date]}
+
+Invalidation:
+- Every contribution ledger write (Payment Entry submit, cancel,
+  recalculation) registers the changed (company, invoice posting date)
+  pairs; after the commit only entries whose company and date range cover
+  one of them are deleted
+- A per-company generation counter is bumped on invalidation, so a report
+  computed while the data changed is not stored
+- Entries expire after REPORT_CACHE_TTL as a safety net; bench clear-cache
+  drops everything
+
+Hit / miss counters are kept in Redis; get_report_cache_stats() returns them.
+
+Structure:
+1. Key Functions
+2. Lookup Functions
+3. Invalidation Functions
+4. Statistics Functions
+"""
+
+import hashlib
+import json
+
+import frappe
+from frappe.utils import cint, getdate
+
+# Redis key prefix of cached results
+REPORT_CACHE_KEY = "sales_person_net_contribution:sales_commission"
+
+# Redis hash prefix of the per-company index
+REPORT_CACHE_INDEX_KEY = "sales_person_net_contribution:sales_commission_index"
+
+# Redis counter prefix of the per-company generation
+REPORT_CACHE_GENERATION_KEY = "sales_person_net_contribution:sales_commission_generation"
+
+# Redis counters prefix ("<prefix>:<counter>")
+REPORT_CACHE_STATS_KEY = "sales_person_net_contribution:sales_commission_stats"
+
+REPORT_CACHE_COUNTERS = ("hits", "misses", "invalidations")
+
+# Index of reports without a company filter (invalidated for every company)
+ALL_COMPANIES = "__all__"
+
+# Filters that change the result (anything else is ignored in the key)
+REPORT_CACHE_FILTERS = ("from_date", "to_date", "company", "customer", "sales_person",
+                        "page_length", "start")
+
+# Seconds a cached result is kept at most
+REPORT_CACHE_TTL = 6 * 60 * 60
+
+
+# ============================================================================
+# SECTION 1: KEY FUNCTIONS
+# ============================================================================
+
+def normalize_filters(filters):
+    """
+    Normalize report filters so equivalent filters share a cache entry
+
+    Dates become ISO strings, paging becomes integers and empty values are
+    dropped.
+
+    Args:
+        filters (dict): Report filters
+
+    Returns:
+        dict: Normalized filters (only REPORT_CACHE_FILTERS)
+    """
+    normalized = {}
+    for fieldname in REPORT_CACHE_FILTERS:
+        value = filters.get(fieldname)
+        if not value:
+            continue
+
+        if fieldname in ("from_date", "to_date"):
+            value = str(getdate(value))
+        elif fieldname in ("page_length", "start"):
+            value = cint(value)
+            if not value:
+                continue
+        else:
+            value = str(value)
+
+        normalized[fieldname] = value
+
+    return normalized
+
+
+def get_cache_key(normalized_filters):
+    """
+    Build the cache key of normalized filters
+
+    Args:
+        normalized_filters (dict): See normalize_filters
+
+    Returns:
+        str: "<prefix>:<sha1>"
+    """
+    digest = hashlib.sha1(
+        json.dumps(normalized_filters, sort_keys=True).encode()).hexdigest()
+    return f"{REPORT_CACHE_KEY}:{digest}"
+
+
+def get_index_key(company):
+    """
+    Build the index hash name of a company
+
+    Args:
+        company (str): Company or ALL_COMPANIES
+
+    Returns:
+        str: "<index prefix>:<company>"
+    """
+    return f"{REPORT_CACHE_INDEX_KEY}:{company}"
+
+
+def get_generation_key(company):
+    """
+    Build the generation counter key of a company (with site prefix)
+
+    Args:
+        company (str): Company or ALL_COMPANIES
+
+    Returns:
+        str: Redis key
+    """
+    return frappe.cache.make_key(f"{REPORT_CACHE_GENERATION_KEY}:{company}")
+
+
+def get_generation(company):
+    """
+    Get the generation counter of a company
+
+    Reports without a company filter depend on every company, so they use
+    the ALL_COMPANIES counter, which is bumped on every invalidation.
+
+    Args:
+        company (str): Company or ALL_COMPANIES
+
+    Returns:
+        int: Generation (0 when never invalidated)
+    """
+    return cint(frappe.cache.get(get_generation_key(company)))
+
+
+# ============================================================================
+# SECTION 2: LOOKUP FUNCTIONS
+# ============================================================================
+
+def get_cached_report(filters, compute):
+    """
+    Get report rows from the cache or compute and store them
+
+    Args:
+        filters (dict): Report filters
+        compute: Function (filters) -> list of rows
+
+    Returns:
+        list: Report rows
+    """
+    normalized_filters = normalize_filters(filters)
+    cache_key = get_cache_key(normalized_filters)
+    company = normalized_filters.get("company") or ALL_COMPANIES
+
+    try:
+        data = frappe.cache.get_value(cache_key)
+        if data is not None:
+            increment_counter("hits")
+            return data
+
+        generation = get_generation(company)
+    except Exception:
+        # Cache is an optimization only; run the report
+        frappe.log_error(frappe.get_traceback(), "Sales commission cache lookup failed")
+        return compute(filters)
+
+    increment_counter("misses")
+    data = compute(filters)
+
+    try:
+        # Data changed while the report ran: do not store a stale result
+        if get_generation(company) == generation:
+            frappe.cache.set_value(cache_key, data, expires_in_sec=REPORT_CACHE_TTL)
+            frappe.cache.hset(get_index_key(company), cache_key, [
+                normalized_filters.get("from_date"), normalized_filters.get("to_date")])
+    except Exception:
+        frappe.log_error(frappe.get_traceback(), "Sales commission cache store failed")
+
+    return data
+
+
+# ============================================================================
+# SECTION 3: INVALIDATION FUNCTIONS
+# ============================================================================
+
+def is_date_in_range(posting_date, date_range):
+    """
+    Check if a date is inside a cached filter range (open ends match everything)
+
+    Args:
+        posting_date (str): ISO date
+        date_range (list): [from_date, to_date] (ISO strings or None)
+
+    Returns:
+        bool: True if the cached result may contain the date
+    """
+    from_date, to_date = date_range or (None, None)
+    return (not from_date or from_date <= posting_date) and (not to_date or posting_date <= to_date)
+
+
+def invalidate_report_cache(changes):
+    """
+    Delete cached results covering changed (company, invoice posting date) pairs
+
+    Args:
+        changes: Iterable of (company, posting_date)
+    """
+    dates_by_company = {}
+    for company, posting_date in changes:
+        if company and posting_date:
+            dates_by_company.setdefault(company, set()).add(str(getdate(posting_date)))
+
+    if not dates_by_company:
+        return
+
+    all_dates = set().union(*dates_by_company.values())
+    for company, dates in [*dates_by_company.items(), (ALL_COMPANIES, all_dates)]:
+        frappe.cache.incr(get_generation_key(company))
+
+        index_key = get_index_key(company)
+        for cache_key, date_range in (frappe.cache.hgetall(index_key) or {}).items():
+            cache_key = frappe.safe_decode(cache_key)
+            if any(is_date_in_range(posting_date, date_range) for posting_date in dates):
+                frappe.cache.delete_value(cache_key)
+                frappe.cache.hdel(index_key, cache_key)
+                increment_counter("invalidations")
+
+
+def invalidate_report_cache_after_commit(changes):
+    """
+    Queue changed (company, invoice posting date) pairs for invalidation after commit
+
+    Invalidating before the commit would let a concurrent report cache the
+    old data again. Pairs of one transaction are collected and handled by one
+    after-commit callback. A rollback drops that callback, so it also drops
+    the collected pairs and the next write registers a new callback.
+
+    Args:
+        changes: Iterable of (company, posting_date)
+    """
+    pending = frappe.flags.sales_commission_cache_changes
+    if pending is None:
+        pending = frappe.flags.sales_commission_cache_changes = set()
+        frappe.db.after_commit.add(flush_report_cache_invalidations)
+        frappe.db.after_rollback.add(discard_report_cache_invalidations)
+
+    pending.update((company, str(getdate(posting_date)))
+                   for company, posting_date in changes if company and posting_date)
+
+
+def flush_report_cache_invalidations():
+    """
+    After-commit callback: invalidate the pairs collected in this transaction
+    """
+    changes = frappe.flags.sales_commission_cache_changes or set()
+    frappe.flags.sales_commission_cache_changes = None
+
+    try:
+        invalidate_report_cache(changes)
+    except Exception:
+        frappe.log_error(frappe.get_traceback(), "Sales commission cache invalidation failed")
+
+
+def discard_report_cache_invalidations():
+    """
+    After-rollback callback: forget the pairs of the rolled back transaction
+    """
+    frappe.flags.sales_commission_cache_changes = None
+
+
+def on_sales_invoice_update_after_submit(doc, method=None):
+    """
+    Hook: Sales Invoice on_update_after_submit (report shows invoice header fields)
+    """
+    invalidate_report_cache_after_commit([(doc.company, doc.posting_date)])
+
+
+def clear_report_cache():
+    """
+    Clear all cached results (hook: clear_cache, e.g. bench clear-cache)
+    """
+    frappe.cache.delete_keys(f"{REPORT_CACHE_KEY}:")
+    frappe.cache.delete_keys(f"{REPORT_CACHE_INDEX_KEY}:")
+
+
+# ============================================================================
+# SECTION 4: STATISTICS FUNCTIONS
+# ============================================================================
+
+def get_counter_key(counter):
+    """
+    Build the Redis key of a hit / miss counter
+
+    Args:
+        counter: Counter name (see REPORT_CACHE_COUNTERS)
+
+    Returns:
+        str: Redis key with site prefix
+    """
+    return frappe.cache.make_key(f"{REPORT_CACHE_STATS_KEY}:{counter}")
+
+
+def increment_counter(counter):
+    """
+    Increment a hit / miss counter (never fails the report)
+
+    Args:
+        counter: Counter name (see REPORT_CACHE_COUNTERS)
+    """
+    try:
+        frappe.cache.incr(get_counter_key(counter))
+    except Exception:
+        pass
+
+
+@frappe.whitelist()
+def get_report_cache_stats():
+    """
+    Get sales_commission cache hit / miss counters
+
+    Returns:
+        dict: {"hits", "misses", "invalidations", "hit_rate"}
+    """
+    frappe.only_for("System Manager")
+
+    stats = {
+        counter: cint(frappe.cache.get(get_counter_key(counter)))
+        for counter in REPORT_CACHE_COUNTERS
+    }
+
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0
+
+    return stats
@@ -0,0 +1,370 @@
+"""
+Sales Team Resolution Cache
+Cache the fallback Sales Team of Sales Orders and Customers
+
+The same customers come up in thousands of receipts, so the Sales Team
+resolved for a Sales Order / Customer is cached in two levels:
+1. Local in-process LRU (no network round trip)
+2. frappe.cache (Redis hash shared by all workers)
+
+The local LRU, its generation and the pending counters are kept per site
+(frappe.local.site): a worker of a multi-site bench serves several sites
+whose documents can share names.
+
+Invalidation:
+- on_update / on_trash of Sales Order and Customer queue the changed parent;
+  after the commit its Redis entry is deleted and a generation counter is
+  bumped (deleting before the commit would let a concurrent receipt store
+  the old Sales Team again)
+- A resolved Sales Team is not stored when the generation changed while it
+  was read from the database
+- Each process compares its local LRU with the generation counter at most once
+  every LOCAL_CACHE_CHECK_INTERVAL seconds and drops it when it changed
+
+Hit / miss counters are accumulated locally and flushed to Redis (INCRBY) on
+the same interval; get_sales_team_cache_stats() returns them.
+
+Structure:
+1. Local Cache Functions
+2. Lookup Functions
+3. Invalidation Functions
+4. Statistics Functions
+"""
+
+import time
+from collections import OrderedDict
+
+import frappe
+
+# Redis hash holding {"<doctype>::<name>": sales_team}
+SALES_TEAM_CACHE_KEY = "sales_person_net_contribution:sales_team"
+
+# Redis counter bumped on every invalidation
+SALES_TEAM_CACHE_GENERATION_KEY = "sales_person_net_contribution:sales_team_generation"
+
+# Redis counters prefix ("<prefix>:<counter>")
+SALES_TEAM_CACHE_STATS_KEY = "sales_person_net_contribution:sales_team_stats"
+
+SALES_TEAM_CACHE_COUNTERS = ("local_hits", "redis_hits", "misses", "invalidations")
+
+# DocTypes whose Sales Team is used as fallback
+CACHED_PARENT_DOCTYPES = ("Sales Order", "Customer")
+
+# Maximum number of entries kept in the local LRU
+LOCAL_CACHE_SIZE = 4096
+
+# Seconds between generation checks / counter flushes
+LOCAL_CACHE_CHECK_INTERVAL = 5
+
+# {site: {"cache": OrderedDict, "generation", "checked_at", "counters"}}
+_site_caches = {}
+
+
+# ============================================================================
+# SECTION 1: LOCAL CACHE FUNCTIONS
+# ============================================================================
+
+def get_site_cache():
+    """
+    Get the local LRU state of the current site (created on first use)
+
+    Returns:
+        dict: {"cache": OrderedDict, "generation": int | None, "checked_at": float,
+               "counters": {counter: pending count}}
+    """
+    site = frappe.local.site
+    site_cache = _site_caches.get(site)
+    if site_cache is None:
+        site_cache = _site_caches[site] = {
+            "cache": OrderedDict(),
+            "generation": None,
+            "checked_at": 0.0,
+            "counters": dict.fromkeys(SALES_TEAM_CACHE_COUNTERS, 0),
+        }
+    return site_cache
+
+
+def get_cache_field(parenttype, parent):
+    """
+    Build the cache field of a parent document
+
+    Args:
+        parenttype: Parent DocType (Sales Order, Customer)
+        parent: Parent document name
+
+    Returns:
+        str: "<parenttype>::<parent>"
+    """
+    return f"{parenttype}::{parent}"
+
+
+def get_generation():
+    """
+    Get the current invalidation generation from Redis
+
+    Returns:
+        int: Generation counter (0 when never invalidated)
+    """
+    generation = frappe.cache.get(frappe.cache.make_key(SALES_TEAM_CACHE_GENERATION_KEY))
+    return int(generation or 0)
+
+
+def sync_local_cache():
+    """
+    Drop the local LRU when another process invalidated an entry
+
+    Runs at most once every LOCAL_CACHE_CHECK_INTERVAL seconds. Pending
+    hit / miss counters are flushed at the same time.
+    """
+    site_cache = get_site_cache()
+    now = time.monotonic()
+    if now - site_cache["checked_at"] < LOCAL_CACHE_CHECK_INTERVAL:
+        return
+
+    site_cache["checked_at"] = now
+    generation = get_generation()
+    if generation != site_cache["generation"]:
+        site_cache["cache"].clear()
+        site_cache["generation"] = generation
+
+    flush_cache_counters()
+
+
+def get_local(field):
+    """
+    Get an entry from the local LRU
+
+    Args:
+        field: Cache field (see get_cache_field)
+
+    Returns:
+        list | None: Cached sales team, None when not cached
+    """
+    local_cache = get_site_cache()["cache"]
+    sales_team = local_cache.get(field)
+    if sales_team is not None:
+        local_cache.move_to_end(field)
+    return sales_team
+
+
+def set_local(field, sales_team):
+    """
+    Store an entry in the local LRU, evicting the least recently used ones
+
+    Args:
+        field: Cache field (see get_cache_field)
+        sales_team: Resolved sales team (may be empty)
+    """
+    local_cache = get_site_cache()["cache"]
+    local_cache[field] = sales_team
+    local_cache.move_to_end(field)
+    while len(local_cache) > LOCAL_CACHE_SIZE:
+        local_cache.popitem(last=False)
+
+
+# ============================================================================
+# SECTION 2: LOOKUP FUNCTIONS
+# ============================================================================
+
+def get_cached_sales_team(parenttype, parent, resolve):
+    """
+    Get the resolved Sales Team of a Sales Order / Customer through the cache
+
+    Lookup order: local LRU -> Redis -> resolve(parenttype, parent).
+    Empty sales teams are cached too, so parents without a Sales Team are not
+    queried again.
+
+    Args:
+        parenttype: Parent DocType (Sales Order, Customer)
+        parent: Parent document name
+        resolve: Function (parenttype, parent) -> list of sales team members
+
+    Returns:
+        list: List of sales team members with their details
+    """
+    field = get_cache_field(parenttype, parent)
+
+    try:
+        sync_local_cache()
+        counters = get_site_cache()["counters"]
+
+        sales_team = get_local(field)
+        if sales_team is not None:
+            counters["local_hits"] += 1
+            return list(sales_team)
+
+        sales_team = frappe.cache.hget(SALES_TEAM_CACHE_KEY, field)
+        if sales_team is not None:
+            counters["redis_hits"] += 1
+            set_local(field, sales_team)
+            return list(sales_team)
+
+        generation = get_generation()
+    except Exception:
+        # Cache is an optimization only; resolve from the database
+        frappe.log_error(frappe.get_traceback(), "Sales Team cache lookup failed")
+        return resolve(parenttype, parent)
+
+    counters["misses"] += 1
+    sales_team = resolve(parenttype, parent)
+
+    try:
+        # Invalidated while resolving: the result may be the old Sales Team
+        if get_generation() == generation:
+            frappe.cache.hset(SALES_TEAM_CACHE_KEY, field, sales_team)
+            set_local(field, list(sales_team))
+    except Exception:
+        frappe.log_error(frappe.get_traceback(), "Sales Team cache store failed")
+
+    return sales_team
+
+
+# ============================================================================
+# SECTION 3: INVALIDATION FUNCTIONS
+# ============================================================================
+
+def invalidate_sales_team_cache(fields):
+    """
+    Remove parent documents from the cache (all processes)
+
+    Args:
+        fields: Cache fields (see get_cache_field)
+    """
+    if not fields:
+        return
+
+    site_cache = get_site_cache()
+    for field in fields:
+        frappe.cache.hdel(SALES_TEAM_CACHE_KEY, field)
+        site_cache["cache"].pop(field, None)
+        site_cache["counters"]["invalidations"] += 1
+    bump_generation()
+
+
+def invalidate_sales_team_cache_after_commit(parenttype, parent):
+    """
+    Queue a parent document for invalidation after commit
+
+    Parents changed in one transaction are collected and handled by one
+    after-commit callback; a rollback discards them.
+
+    Args:
+        parenttype: Parent DocType (Sales Order, Customer)
+        parent: Parent document name
+    """
+    pending = frappe.flags.sales_team_cache_changes
+    if pending is None:
+        pending = frappe.flags.sales_team_cache_changes = set()
+        frappe.db.after_commit.add(flush_sales_team_invalidations)
+        frappe.db.after_rollback.add(discard_sales_team_invalidations)
+
+    pending.add(get_cache_field(parenttype, parent))
+
+
+def flush_sales_team_invalidations():
+    """
+    After-commit callback: invalidate the parents collected in this transaction
+    """
+    fields = frappe.flags.sales_team_cache_changes or set()
+    frappe.flags.sales_team_cache_changes = None
+
+    try:
+        invalidate_sales_team_cache(sorted(fields))
+    except Exception:
+        frappe.log_error(frappe.get_traceback(), "Sales Team cache invalidation failed")
+
+
+def discard_sales_team_invalidations():
+    """
+    After-rollback callback: forget the parents of the rolled back transaction
+    """
+    frappe.flags.sales_team_cache_changes = None
+
+
+def bump_generation():
+    """
+    Increase the generation counter so other processes drop their local LRU
+
+    The local LRU of this process is kept only when no other process
+    invalidated anything since it was last synced.
+    """
+    site_cache = get_site_cache()
+    generation = frappe.cache.incr(frappe.cache.make_key(SALES_TEAM_CACHE_GENERATION_KEY))
+    if site_cache["generation"] != generation - 1:
+        site_cache["cache"].clear()
+    site_cache["generation"] = generation
+
+
+def on_sales_team_parent_update(doc, method=None):
+    """
+    Hook: Sales Order / Customer on_update, on_update_after_submit and on_trash
+
+    Args:
+        doc: Sales Order or Customer document
+        method: Hook method name
+    """
+    if doc.doctype in CACHED_PARENT_DOCTYPES:
+        invalidate_sales_team_cache_after_commit(doc.doctype, doc.name)
+
+
+def clear_sales_team_cache():
+    """
+    Clear the whole Sales Team cache (hook: clear_cache, e.g. bench clear-cache)
+    """
+    frappe.cache.delete_value(SALES_TEAM_CACHE_KEY)
+    get_site_cache()["cache"].clear()
+    bump_generation()
+
+
+# ============================================================================
+# SECTION 4: STATISTICS FUNCTIONS
+# ============================================================================
+
+def get_counter_key(counter):
+    """
+    Build the Redis key of a hit / miss counter
+
+    Args:
+        counter: Counter name (see SALES_TEAM_CACHE_COUNTERS)
+
+    Returns:
+        str: Redis key with site prefix
+    """
+    return frappe.cache.make_key(f"{SALES_TEAM_CACHE_STATS_KEY}:{counter}")
+
+
+def flush_cache_counters():
+    """
+    Add locally accumulated counters of the current site to its Redis counters
+    """
+    counters = get_site_cache()["counters"]
+    for counter, value in counters.items():
+        if value:
+            frappe.cache.incrby(get_counter_key(counter), value)
+            counters[counter] = 0
+
+
+@frappe.whitelist()
+def get_sales_team_cache_stats():
+    """
+    Get Sales Team cache hit / miss counters of all processes
+
+    Returns:
+        dict: {"local_hits", "redis_hits", "misses", "invalidations",
+               "hit_rate", "local_entries"}
+    """
+    frappe.only_for("System Manager")
+
+    flush_cache_counters()
+
+    stats = {
+        counter: int(frappe.cache.get(get_counter_key(counter)) or 0)
+        for counter in SALES_TEAM_CACHE_COUNTERS
+    }
+
+    lookups = stats["local_hits"] + stats["redis_hits"] + stats["misses"]
+    stats["hit_rate"] = round(
+        (stats["local_hits"] + stats["redis_hits"]) / lookups, 4) if lookups else 0
+    stats["local_entries"] = len(get_site_cache()["cache"])
+
+    return stats
@@ -0,0 +1,81 @@
+"""
+Tests for the background submit of Payment Entries
+A submit that arrives while the job of its chain finishes must still be processed
+
+    bench --site <site> run-tests --module \
+        sales_person_net_contribution.sales_person_net_contribution.test_async_submit
+"""
+
+import unittest
+from unittest.mock import patch
+
+import frappe
+
+from sales_person_net_contribution.sales_person_net_contribution import payment_entry
+
+ROOT_NAME = "ACC-PAY-TEST-ASYNC"
+
+
+class TestAsyncSubmit(unittest.TestCase):
+    def setUp(self):
+        self.calculated = []
+        frappe.cache.delete(payment_entry.get_async_submit_key(ROOT_NAME))
+        frappe.cache.delete(payment_entry.get_async_submit_lock_key(ROOT_NAME))
+
+    def tearDown(self):
+        frappe.cache.delete(payment_entry.get_async_submit_key(ROOT_NAME))
+        frappe.cache.delete(payment_entry.get_async_submit_lock_key(ROOT_NAME))
+
+    def submit(self, payment_entry_name):
+        """What queue_submitted_payment_entry does, with the job run right away"""
+        frappe.cache.set(payment_entry.get_async_submit_key(ROOT_NAME), payment_entry_name)
+        payment_entry.process_submitted_payment_entry(ROOT_NAME)
+
+    def run_job(self, clear_latest_submitted):
+        with patch.object(payment_entry, "calculate_submitted_payment_entry",
+                          side_effect=self.calculated.append), \
+                patch.object(payment_entry, "clear_latest_submitted",
+                             side_effect=clear_latest_submitted):
+            self.submit(f"{ROOT_NAME}-1")
+
+    def test_single_submit(self):
+        self.run_job(payment_entry.clear_latest_submitted)
+
+        self.assertEqual(self.calculated, [f"{ROOT_NAME}-1"])
+        self.assertIsNone(payment_entry.get_latest_submitted(ROOT_NAME))
+
+    def test_submit_during_final_check(self):
+        original_clear = payment_entry.clear_latest_submitted
+        amended = []
+
+        def clear_then_amend(root_name, processed_name):
+            cleared = original_clear(root_name, processed_name)
+            if not amended:
+                # New amendment right after the final check; its job starts while
+                # the first one still holds the lock and exits at once
+                amended.append(True)
+                self.submit(f"{ROOT_NAME}-1-1")
+                self.assertEqual(self.calculated, [f"{ROOT_NAME}-1"])
+            return cleared
+
+        self.run_job(clear_then_amend)
+
+        self.assertEqual(self.calculated, [f"{ROOT_NAME}-1", f"{ROOT_NAME}-1-1"])
+        self.assertIsNone(payment_entry.get_latest_submitted(ROOT_NAME))
+        self.assertFalse(frappe.cache.get(payment_entry.get_async_submit_lock_key(ROOT_NAME)))
+
+    def test_submit_before_final_check(self):
+        original_clear = payment_entry.clear_latest_submitted
+        amended = []
+
+        def amend_then_clear(root_name, processed_name):
+            if not amended:
+                amended.append(True)
+                frappe.cache.set(payment_entry.get_async_submit_key(ROOT_NAME), f"{ROOT_NAME}-1-1")
+            return original_clear(root_name, processed_name)
+
+        self.run_job(amend_then_clear)
+
+        # The compare-and-delete keeps the new amendment, the same job processes it
+        self.assertEqual(self.calculated, [f"{ROOT_NAME}-1", f"{ROOT_NAME}-1-1"])
+        self.assertIsNone(payment_entry.get_latest_submitted(ROOT_NAME))
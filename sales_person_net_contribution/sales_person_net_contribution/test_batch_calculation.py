@@ -0,0 +1,196 @@
+"""
+Tests for Batch Incentive Recalculation
+The vectorized NumPy path must give the same results as the scalar
+contribution_engine path, row by row
+
+    bench --site <site> run-tests --module \
+        sales_person_net_contribution.sales_person_net_contribution.test_batch_calculation
+
+Structure:
+1. Helpers
+2. Tests
+"""
+
+import unittest
+
+from sales_person_net_contribution.sales_person_net_contribution.batch_calculation import (
+    BatchColumns,
+    compute_batch_incentives,
+    compute_batch_incentives_scalar,
+    np,
+)
+from sales_person_net_contribution.sales_person_net_contribution.contribution_engine import (
+    SalesTeamMember,
+)
+
+
+# ============================================================================
+# SECTION 1: HELPERS
+# ============================================================================
+
+def make_columns(payment_entries, invoices, references):
+    """
+    Build BatchColumns from plain tuples
+
+    Args:
+        payment_entries: List of (name, total_paid, total_deductions)
+        invoices: List of (name, grand_total, taxes, [(sales_person, rate)])
+        references: List of (payment_entry, invoice, allocated_amount)
+
+    Returns:
+        BatchColumns: Chunk with one reference row per reference tuple
+    """
+    columns = BatchColumns()
+    pe_index = {}
+    invoice_index = {}
+
+    for name, total_paid, total_deductions in payment_entries:
+        pe_index[name] = len(columns.payment_entries)
+        columns.payment_entries.append(name)
+        columns.pe_posting_date.append(None)
+        columns.pe_total_paid.append(total_paid)
+        columns.pe_total_deductions.append(total_deductions)
+
+    for name, grand_total, taxes, members in invoices:
+        invoice_index[name] = len(columns.invoices)
+        columns.invoices.append(name)
+        columns.invoice_grand_total.append(grand_total)
+        columns.invoice_taxes.append(taxes)
+        columns.invoice_members.append([
+            SalesTeamMember(sales_person=sales_person, commission_rate=rate,
+                            allocated_percentage=100.0)
+            for sales_person, rate in members
+        ])
+
+    for row, (payment_entry, invoice, allocated_amount) in enumerate(references):
+        columns.ref_name.append(f"REF-{row:03d}")
+        columns.ref_pe.append(pe_index[payment_entry])
+        columns.ref_invoice.append(invoice_index[invoice])
+        columns.ref_allocated.append(allocated_amount)
+
+    return columns
+
+
+# ============================================================================
+# SECTION 2: TESTS
+# ============================================================================
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class TestBatchCalculation(unittest.TestCase):
+    def assert_same_results(self, columns):
+        """Compare the vectorized and the scalar results row by row"""
+        vectorized = compute_batch_incentives(columns)
+        scalar = compute_batch_incentives_scalar(columns)
+
+        self.assertEqual(len(vectorized.pairs), len(scalar.pairs))
+        for vector_pair, scalar_pair in zip(vectorized.pairs, scalar.pairs):
+            pe_idx, invoice_idx, allocated, net_after, incentives = vector_pair
+            with self.subTest(pair=(columns.payment_entries[pe_idx], columns.invoices[invoice_idx])):
+                self.assertEqual((pe_idx, invoice_idx), scalar_pair[:2])
+                self.assertAlmostEqual(allocated, scalar_pair[2], places=9)
+                self.assertAlmostEqual(net_after, scalar_pair[3], places=9)
+                # Rounded values must match exactly
+                self.assertEqual(incentives, scalar_pair[4])
+
+        self.assertEqual(len(vectorized.references), len(scalar.references))
+        for vector_row, scalar_row in zip(vectorized.references, scalar.references):
+            with self.subTest(reference=columns.ref_name[vector_row[0]]):
+                self.assertEqual(vector_row, scalar_row)
+
+        return vectorized
+
+    def test_multiple_invoices_with_deductions(self):
+        columns = make_columns(
+            [("PE-1", 1500.0, 45.0), ("PE-2", 800.0, 0.0)],
+            [
+                ("SINV-1", 1150.0, 150.0, [("Alice", 5.0), ("Bob", 2.5)]),
+                ("SINV-2", 575.0, 75.0, [("Carol", 10.0)]),
+                ("SINV-3", 800.0, 0.0, []),
+            ],
+            [
+                ("PE-1", "SINV-1", 700.0),
+                ("PE-1", "SINV-1", 300.0),
+                ("PE-1", "SINV-2", 500.0),
+                ("PE-2", "SINV-3", 800.0),
+            ]
+        )
+
+        results = self.assert_same_results(columns)
+        # The invoice without Sales Team has a pair but no reference rows
+        self.assertEqual(len(results.pairs), 3)
+        self.assertEqual([row[0] for row in results.references], [0, 1, 2])
+
+    def test_negative_totals_and_returns(self):
+        columns = make_columns(
+            [("PE-RET", -600.0, 12.0), ("PE-MIX", 200.0, 0.0)],
+            [
+                ("SINV-RET", -690.0, -90.0, [("Alice", 5.0)]),
+                ("SINV-4", 345.0, 45.0, [("Bob", 3.0)]),
+            ],
+            [
+                # Negative invoice total with rows of mixed sign: equal split
+                ("PE-RET", "SINV-RET", -400.0),
+                ("PE-RET", "SINV-RET", -250.0),
+                ("PE-RET", "SINV-RET", 50.0),
+                ("PE-MIX", "SINV-4", 345.0),
+                ("PE-MIX", "SINV-RET", -145.0),
+            ]
+        )
+
+        self.assert_same_results(columns)
+
+    def test_zero_total_allocated(self):
+        columns = make_columns(
+            [("PE-ZERO", 0.0, 30.0), ("PE-NET", 0.0, 0.0)],
+            [
+                ("SINV-5", 230.0, 30.0, [("Alice", 5.0)]),
+                ("SINV-6", 115.0, 15.0, [("Bob", 7.5)]),
+            ],
+            [
+                # total_paid 0: deductions are split equally over the invoices
+                ("PE-ZERO", "SINV-5", 230.0),
+                ("PE-ZERO", "SINV-6", 115.0),
+                # Rows cancelling out: the pair is calculated, its rows are not updated
+                ("PE-NET", "SINV-5", 100.0),
+                ("PE-NET", "SINV-5", -100.0),
+            ]
+        )
+
+        results = self.assert_same_results(columns)
+        self.assertEqual([row[0] for row in results.references], [0, 1])
+
+    def test_decimal_and_percentage_rates(self):
+        columns = make_columns(
+            [("PE-RATE", 2000.0, 0.0)],
+            [
+                # Rates up to 1 are decimals, greater rates are percentages
+                ("SINV-7", 1000.0, 0.0, [("Alice", 0.05), ("Bob", 1.0), ("Carol", 1.5)]),
+                ("SINV-8", 1000.0, 0.0, [("Dave", 5.0), ("Erin", 0.0)]),
+            ],
+            [("PE-RATE", "SINV-7", 1000.0), ("PE-RATE", "SINV-8", 1000.0)]
+        )
+
+        results = self.assert_same_results(columns)
+        self.assertEqual(results.pairs[0][4], [50.0, 1000.0, 15.0])
+        self.assertEqual(results.pairs[1][4], [50.0, 0.0])
+
+    def test_exact_halves(self):
+        columns = make_columns(
+            [("PE-HALF", 12.695, 0.0)],
+            [
+                ("SINV-9", 2.675, 0.0, [("Alice", 50.0)]),
+                ("SINV-10", 10.01, 0.0, [("Bob", 0.5)]),
+                ("SINV-11", 0.01, 0.0, [("Carol", 50.0)]),
+            ],
+            [
+                ("PE-HALF", "SINV-9", 2.675),
+                ("PE-HALF", "SINV-10", 10.01),
+                ("PE-HALF", "SINV-11", 0.01),
+            ]
+        )
+
+        results = self.assert_same_results(columns)
+        # 1.3375 -> 1.34, 5.005 -> 5.01, 0.005 -> 0.01 (halves round up)
+        self.assertEqual([pair[4] for pair in results.pairs], [[1.34], [5.01], [0.01]])
+        # 2.675 is 2.67499999... as a float and still rounds to 2.68
+        self.assertEqual(results.references[0][2], 2.68)
@@ -0,0 +1,159 @@
+"""
+Tests for the Contribution Engine
+Rounding, deduction distribution, reference rows and a full Payment Entry
+checked against the numbers of the original per-document calculation
+
+    bench --site <site> run-tests --module \
+        sales_person_net_contribution.sales_person_net_contribution.test_contribution_engine
+
+Structure:
+1. Numeric Helper Tests
+2. Distribution Tests
+3. Payment Entry Tests
+"""
+
+import unittest
+
+from sales_person_net_contribution.sales_person_net_contribution.contribution_engine import (
+    InvoiceInput,
+    PaymentInput,
+    ReferenceInput,
+    SalesTeamMember,
+    calculate_contribution,
+    calculate_reference_results,
+    distribute_deductions,
+    round_amount,
+)
+
+
+# ============================================================================
+# SECTION 1: NUMERIC HELPER TESTS
+# ============================================================================
+
+class TestRoundAmount(unittest.TestCase):
+    # Exact halves, float noise around halves and plain values
+    VALUES = (
+        0.005, 0.015, 0.125, 1.005, 2.675, 5.005, 10.235, 1234.565,
+        -0.005, -2.675, -1.005, 0.1 + 0.2, 1.1 * 3, 4.35 * 100 / 100,
+        8.345000000001, 8.344999999999, 0.0, 100.0, "1,234.565", None, "",
+    )
+
+    def test_matches_flt(self):
+        from frappe.utils import flt
+
+        for precision in (2, 3):
+            for value in self.VALUES:
+                with self.subTest(value=value, precision=precision):
+                    self.assertEqual(round_amount(value, precision), flt(value, precision))
+
+    def test_halves_round_up(self):
+        self.assertEqual(round_amount(0.005), 0.01)
+        self.assertEqual(round_amount(2.675), 2.68)
+        self.assertEqual(round_amount(1.005), 1.01)
+        self.assertEqual(round_amount(0.1 + 0.2), 0.3)
+
+
+# ============================================================================
+# SECTION 2: DISTRIBUTION TESTS
+# ============================================================================
+
+class TestDistribution(unittest.TestCase):
+    def test_proportional_deductions(self):
+        self.assertEqual(
+            distribute_deductions({"SINV-1": 300.0, "SINV-2": 100.0}, 40.0, 400.0),
+            {"SINV-1": 30.0, "SINV-2": 10.0})
+
+    def test_equal_deductions_without_total_paid(self):
+        for total_paid in (0.0, -250.0):
+            with self.subTest(total_paid=total_paid):
+                self.assertEqual(
+                    distribute_deductions({"SINV-1": 300.0, "SINV-2": -50.0}, 40.0, total_paid),
+                    {"SINV-1": 20.0, "SINV-2": 20.0})
+
+        self.assertEqual(distribute_deductions({}, 40.0, 0.0), {})
+
+    def test_negative_total_split_equally(self):
+        invoice = InvoiceInput(name="SINV-RET", grand_total=-690.0, total_taxes_and_charges=-90.0)
+        references = [
+            ReferenceInput(name="REF-1", invoice_name="SINV-RET", allocated_amount=-400.0),
+            ReferenceInput(name="REF-2", invoice_name="SINV-RET", allocated_amount=100.0),
+        ]
+
+        results = calculate_reference_results(references, invoice, -300.0, 10.0)
+
+        # No tax ratio for a negative grand total; each row gets half
+        self.assertEqual(
+            [(row.name, row.tax_amount, row.net_without_tax, row.net_without_tax_without_deductions)
+             for row in results],
+            [("REF-1", 0.0, -150.0, -155.0), ("REF-2", 0.0, -150.0, -155.0)])
+
+    def test_zero_total_has_no_rows(self):
+        invoice = InvoiceInput(name="SINV-1", grand_total=100.0)
+        references = [
+            ReferenceInput(name="REF-1", invoice_name="SINV-1", allocated_amount=50.0),
+            ReferenceInput(name="REF-2", invoice_name="SINV-1", allocated_amount=-50.0),
+        ]
+
+        self.assertEqual(calculate_reference_results(references, invoice, 0.0, 0.0), [])
+
+
+# ============================================================================
+# SECTION 3: PAYMENT ENTRY TESTS
+# ============================================================================
+
+class TestCalculateContribution(unittest.TestCase):
+    def test_multiple_invoices(self):
+        payment = PaymentInput(
+            name="PE-1",
+            total_allocated_amount=1500.0,
+            deductions=[30.0, 15.0],
+            references=[
+                ReferenceInput(name="REF-1", invoice_name="SINV-1", allocated_amount=700.0),
+                ReferenceInput(name="REF-2", invoice_name="SINV-2", allocated_amount=500.0),
+                ReferenceInput(name="REF-3", invoice_name="SINV-1", allocated_amount=300.0),
+                ReferenceInput(name="REF-4", invoice_name="SINV-MISSING", allocated_amount=0.0),
+            ]
+        )
+        invoices = {
+            "SINV-1": InvoiceInput(
+                name="SINV-1", grand_total=1150.0, total_taxes_and_charges=150.0,
+                sales_team=[SalesTeamMember("Alice", 5.0, 60.0),
+                            SalesTeamMember("Bob", 0.025, 40.0)]),
+            "SINV-2": InvoiceInput(
+                name="SINV-2", grand_total=575.0, total_taxes_and_charges=75.0,
+                sales_team=[SalesTeamMember("Carol", 10.0, 100.0),
+                            SalesTeamMember("", 10.0, 0.0)]),
+        }
+
+        result = calculate_contribution(payment, invoices)
+
+        self.assertEqual(result.total_deductions, 45.0)
+        self.assertEqual(list(result.invoices), ["SINV-1", "SINV-2"])
+
+        first = result.invoices["SINV-1"]
+        self.assertEqual(
+            (first.allocated_amount, first.invoice_deduction, first.invoice_net_paid,
+             first.net_paid_after_all_deductions, first.tax_amount),
+            (1000.0, 30.0, 970.0, 820.0, 130.43))
+        self.assertEqual(
+            [(row.sales_person, row.commission_rate_decimal, row.incentives)
+             for row in first.incentives],
+            [("Alice", 0.05, 41.0), ("Bob", 0.025, 20.5)])
+
+        second = result.invoices["SINV-2"]
+        self.assertEqual(
+            (second.allocated_amount, second.invoice_deduction, second.invoice_net_paid,
+             second.net_paid_after_all_deductions, second.tax_amount),
+            (500.0, 15.0, 485.0, 410.0, 65.22))
+        self.assertEqual(
+            [(row.sales_person, row.incentives) for row in second.incentives],
+            [("Carol", 41.0)])
+
+        self.assertEqual(
+            [(row.name, row.tax_amount, row.net_without_tax, row.net_without_tax_without_deductions)
+             for row in result.references],
+            [
+                ("REF-1", 91.3, 608.7, 587.7),
+                ("REF-3", 39.13, 260.87, 251.87),
+                ("REF-2", 65.22, 434.78, 419.78),
+            ])
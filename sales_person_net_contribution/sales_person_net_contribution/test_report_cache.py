@@ -0,0 +1,40 @@
+"""
+Tests for the Sales Commission Report Cache
+Invalidations queued for after the commit must survive an earlier rollback
+
+    bench --site <site> run-tests --module \
+        sales_person_net_contribution.sales_person_net_contribution.test_report_cache
+"""
+
+import unittest
+from unittest.mock import patch
+
+import frappe
+
+from sales_person_net_contribution.sales_person_net_contribution import report_cache
+
+
+class TestReportCacheInvalidation(unittest.TestCase):
+    def setUp(self):
+        frappe.db.rollback()
+        frappe.flags.sales_commission_cache_changes = None
+
+    @patch.object(report_cache, "invalidate_report_cache")
+    def test_commit_invalidates_changes(self, invalidate):
+        report_cache.invalidate_report_cache_after_commit([("Company A", "2025-01-15")])
+        report_cache.invalidate_report_cache_after_commit([("Company A", "2025-01-20")])
+        frappe.db.commit()
+
+        invalidate.assert_called_once_with({("Company A", "2025-01-15"), ("Company A", "2025-01-20")})
+
+    @patch.object(report_cache, "invalidate_report_cache")
+    def test_write_after_rollback_is_invalidated(self, invalidate):
+        report_cache.invalidate_report_cache_after_commit([("Company A", "2025-01-15")])
+        frappe.db.rollback()
+
+        report_cache.invalidate_report_cache_after_commit([("Company B", "2025-02-01")])
+        frappe.db.commit()
+
+        # The rolled back pair is dropped, the later write is flushed
+        invalidate.assert_called_once_with({("Company B", "2025-02-01")})
+        self.assertIsNone(frappe.flags.sales_commission_cache_changes)